@@ -0,0 +1,373 @@
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+import redis
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from shop.cache import bump_catalog_version, bump_dashboard_version, get_redis
+from shop.models import DailyProductSales, Order, OrderDetail, Product, Seller
+from shop.ranking import refresh_rankings
+from shop.rollups import reconcile_sales_rollups
+from shop.stock_ledger import forget_available
+
+User = get_user_model()
+
+# Generated rows are recognisable by these, so --clear removes only them
+LOAD_DOMAIN = 'load.example.com'
+LOAD_MARKER = 'Generated by generate_load_data.'
+LOAD_THREAD_PREFIX = 'load-'
+
+FIRST_NAMES = [
+    'Amina', 'Rahim', 'Nusrat', 'Tanvir', 'Farhana', 'Imran', 'Sadia', 'Karim', 'Mitu', 'Arif',
+    'Lamia', 'Hasan', 'Rupa', 'Sohel', 'Tania', 'Jamal', 'Shila', 'Rafi', 'Mim', 'Zahid',
+]
+LAST_NAMES = [
+    'Ahmed', 'Hossain', 'Islam', 'Rahman', 'Khan', 'Chowdhury', 'Akter', 'Uddin', 'Sarkar', 'Das',
+]
+ADJECTIVES = [
+    'Organic', 'Fresh', 'Herbal', 'Classic', 'Premium', 'Gentle', 'Daily', 'Pure', 'Natural', 'Soft',
+    'Hydrating', 'Nourishing', 'Light', 'Rich', 'Mild',
+]
+NOUNS = [
+    'Rice', 'Lentils', 'Honey', 'Tea', 'Soap', 'Shampoo', 'Moisturizer', 'Serum', 'Sunscreen', 'Toner',
+    'Face Wash', 'Lip Balm', 'Oil', 'Dates', 'Ghee', 'Cleanser', 'Body Lotion', 'Face Mask',
+]
+CHAT_QUESTIONS = [
+    'Which moisturizer suits oily skin?', 'How much water should I drink today?',
+    'Can I use this serum every day?', 'What helps with dry lips?', 'Is this product halal?',
+    'When will my order arrive?', 'Do you have anything for sensitive skin?',
+]
+CHAT_REPLIES = [
+    'A light, oil-free moisturizer works best for oily skin.', 'Aim for about eight glasses spread over the day.',
+    'Yes, once a day after cleansing is fine.', 'A lip balm with natural oils helps a lot.',
+    'All of our food products are halal certified.', 'Most orders are delivered within three days.',
+    'Our gentle range is made for sensitive skin.',
+]
+
+# Relative frequencies of the number of lines in an order (1, 2, 3, ...)
+LINE_COUNT_WEIGHTS = [38, 24, 14, 9, 6, 4, 3, 2]
+QUANTITY_WEIGHTS = {1: 70, 2: 20, 3: 6, 4: 2, 5: 2}
+PAYMENT_METHOD_WEIGHTS = {'Card': 55, 'COD': 35, 'Online': 10}
+UOM_WEIGHTS = {'pcs': 60, 'pack': 15, 'box': 10, 'kg': 10, 'litre': 5}
+# Orders older than SETTLED_AFTER have left the fulfilment pipeline
+SETTLED_AFTER = timedelta(days=7)
+SETTLED_STATUS_WEIGHTS = {'Completed': 86, 'Cancelled': 14}
+RECENT_STATUS_WEIGHTS = {'Pending': 25, 'Processing': 25, 'Shipped': 20, 'Completed': 20, 'Cancelled': 10}
+
+
+def weighted(weights):
+    """
+    (values, cumulative weights) for ``random.choices``.
+    """
+    if isinstance(weights, dict):
+        values, weights = list(weights), list(weights.values())
+    else:
+        values = list(range(1, len(weights) + 1))
+    return values, list(accumulate(weights))
+
+
+def zipf_weights(count, exponent):
+    # A few items take most of the traffic, like real bestsellers and
+    # repeat customers
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def delete_rows(queryset):
+    """
+    DELETE the rows of ``queryset`` in one statement, without loading them
+    or sending their delete signals. Returns how many were deleted.
+    """
+    connection = connections[queryset.db]
+    meta = queryset.model._meta
+    try:
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        # e.g. pk__in=[] when nothing was generated
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(meta.db_table)} "
+            f"WHERE {connection.ops.quote_name(meta.pk.column)} IN ({sql})",
+            params,
+        )
+        return cursor.rowcount
+
+
+@contextmanager
+def historic_timestamps(*models):
+    """
+    Let bulk_create keep the created_at/updated_at set on the instances
+    instead of stamping them with the current time.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database (and Redis chat history) with a synthetic, seeded '
+        'dataset for load testing: users, sellers, products and orders with '
+        'realistic line counts, popularity skew and status mix. Data from a '
+        'previous run is replaced; the same options and --end date always '
+        'produce the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--sellers', type=int, default=50)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--chat-threads', type=int, default=100)
+        parser.add_argument('--chat-turns', type=int, default=10, help='most question/answer pairs per thread')
+        parser.add_argument('--days', type=int, default=365, help='days of order history')
+        parser.add_argument('--end', type=date.fromisoformat, default=None,
+                            help='last day of the order history (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password', help='password of every generated user')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true',
+                            help='only delete previously generated data, then exit')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        self.stage('Clearing generated data', self.clear)
+        if options['clear']:
+            self.stage('Rebuilding rollups and rankings', self.refresh_derived)
+            return
+
+        end = options['end'] or timezone.localdate()
+        self.end = timezone.make_aware(datetime.combine(end + timedelta(days=1), dt_time.min))
+        self.start = self.end - timedelta(days=options['days'])
+
+        users = self.stage('Users', self.make_users, options['users'], options['password'])
+        sellers = self.stage('Sellers', self.make_sellers, options['sellers'])
+        products = self.stage('Products', self.make_products, options['products'])
+        if options['orders']:
+            if not products:
+                raise CommandError('Orders need at least one product')
+            self.stage('Orders', self.make_orders, options['orders'], users, products)
+        if options['chat_threads']:
+            threads = self.stage('Chat threads', self.make_chat_threads, options['chat_threads'], options['chat_turns'])
+        else:
+            threads = 0
+        self.stage('Rebuilding rollups and rankings', self.refresh_derived)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(users)} users, {sellers} sellers, {len(products)} products, "
+            f"{options['orders']} orders and {threads} chat threads"
+        ))
+
+    def stage(self, title, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if result is None:
+            self.stdout.write(f"  {title}: {elapsed:.1f}s")
+            return result
+        count = result if isinstance(result, int) else len(result)
+        rate = f", {count / elapsed:,.0f}/s" if count and elapsed else ''
+        self.stdout.write(f"  {title}: {count:,} in {elapsed:.1f}s{rate}")
+        return result
+
+    def timestamp(self, position):
+        # Growing business: order density rises linearly towards ``end``
+        span = (self.end - self.start).total_seconds()
+        return self.start + timedelta(seconds=span * math.sqrt(position))
+
+    def make_users(self, count, password):
+        # Hashing is the slow part of creating users, and they can all share one
+        password = make_password(password)
+        users = []
+        with historic_timestamps(User):
+            for offset in range(0, count, self.batch_size):
+                batch = []
+                for i in range(offset, min(count, offset + self.batch_size)):
+                    created = self.timestamp((i + self.rng.random()) / count)
+                    batch.append(User(
+                        email=f'user{i}@{LOAD_DOMAIN}',
+                        full_name=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                        phone_number=f'01{self.rng.randint(300000000, 999999999)}',
+                        password=password, is_active=self.rng.random() < 0.95,
+                        created_at=created, updated_at=created,
+                    ))
+                with transaction.atomic():
+                    User.objects.bulk_create(batch)
+                users.extend((user.full_name, user.email, user.phone_number) for user in batch)
+        return users
+
+    def make_sellers(self, count):
+        sellers = [
+            Seller(title=f'{self.rng.choice(LAST_NAMES)} {self.rng.choice(NOUNS)} House {i}', description=LOAD_MARKER)
+            for i in range(count)
+        ]
+        Seller.objects.bulk_create(sellers, batch_size=self.batch_size)
+        return count
+
+    def make_products(self, count):
+        uoms, uom_weights = weighted(UOM_WEIGHTS)
+        products = []
+        for i in range(count):
+            roll = self.rng.random()
+            stock = 0 if roll < 0.05 else self.rng.randint(1, 9) if roll < 0.15 else self.rng.randint(10, 1000)
+            # Log-normal prices: mostly cheap everyday items, a long expensive tail
+            price = min(max(self.rng.lognormvariate(3, 0.9), 0.5), 500)
+            products.append(Product(
+                name=f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)} {i}', description=LOAD_MARKER,
+                price=Decimal(f'{price:.2f}'), stock=stock, uom=self.rng.choices(uoms, cum_weights=uom_weights)[0],
+                is_best_seller=self.rng.random() < 0.05, is_best_offer=self.rng.random() < 0.08,
+                is_active=self.rng.random() < 0.97,
+            ))
+        with transaction.atomic():
+            Product.objects.bulk_create(products, batch_size=self.batch_size)
+        # Popularity doesn't follow creation order
+        products = [(product.pk, product.price) for product in products]
+        self.rng.shuffle(products)
+        return products
+
+    def order_status(self, created):
+        weights = self.settled_statuses if self.end - created > SETTLED_AFTER else self.recent_statuses
+        return self.rng.choices(weights[0], cum_weights=weights[1])[0]
+
+    def payment_status(self, status, method):
+        if method == 'COD':
+            return 'Paid' if status == 'Completed' else 'Pending'
+        if status == 'Pending':
+            return 'Failed' if self.rng.random() < 0.3 else 'Pending'
+        if status == 'Cancelled':
+            return self.rng.choice(['Paid', 'Failed', 'Pending'])
+        return 'Paid'
+
+    def stock_state(self, status, payment_status):
+        if status == 'Cancelled':
+            return Order.STOCK_RELEASED
+        # Unpaid pending orders only hold their stock, as after a checkout, so
+        # cancelling them later doesn't give back stock that was never taken
+        return Order.STOCK_COMMITTED if Order.takes_stock(status, payment_status) else Order.STOCK_HELD
+
+    def make_orders(self, count, users, products):
+        self.settled_statuses = weighted(SETTLED_STATUS_WEIGHTS)
+        self.recent_statuses = weighted(RECENT_STATUS_WEIGHTS)
+        line_counts, line_weights = weighted(LINE_COUNT_WEIGHTS)
+        quantities, quantity_weights = weighted(QUANTITY_WEIGHTS)
+        methods, method_weights = weighted(PAYMENT_METHOD_WEIGHTS)
+        product_weights = zipf_weights(len(products), 1.1)
+        customer_weights = zipf_weights(len(users), 0.8)
+        delivery_charge = Order._meta.get_field('delivery_charge').default
+        rng = self.rng
+
+        with historic_timestamps(Order):
+            for offset in range(0, count, self.batch_size):
+                orders, order_lines = [], []
+                for i in range(offset, min(count, offset + self.batch_size)):
+                    created = self.timestamp((i + rng.random()) / count)
+                    size = min(rng.choices(line_counts, cum_weights=line_weights)[0], len(products))
+                    picked = {}
+                    while len(picked) < size:
+                        pk, price = rng.choices(products, cum_weights=product_weights)[0]
+                        picked[pk] = (price, rng.choices(quantities, cum_weights=quantity_weights)[0])
+                    if users:
+                        name, email, phone = rng.choices(users, cum_weights=customer_weights)[0]
+                    else:
+                        name, email, phone = 'Guest', f'guest{i}@{LOAD_DOMAIN}', '01700000000'
+                    status = self.order_status(created)
+                    method = rng.choices(methods, cum_weights=method_weights)[0]
+                    payment_status = self.payment_status(status, method)
+                    orders.append(Order(
+                        customer_name=name, email=email, phone_number=phone,
+                        address=f'House {rng.randint(1, 200)}, Road {rng.randint(1, 50)}, Dhaka',
+                        delivery_charge=delivery_charge,
+                        total=sum(price * quantity for price, quantity in picked.values()) + delivery_charge,
+                        status=status, payment_method=method, payment_status=payment_status,
+                        stock_state=self.stock_state(status, payment_status),
+                        created_at=created, updated_at=created,
+                    ))
+                    order_lines.append(picked)
+
+                with transaction.atomic():
+                    Order.objects.bulk_create(orders)
+                    OrderDetail.objects.bulk_create([
+                        OrderDetail(order_id=order.pk, product_id=pk, quantity=quantity, price=price)
+                        for order, picked in zip(orders, order_lines)
+                        for pk, (price, quantity) in picked.items()
+                    ])
+        return count
+
+    def make_chat_threads(self, count, max_turns):
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for i in range(count):
+                key = f'chat:{LOAD_THREAD_PREFIX}{i}'
+                pipe.delete(key)
+                messages = []
+                for turn in range(self.rng.randint(1, max(1, max_turns))):
+                    topic = self.rng.randrange(len(CHAT_QUESTIONS))
+                    messages.append({'id': 2 * turn + 1, 'sender': 'user', 'message': CHAT_QUESTIONS[topic]})
+                    messages.append({'id': 2 * turn + 2, 'sender': 'bot', 'message': CHAT_REPLIES[topic]})
+                pipe.rpush(key, *[json.dumps(message) for message in messages])
+                if i % self.batch_size == self.batch_size - 1:
+                    pipe.execute()
+            pipe.execute()
+        except redis.RedisError as e:
+            self.stderr.write(self.style.WARNING(f"  Skipped chat threads, Redis is unavailable: {e}"))
+            return 0
+        return count
+
+    def clear(self):
+        product_ids = list(Product.objects.filter(description=LOAD_MARKER).values_list('pk', flat=True))
+        # Plain DELETEs: collecting a million rows to send their delete signals
+        # would take longer than generating them. refresh_derived() does what
+        # the signals would have done, once.
+        querysets = [
+            OrderDetail.objects.filter(Q(order__email__endswith=f'@{LOAD_DOMAIN}') | Q(product_id__in=product_ids)),
+            Order.objects.filter(email__endswith=f'@{LOAD_DOMAIN}'),
+            DailyProductSales.objects.filter(product_id__in=product_ids),
+            Product.objects.filter(pk__in=product_ids),
+        ]
+        with transaction.atomic():
+            deleted = sum(delete_rows(queryset) for queryset in querysets)
+            forget_available(product_ids)
+        deleted += Seller.objects.filter(description=LOAD_MARKER).delete()[0]
+        deleted += User.objects.filter(email__endswith=f'@{LOAD_DOMAIN}').delete()[0]
+        try:
+            client = get_redis()
+            keys = list(client.scan_iter(match=f'chat:{LOAD_THREAD_PREFIX}*', count=1000))
+            for offset in range(0, len(keys), 1000):
+                deleted += client.delete(*keys[offset:offset + 1000])
+        except redis.RedisError as e:
+            self.stderr.write(self.style.WARNING(f"  Could not delete chat threads from Redis: {e}"))
+        return deleted
+
+    def refresh_derived(self):
+        # bulk_create skips the signals that keep these up to date
+        reconcile_sales_rollups()
+        try:
+            refresh_rankings(full=True)
+        except redis.RedisError as e:
+            self.stderr.write(self.style.WARNING(f"  Could not refresh best seller rankings: {e}"))
+        bump_catalog_version()
+        bump_dashboard_version()
@@ -38,6 +38,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     full_name = models.CharField(max_length=150, blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -58,6 +59,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='accounts_user_created_id_idx'),
+        ]
 
 
 User = get_user_model()
@@ -109,6 +113,7 @@ class SiteStatus(models.Model):
     is_maintenance_mode = models.BooleanField(default=False)
     maintenance_message = models.TextField(blank=True, null=True)
     poster = models.ImageField(upload_to='maintenance_posters/', blank=True, null=True)
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -6,6 +6,9 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueValidator
 
+from shop.fieldsets import SparseFieldsetMixin
+from shop.images import variant_urls
+
 from .celery_task import Celery_send_mail
 from .models import *
 
@@ -282,7 +285,7 @@ class LogoutSerializer(serializers.Serializer):
     refresh = serializers.CharField()
 
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'full_name', 'email', 'phone_number', 'profile_picture', 'is_active']
@@ -332,7 +335,9 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
         return instance
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    profile_picture_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = CustomUser
         fields = ['id',
@@ -340,15 +345,22 @@ class UserSerializer(serializers.ModelSerializer):
                   'full_name',
                   'phone_number',
                   'profile_picture',
+                  'profile_picture_variants',
                   'is_staff',
                   'is_active',
                   'is_superuser'
                   ]
+        method_field_columns = {'profile_picture_variants': ('profile_picture', 'profile_picture_variants')}
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj, 'profile_picture', self.context.get('request'))
+
 
 
 
+class UserDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    profile_picture_variants = serializers.SerializerMethodField()
 
-class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id',
@@ -356,8 +368,13 @@ class UserDetailSerializer(serializers.ModelSerializer):
                   'full_name',
                   'phone_number',
                   'profile_picture',
+                  'profile_picture_variants',
                   'is_active'
                   ]
+        method_field_columns = {'profile_picture_variants': ('profile_picture', 'profile_picture_variants')}
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj, 'profile_picture', self.context.get('request'))
 
 
 class UserQuestionAnswerSerializer(serializers.ModelSerializer):
@@ -418,6 +435,8 @@ class ProjectCretientialsSerializer(serializers.ModelSerializer):
 
 
 class SiteStatusSerializer(serializers.ModelSerializer):
+    poster_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = SiteStatus
         fields = [
@@ -425,5 +444,9 @@ class SiteStatusSerializer(serializers.ModelSerializer):
             'is_maintenance_mode',
             'maintenance_message',
             'poster',
+            'poster_variants',
         ]
-        read_only_fields = ['id', ]
\ No newline at end of file
+        read_only_fields = ['id', ]
+
+    def get_poster_variants(self, obj):
+        return variant_urls(obj, 'poster', self.context.get('request'))
\ No newline at end of file
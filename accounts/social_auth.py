@@ -1,5 +1,6 @@
 import requests
 from django.conf import settings
+from project.http_client import get_session
 from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -33,7 +34,7 @@ class GoogleLoginView(APIView):
         }
 
         try:
-            token_resp = requests.post(token_url, data=data)
+            token_resp = get_session('google').post(token_url, data=data)
             token_resp.raise_for_status()
         except requests.RequestException as e:
             return Response({"error": "Failed to exchange auth_code", "details": str(e)}, status=400)
@@ -48,7 +49,7 @@ class GoogleLoginView(APIView):
         # Verify ID token
         try:
             id_info = id_token.verify_oauth2_token(
-                id_token_value, google_requests.Request(), settings.GOOGLE_CLIENT_ID
+                id_token_value, google_requests.Request(session=get_session('google')), settings.GOOGLE_CLIENT_ID
             )
             email = id_info.get("email")
             name = id_info.get("name")
@@ -90,7 +91,7 @@ class AppleLoginView(APIView):
             "grant_type": "authorization_code",
         }
 
-        resp = requests.post(token_url, data=data)
+        resp = get_session('apple').post(token_url, data=data)
         if resp.status_code != 200:
             return Response({"error": "Failed to get token", "details": resp.json()}, status=status.HTTP_400_BAD_REQUEST)
 
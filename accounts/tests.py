@@ -1,3 +1,107 @@
-from django.test import TestCase
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop import perf_testing
+from shop.perf_testing import Endpoint
+
+from .models import CustomUser, PasswordResetCode, ProjectCretientials, SiteStatus, UserQuestionAnswer
+
+NEW_PASSWORD = 'N3w-passw0rd!'
+
+
+def seed_accounts(size):
+    """
+    ``size`` users with a questionnaire each, plus the admin, an active and
+    an inactive user with pending codes, and the singleton settings rows.
+    """
+    admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+    customer = CustomUser.objects.create_user(
+        email='customer@example.com', full_name='Customer', phone_number='1', password='password', is_active=True
+    )
+    inactive = CustomUser.objects.create_user(
+        email='inactive@example.com', full_name='Inactive', phone_number='2', password='password'
+    )
+    password = make_password('password')
+    users = CustomUser.objects.bulk_create([
+        CustomUser(email=f'user{i}@example.com', full_name=f'User {i}', password=password, is_active=True)
+        for i in range(size)
+    ])
+    answers = UserQuestionAnswer.objects.bulk_create([
+        UserQuestionAnswer(user=user, skin_status='ok', hydration_goal='2l', feeling_today='good',
+                           how_many_prayers='5', top_skin_goal='glow')
+        for user in [customer, *users]
+    ])
+    PasswordResetCode.objects.create(user=inactive, code='111111')
+    PasswordResetCode.objects.create(user=customer, code='222222')
+    ProjectCretientials.objects.create(STRIPE_PUBLISHABLE_KEY='pk_test_fake')
+    SiteStatus.objects.create(maintenance_message='Back soon')
+    return SimpleNamespace(
+        admin=admin, customer=customer, inactive=inactive, other=users[0], answer=answers[0],
+        refresh=str(RefreshToken.for_user(customer)),
+    )
+
+
+class AccountsEndpointBudgetTests(perf_testing.EndpointBudgetTestCase):
+    urlconf = 'accounts.urls'
+    prefix = '/api/'
+    endpoints = [
+        Endpoint('auth/register/', 'post', user=None, status=201, max_queries=5, data={
+            'email': 'new@example.com', 'full_name': 'New', 'phone_number': '3',
+            'password': NEW_PASSWORD, 'password2': NEW_PASSWORD,
+        }),
+        Endpoint('auth/user/', user='customer', max_queries=0),
+        Endpoint('auth/active/user/', 'post', user=None, max_queries=4,
+                 data={'email': 'inactive@example.com', 'code': '111111'}),
+        # Only the rejection: the send path calls the missing CustomUser.email_user
+        Endpoint('auth/resend/code/', 'post', data={'email': 'customer@example.com'}, user=None, status=400,
+                 max_queries=1),
+        Endpoint('auth/login/', 'post', user=None, max_queries=2,
+                 data={'email': 'customer@example.com', 'password': 'password'}),
+        Endpoint('auth/refresh/', 'post', data=lambda f: {'refresh': f.refresh}, user=None, max_queries=2),
+        Endpoint('auth/forgot-password/', 'post', data={'email': 'customer@example.com'}, user=None,
+                 max_queries=3),
+        Endpoint('auth/verify_code/', 'post', user=None, max_queries=3,
+                 data={'email': 'customer@example.com', 'code': '222222'}),
+        Endpoint('auth/set_new_password/', 'post', user=None, max_queries=5, data={
+            'email': 'customer@example.com', 'code': '222222',
+            'new_password': NEW_PASSWORD, 'new_password2': NEW_PASSWORD,
+        }),
+        Endpoint('auth/change-password/', 'post', user='customer', max_queries=1, data={
+            'old_password': 'password', 'new_password': NEW_PASSWORD, 'confirm_password': NEW_PASSWORD,
+        }),
+        Endpoint('auth/logout/', 'post', data=lambda f: {'refresh': f.refresh}, user='customer', status=205,
+                 max_queries=7),
+        Endpoint('auth/account-delete/', 'delete', user='customer', status=204, max_queries=12,
+                 data={'password': 'password', 'conform_password': 'password'}),
+        # The identity providers are not faked; only the request validation runs
+        Endpoint('auth/google/', 'post', data={}, user=None, status=400, max_queries=0),
+        Endpoint('auth/apple/', 'post', data={}, user=None, status=400, max_queries=0),
+        Endpoint('auth/profile/update/', 'patch', data={'full_name': 'Renamed'}, format='multipart',
+                 user='customer', max_queries=1),
+        Endpoint('user/profile/<int:pk>/', kwargs=lambda f: {'pk': f.other.pk}, max_queries=1),
+        Endpoint('auth/user/list/', query={'cursor': '', 'page_size': 100}, max_queries=1),
+        Endpoint('auth/user/question/', user='customer', max_queries=2),
+        Endpoint('auth/user/question/', 'post', user='customer', status=201, max_queries=1, data={
+            'skin_status': 'ok', 'hydration_goal': '2l', 'feeling_today': 'good',
+            'how_many_prayers': '5', 'top_skin_goal': 'glow',
+        }),
+        Endpoint('auth/user/question/<int:pk>/', kwargs=lambda f: {'pk': f.answer.pk}, user='customer',
+                 max_queries=1),
+        Endpoint('auth/cretiential/', user='customer', max_queries=1),
+        Endpoint('auth/cretiential/update/', 'patch', data={'OPENAI_API_KEY': 'sk-fake'}, max_queries=2),
+        Endpoint('auth/user/delete/<int:pk>/', 'delete', kwargs=lambda f: {'pk': f.other.pk}, status=204,
+                 max_queries=12),
+        Endpoint('auth/user/createsuperuser/', 'post', status=201, max_queries=2, data={
+            'email': 'staff@example.com', 'full_name': 'Staff', 'phone_number': '4', 'password': NEW_PASSWORD,
+        }),
+        Endpoint('auth/site/status/', user=None, max_queries=2),
+        Endpoint('auth/site/status/update/', 'patch', data={'is_maintenance_mode': True}, max_queries=2),
+        # AI replies come from the fake server
+        Endpoint('chat/', 'post', data={'message': 'hello', 'thread_id': 'thread-1'}, user=None, max_queries=7),
+        Endpoint('chat/history/<str:thread_id>/', kwargs={'thread_id': 'thread-1'}, user=None, max_queries=0),
+    ]
+
+    def seed(self, size):
+        return seed_accounts(size)
@@ -5,6 +5,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
+from shop.conditional import ConditionalGetMixin, queryset_validators
+from shop.fieldsets import SparseFieldsetViewMixin
+from shop.pagination import KeysetPagination
 from .userpermissions import IsSuperUser
 
 from .serializers import *
@@ -162,7 +165,7 @@ class UpdateProfileView(generics.UpdateAPIView):
         return self.request.user
 
 
-class UserUpdateView(generics.RetrieveUpdateAPIView):
+class UserUpdateView(SparseFieldsetViewMixin, generics.RetrieveUpdateAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserUpdateSerializer
     
@@ -173,9 +176,10 @@ class UserUpdateView(generics.RetrieveUpdateAPIView):
         return super().get_permissions()
 
 
-class UserListView(generics.ListAPIView):
+class UserListView(SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     queryset = CustomUser.objects.all()
+    pagination_class = KeysetPagination
 
 
 class UserDetailView(APIView):
@@ -211,7 +215,8 @@ class DeleteAccountView(generics.DestroyAPIView):
 
 
 class UserQuestionAnswerCreateListView(generics.ListCreateAPIView):
-    queryset = UserQuestionAnswer.objects.all()
+    # to_representation reads the answer's user
+    queryset = UserQuestionAnswer.objects.select_related('user')
     serializer_class = UserQuestionAnswerSerializer
 
     def perform_create(self, serializer):
@@ -219,7 +224,7 @@ class UserQuestionAnswerCreateListView(generics.ListCreateAPIView):
 
 
 class UserQuestionAnswerRetrieveView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = UserQuestionAnswer.objects.all()
+    queryset = UserQuestionAnswer.objects.select_related('user')
     serializer_class = UserQuestionAnswerSerializer
 
     def get_object(self):
@@ -316,12 +321,17 @@ class ProjectCretientialsDetailView(generics.GenericAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class SiteStatusView(generics.ListAPIView):
+class SiteStatusView(ConditionalGetMixin, generics.ListAPIView):
     queryset = SiteStatus.objects.all()
     serializer_class = SiteStatusSerializer
     permission_classes = [permissions.AllowAny]
-    
-    def get(self, request, *args, **kwargs):
+    # clients poll this to find out about maintenance, keep it fresh
+    cache_max_age = 15
+
+    def get_validators(self, request, *args, **kwargs):
+        return queryset_validators(SiteStatus.objects.all())
+
+    def list(self, request, *args, **kwargs):
         site_status = SiteStatus.objects.first()
         serializer = self.get_serializer(site_status)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -23,12 +23,29 @@ from celery.schedules import crontab
 
 # Explicitly import task modules to ensure they're registered
 app.conf.update(
-    imports=['shop.stock_tasks']
+    imports=['shop.stock_tasks', 'shop.ranking', 'shop.images', 'shop.webhooks', 'shop.rollups']
 )
 
 app.conf.beat_schedule = {
-    'auto-cancel-orders-every-minute': {
+    # Each order schedules its own cancellation at checkout; this sweep only
+    # catches orders whose task was lost (broker down, worker restart)
+    'sweep-unpaid-orders': {
         'task': 'shop.stock_tasks.auto_cancel_unpaid_orders',
-        'schedule': crontab(minute='*/1'),  # Run every 1 minute
+        'schedule': crontab(minute='*/15'),
+    },
+    'refresh-best-seller-rankings': {
+        'task': 'shop.ranking.refresh_best_seller_rankings',
+        'schedule': crontab(minute='*/5'),  # today's and yesterday's sales
+    },
+    'rebuild-best-seller-rankings-nightly': {
+        'task': 'shop.ranking.refresh_best_seller_rankings',
+        'schedule': crontab(hour=2, minute=30),
+        'kwargs': {'full': True},  # picks up late cancellations in older days
+    },
+    # Dirty days are refreshed when the dashboards are read; this rebuilds
+    # everything in case a mark was lost while Redis was down
+    'reconcile-sales-rollups-nightly': {
+        'task': 'shop.rollups.reconcile_sales_rollups',
+        'schedule': crontab(hour=3, minute=0),
     },
 }
@@ -0,0 +1,90 @@
+"""
+Shared HTTP sessions for outbound integrations.
+
+Each integration gets one requests.Session, so connections (and their TLS
+handshakes) are pooled and kept alive per host instead of being opened for
+every call, plus its own timeouts and retry budget.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .instrumentation import timed
+
+# timeout: (connect, read) seconds. retries: attempts after a failed connect;
+# the request was never sent then, so it is safe to retry even for POSTs.
+INTEGRATIONS = {
+    'ai': {'timeout': (5, 100), 'retries': 1},
+    'google': {'timeout': (5, 15), 'retries': 2},
+    'apple': {'timeout': (5, 15), 'retries': 2},
+    # The Stripe library retries on its own (stripe.max_network_retries)
+    'stripe': {'timeout': (5, 80), 'retries': 0},
+}
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class IntegrationSession(requests.Session):
+    """
+    Session that applies the integration's timeout unless one is given.
+    """
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with timed('http'):
+            return super().request(*args, **kwargs)
+
+
+def build_session(name):
+    config = INTEGRATIONS[name]
+    session = IntegrationSession(config['timeout'])
+    retry = Retry(
+        total=config['retries'],
+        connect=config['retries'],
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.2,
+        allowed_methods=None,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(name):
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = build_session(name)
+    return session
+
+
+def close_sessions():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def configure_stripe():
+    import stripe
+
+    stripe.default_http_client = stripe.RequestsClient(
+        session=get_session('stripe'), timeout=INTEGRATIONS['stripe']['timeout']
+    )
@@ -0,0 +1,110 @@
+"""
+Per-request timing of the work a request hands off: SQL, Redis commands,
+outbound HTTP calls and DRF serialization.
+
+Code that does such work wraps it in ``timed(name)``. Outside a request
+being measured (see project.middleware.ServerTimingMiddleware) that is a
+single context variable lookup, so the hooks stay in place everywhere.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+
+_current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    """
+    Count and total seconds of each kind of work done during one request.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        # Kinds being timed right now; nested calls (a serializer rendering
+        # another one) are part of the outer call and aren't counted again
+        self.active = set()
+
+    def add(self, name, seconds):
+        count, total = self.metrics.get(name, (0, 0.0))
+        self.metrics[name] = (count + 1, total + seconds)
+
+    def count(self, name):
+        return self.metrics.get(name, (0, 0.0))[0]
+
+    def seconds(self, name):
+        return self.metrics.get(name, (0, 0.0))[1]
+
+
+@contextmanager
+def collect():
+    """
+    Record the ``timed`` work done inside the block into a new Timings.
+    """
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    timings = _current.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.add(name, time.perf_counter() - start)
+
+
+def time_query(execute, sql, params, many, context):
+    # connection.execute_wrapper() hook
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedPipeline(redis.client.Pipeline):
+    # A pipeline is one round trip, however many commands it carries
+    def execute(self, raise_on_error=True):
+        with timed('redis'):
+            return super().execute(raise_on_error)
+
+
+class TimedRedis(redis.StrictRedis):
+    """
+    Redis client whose commands and pipelines are timed.
+    """
+
+    def execute_command(self, *args, **options):
+        with timed('redis'):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def instrument_serializers():
+    """
+    Time every top-level ``serializer.data``, where DRF turns instances
+    into primitives. Safe to call more than once.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data.fget
+    if getattr(data, 'timed', False):
+        return
+
+    def timed_data(self):
+        with timed('serialize'):
+            return data(self)
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
@@ -0,0 +1,67 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import collect, instrument_serializers, time_query
+
+logger = logging.getLogger(__name__)
+
+# (metric, what is counted) in header order
+METRICS = [('db', 'queries'), ('redis', 'commands'), ('http', 'calls'), ('serialize', 'calls')]
+
+
+class ServerTimingMiddleware:
+    """
+    Measures a sample of requests (SERVER_TIMING_SAMPLE_RATE) and reports
+    where their time went: SQL queries, Redis commands, outbound HTTP and
+    serialization, as a ``Server-Timing`` header (SERVER_TIMING_HEADER) and
+    one log line with the numbers as structured fields. The metrics may
+    overlap, e.g. queries run while serializing count in both.
+
+    Requests that aren't sampled only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        with ExitStack() as stack:
+            timings = stack.enter_context(collect())
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            start = time.perf_counter()
+            response = self.get_response(request)
+            total = time.perf_counter() - start
+
+        if settings.SERVER_TIMING_HEADER:
+            entries = [
+                f'{name};dur={timings.seconds(name) * 1000:.1f};desc="{timings.count(name)} {unit}"'
+                for name, unit in METRICS if timings.count(name) or name == 'db'
+            ]
+            entries.append(f'total;dur={total * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+
+        fields = {
+            'http_method': request.method,
+            'http_path': request.path,
+            'http_status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+        }
+        for name, unit in METRICS:
+            fields[f'{name}_{unit}'] = timings.count(name)
+            fields[f'{name}_ms'] = round(timings.seconds(name) * 1000, 1)
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} {fields['duration_ms']}ms "
+            + ' '.join(f"{name}={fields[f'{name}_{unit}']}/{fields[f'{name}_ms']}ms" for name, unit in METRICS),
+            extra=fields,
+        )
+        return response
@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers the rest of the stack
+    'project.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,15 +100,42 @@ DATABASES = {
 }
 
 # Redis configuration
-import redis
+from project.instrumentation import TimedRedis
 
-REDIS_CLIENT = redis.StrictRedis(
+REDIS_CLIENT = TimedRedis(
     host='redis',          # Docker service name
     port=6379,
     db=0,
     decode_responses=True
 )
 
+# Server-Timing header and timing log line: fraction of requests measured
+# (0 turns it off) and whether measured responses carry the header. The
+# header shows backend timings to any client, so it is off unless enabled
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv('SERVER_TIMING_SAMPLE_RATE', '0.05'))
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'False').lower() == 'true'
+
+# Product catalog cache (seconds a cached list/detail payload may live)
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+# Admin dashboard cache: seconds a payload is fresh, then how much longer it
+# may be served while a single request recomputes it
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '30'))
+DASHBOARD_CACHE_STALE_TTL = int(os.getenv('DASHBOARD_CACHE_STALE_TTL', '600'))
+
+# How long an approximate listing total (?include_total=1) is reused
+APPROXIMATE_COUNT_TTL = int(os.getenv('APPROXIMATE_COUNT_TTL', '60'))
+
+# Product search hits put in relevance order; any further matches follow
+# them unranked
+PRODUCT_SEARCH_LIMIT = int(os.getenv('PRODUCT_SEARCH_LIMIT', '200'))
+
+# Cache-Control max-age for public, conditionally cached GET endpoints
+PUBLIC_CACHE_MAX_AGE = int(os.getenv('PUBLIC_CACHE_MAX_AGE', '60'))
+
+# Encoding of generated image variants: WEBP, AVIF or JPEG (JPEG is the
+# fallback when Pillow lacks the codec)
+IMAGE_VARIANT_FORMAT = os.getenv('IMAGE_VARIANT_FORMAT', 'WEBP')
+
 # Session expires after 1 day
 SESSION_COOKIE_AGE = 86400  # 1 day
 SESSION_SAVE_EVERY_REQUEST = False
@@ -316,8 +345,31 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 # Explicitly import task modules
 CELERY_IMPORTS = [
     'shop.stock_tasks',
+    'shop.ranking',
+    'shop.images',
+    'shop.webhooks',
+    'shop.rollups',
 ]
 
+# Seconds an order may stay unpaid before it is cancelled and its stock released
+ORDER_PAYMENT_TIMEOUT = int(os.getenv('ORDER_PAYMENT_TIMEOUT', '300'))
+
+# Hold checkout stock in Redis and only take it from Product.stock once paid
+STOCK_LEDGER_ENABLED = os.getenv('STOCK_LEDGER_ENABLED', 'True').lower() == 'true'
+# Idle lifetime of a Redis available-stock counter before it is rebuilt from the database
+STOCK_LEDGER_TTL = int(os.getenv('STOCK_LEDGER_TTL', '3600'))
+
+# Seconds a response is replayed for retries carrying the same Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# Outbound HTTP connection pools (project.http_client): hosts kept per
+# integration and connections kept per host
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+
+# AI chat server
+AI_SERVER_URL = os.getenv('AI_SERVER_URL', 'https://ai.orderwithpluto.com/chat')
+
 # for Google OAuth (social login)
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from .models import Product, Order, OrderDetail, Seller
+from .orders import transition_orders
+from .search import search_matches
 
 
 @admin.register(Product)
@@ -28,12 +31,22 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        matches = search_matches(search_term, using=queryset.db) if search_term.strip() else None
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(matches), False
+
 
 class OrderDetailInline(admin.TabularInline):
     model = OrderDetail
     extra = 0
     readonly_fields = ['product', 'quantity', 'price', 'get_total_price']
     can_delete = False
+
+    def get_queryset(self, request):
+        # 'product' is rendered for every line
+        return super().get_queryset(request).select_related('product')
     
     def get_total_price(self, obj):
         if obj.quantity and obj.price:
@@ -42,13 +55,40 @@ class OrderDetailInline(admin.TabularInline):
     get_total_price.short_description = "Total Price"
 
 
+class OrderAdminForm(forms.ModelForm):
+    def clean_status(self):
+        new_status = self.cleaned_data['status']
+        old_status = self.initial.get('status')
+        if self.instance.pk and not Order.can_transition(old_status, new_status):
+            raise forms.ValidationError(f"Cannot change status from {old_status} to {new_status}.")
+        return new_status
+
+
+def transition_action(new_status):
+    def action(modeladmin, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        updated = transition_orders(ids, new_status, partial=True)
+        modeladmin.message_user(request, f"{len(updated)} order(s) marked as {new_status}.")
+        skipped = len(ids) - len(updated)
+        if skipped:
+            modeladmin.message_user(
+                request, f"{skipped} order(s) were already {new_status} or can't move to it.", messages.WARNING
+            )
+    action.__name__ = f'mark_{new_status.lower()}'
+    action.short_description = f"Mark selected orders as {new_status}"
+    return action
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ['id', 'customer_name', 'email', 'total', 'status', 'payment_method', 'payment_status', 'created_at', 'updated_at']
     list_filter = ['status', 'payment_method', 'payment_status', 'created_at']
     search_fields = ['customer_name', 'email', 'phone_number', 'address']
-    list_editable = ['status', 'payment_status']
-    readonly_fields = ['created_at', 'updated_at']
+    # Status changes go through the bulk actions, which check the allowed transitions
+    list_editable = ['payment_status']
+    actions = [transition_action(new_status) for new_status in ('Processing', 'Shipped', 'Completed', 'Cancelled')]
+    readonly_fields = ['stock_state', 'created_at', 'updated_at']
     ordering = ['-created_at']
     inlines = [OrderDetailInline]
     
@@ -57,7 +97,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('customer_name', 'email', 'phone_number', 'address')
         }),
         ('Order Details', {
-            'fields': ('total', 'status', 'delivery_date', 'notes')
+            'fields': ('total', 'status', 'stock_state', 'delivery_date', 'notes')
         }),
         ('Payment Information', {
             'fields': ('payment_method', 'payment_status')
@@ -102,6 +142,9 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderDetail)
 class OrderDetailAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price', 'get_total_price']
+    list_select_related = ['order', 'product']
+    # Select widgets would load (and __str__) every order and product
+    raw_id_fields = ['order', 'product']
     list_filter = ['order__status']
     search_fields = ['order__id', 'product__name', 'order__customer_name']
     readonly_fields = ['get_total_price']
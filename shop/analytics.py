@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import DailySales
+
+# Buckets start on the first local day they cover: the day itself, the
+# Monday of its ISO week or the 1st of its month.
+GRANULARITIES = ('day', 'week', 'month')
+DEFAULT_GRANULARITY = 'month'
+# Buckets shown (ending with the current one) when no ``from`` is given
+DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 6}
+# Upper bound on the buckets of one response
+MAX_BUCKETS = 1000
+
+TRUNCATE = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%B %Y'}
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def previous_buckets(end, granularity, count):
+    """
+    Start of the bucket ``count - 1`` buckets before the one holding ``end``.
+    """
+    start = bucket_start(end, granularity)
+    if granularity == 'month':
+        months = start.year * 12 + start.month - 1 - (count - 1)
+        return start.replace(year=months // 12, month=months % 12 + 1)
+    step = 7 if granularity == 'week' else 1
+    return start - timedelta(days=step * (count - 1))
+
+
+def bucket_starts(start, end, granularity):
+    starts = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        starts.append(current)
+        current = next_bucket(current, granularity)
+    return starts
+
+
+def bucket_count(start, end, granularity):
+    first, last = bucket_start(start, granularity), bucket_start(end, granularity)
+    if granularity == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days // (7 if granularity == 'week' else 1) + 1
+
+
+def resolve_window(start=None, end=None, granularity=DEFAULT_GRANULARITY):
+    """
+    The (from, to) local dates of a request, both inclusive. ``to`` defaults
+    to today in TIME_ZONE and ``from`` to the last DEFAULT_BUCKETS buckets.
+    """
+    end = end or timezone.localdate()
+    start = start or previous_buckets(end, granularity, DEFAULT_BUCKETS[granularity])
+    return start, end
+
+
+def sales_series(field, start, end, granularity):
+    """
+    ``{label: total}`` of a DailySales column for every bucket between
+    ``start`` and ``end``, in order, with empty buckets as 0. The database
+    sums only the rows of the window; the gaps are filled from one lookup
+    of the grouped totals.
+    """
+    rows = (
+        DailySales.objects.filter(date__range=(start, end))
+        .annotate(bucket=TRUNCATE[granularity]('date'))
+        .values('bucket')
+        .annotate(total=Sum(field))
+        .order_by()
+    )
+    totals = {row['bucket']: row['total'] for row in rows}
+    label = LABEL_FORMATS[granularity]
+    return {day.strftime(label): totals.get(day, 0) for day in bucket_starts(start, end, granularity)}
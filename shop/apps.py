@@ -1,4 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def setup_search_index(sender, using='default', **kwargs):
+    from .search import ensure_search_index
+    ensure_search_index(using)
+
+
+def retire_legacy_periodic_tasks(sender, using='default', **kwargs):
+    # The every-minute unpaid order sweep used to be stored under this name
+    # by the database scheduler; it is now 'sweep-unpaid-orders'
+    from django_celery_beat.models import PeriodicTask
+    PeriodicTask.objects.using(using).filter(name='auto-cancel-orders-every-minute').update(enabled=False)
 
 
 class ShopConfig(AppConfig):
@@ -10,4 +23,10 @@ class ShopConfig(AppConfig):
         try:
             from . import stock_tasks  # noqa
         except ImportError:
-            pass
\ No newline at end of file
+            pass
+        from . import signals  # noqa
+        # Stripe calls go through the pooled session of project.http_client
+        from project.http_client import configure_stripe
+        configure_stripe()
+        post_migrate.connect(setup_search_index, sender=self)
+        post_migrate.connect(retire_legacy_periodic_tasks, sender=self)
\ No newline at end of file
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# Every cached catalog payload lives under the current version, so bumping
+# the version invalidates all of them at once. Old keys just expire.
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+CATALOG_HITS_KEY = 'catalog:stats:hits'
+CATALOG_MISSES_KEY = 'catalog:stats:misses'
+
+# Admin dashboard responses are cached per query string. Entries carry the
+# dashboard (order) and catalog versions they were computed at and stay
+# readable for DASHBOARD_CACHE_STALE_TTL: past their TTL or version, one
+# request recomputes under a lock while the others keep serving the old
+# payload.
+DASHBOARD_VERSION_KEY = 'dashboard:version'
+DASHBOARD_KEY = 'dashboard:{name}:{digest}'
+DASHBOARD_LOCK_TIMEOUT = 30
+# How long a request waits for another one to fill an empty entry
+DASHBOARD_WAIT = 5
+POLL_INTERVAL = 0.05
+
+
+def get_redis():
+    return settings.REDIS_CLIENT
+
+
+def initial_version():
+    # Version counters start from the clock instead of 0, so a flushed or
+    # restarted Redis never hands out a version (and ETag) clients have seen
+    return time.time_ns() // 1000
+
+
+def catalog_version():
+    try:
+        client = get_redis()
+        version = client.get(CATALOG_VERSION_KEY)
+        if version is None:
+            client.set(CATALOG_VERSION_KEY, initial_version(), nx=True)
+            version = client.get(CATALOG_VERSION_KEY)
+        return int(version)
+    except redis.RedisError:
+        return None
+
+
+def bump_catalog_version():
+    try:
+        pipe = get_redis().pipeline()
+        pipe.set(CATALOG_VERSION_KEY, initial_version(), nx=True)
+        pipe.incr(CATALOG_VERSION_KEY)
+        pipe.set(CATALOG_MODIFIED_KEY, int(time.time()))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not bump catalog cache version: {e}")
+
+
+def invalidate_catalog():
+    # Bump after the surrounding transaction commits so a concurrent reader
+    # can't re-cache the old rows under the new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+def catalog_key(request, name):
+    # The serialized data contains absolute media URLs and depends on the
+    # query string, so both are part of the key.
+    raw = f"{request.build_absolute_uri('/')}|{request.get_full_path()}"
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"catalog:{{version}}:{name}:{digest}"
+
+
+def get_catalog_cache(key_template):
+    version = catalog_version()
+    if version is None:
+        return None, None
+    key = key_template.format(version=version)
+    try:
+        client = get_redis()
+        cached = client.get(key)
+        client.incr(CATALOG_HITS_KEY if cached is not None else CATALOG_MISSES_KEY)
+    except redis.RedisError:
+        return None, None
+    if cached is None:
+        return key, None
+    return key, json.loads(cached)
+
+
+def set_catalog_cache(key, data):
+    if key is None:
+        return
+    try:
+        get_redis().set(key, json.dumps(data, default=str), ex=settings.CATALOG_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Could not store catalog cache entry: {e}")
+
+
+def catalog_cache_stats():
+    try:
+        hits, misses, version = get_redis().mget(CATALOG_HITS_KEY, CATALOG_MISSES_KEY, CATALOG_VERSION_KEY)
+    except redis.RedisError:
+        return {'available': False}
+    hits, misses = int(hits or 0), int(misses or 0)
+    total = hits + misses
+    return {
+        'available': True,
+        'version': int(version or 0),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET list/detail responses from the Redis catalog cache.
+    """
+    catalog_cache_name = None
+
+    def list(self, request, *args, **kwargs):
+        key, data = get_catalog_cache(catalog_key(request, f"{self.catalog_cache_name}:list"))
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_catalog_cache(key, response.data)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        key, data = get_catalog_cache(catalog_key(request, f"{self.catalog_cache_name}:{kwargs.get('pk')}"))
+        if data is not None:
+            return Response(data)
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_catalog_cache(key, response.data)
+        return response
+
+
+def bump_dashboard_version():
+    try:
+        get_redis().incr(DASHBOARD_VERSION_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Could not bump dashboard cache version: {e}")
+
+
+def invalidate_dashboards():
+    transaction.on_commit(bump_dashboard_version)
+
+
+def _wait_for_entry(client, key):
+    deadline = time.monotonic() + DASHBOARD_WAIT
+    while time.monotonic() < deadline:
+        raw = client.get(key)
+        if raw is not None:
+            return json.loads(raw)
+        if not client.exists(f"{key}:lock"):
+            # The recompute failed; do it here
+            return None
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def _store_dashboard_entry(client, key, version, data):
+    entry = {'version': version, 'expires': time.time() + settings.DASHBOARD_CACHE_TTL, 'data': data}
+    try:
+        client.set(
+            key, json.dumps(entry, cls=JSONEncoder),
+            ex=settings.DASHBOARD_CACHE_TTL + settings.DASHBOARD_CACHE_STALE_TTL,
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not store dashboard cache entry {key}: {e}")
+
+
+def dashboard_cache(name, personalize=None):
+    """
+    Cache a GET view's response data for DASHBOARD_CACHE_TTL seconds,
+    shared by every admin. ``personalize(data, request)`` patches the
+    per-user parts of a cached payload before it is returned.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+            key = DASHBOARD_KEY.format(name=name, digest=digest)
+            client = get_redis()
+            try:
+                raw, version, catalog = client.mget(key, DASHBOARD_VERSION_KEY, CATALOG_VERSION_KEY)
+                current = f"{int(version or 0)}:{int(catalog or 0)}"
+                entry = json.loads(raw) if raw is not None else None
+                if entry and entry['version'] == current and entry['expires'] > time.time():
+                    leader = False
+                else:
+                    leader = client.set(f"{key}:lock", 1, nx=True, ex=DASHBOARD_LOCK_TIMEOUT)
+                    if not leader and entry is None:
+                        entry = _wait_for_entry(client, key)
+            except redis.RedisError as e:
+                logger.warning(f"Dashboard cache unavailable: {e}")
+                return view(request, *args, **kwargs)
+
+            if entry is not None and not leader:
+                data = entry['data']
+                if personalize:
+                    personalize(data, request)
+                return Response(data)
+
+            try:
+                response = view(request, *args, **kwargs)
+                if leader and response.status_code == 200:
+                    _store_dashboard_entry(client, key, current, response.data)
+            finally:
+                if leader:
+                    try:
+                        client.delete(f"{key}:lock")
+                    except redis.RedisError:
+                        pass
+            return response
+        return wrapped
+    return decorator
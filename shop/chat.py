@@ -2,6 +2,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
+from project.http_client import get_session
 import requests
 import json
 import time
@@ -39,10 +40,9 @@ class ChatView(APIView):
 
         # Call AI SERVER
         try:
-            ai_response_raw = requests.post(
-                "https://ai.orderwithpluto.com/chat",
+            ai_response_raw = get_session('ai').post(
+                settings.AI_SERVER_URL,
                 json={"thread_id": thread_id, "message": message},
-                timeout=100
             )
             ai_response_raw.raise_for_status()
 
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import datetime, timezone
+
+import redis
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import CATALOG_MODIFIED_KEY, catalog_version, get_redis
+
+
+def queryset_validators(queryset):
+    # MAX(updated_at) moves on every edit, the row count catches deletes
+    agg = queryset.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return f"{agg['last_modified']}|{agg['count']}", agg['last_modified']
+
+
+def catalog_validators():
+    version = catalog_version()
+    if version is None:
+        from .models import Product
+        return queryset_validators(Product.objects.all())
+    try:
+        modified = get_redis().get(CATALOG_MODIFIED_KEY)
+    except redis.RedisError:
+        modified = None
+    last_modified = datetime.fromtimestamp(int(modified), tz=timezone.utc) if modified else None
+    return f"catalog:{version}", last_modified
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 when the client's ETag/Last-Modified still match and
+    mark the response as publicly cacheable.
+
+    Views override get_validators() to return (seed, last_modified). It must
+    be cheap and must not serialize the payload. Without validators every
+    GET is answered in full.
+    """
+    cache_max_age = None
+
+    def get_validators(self, request, *args, **kwargs):
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        seed, last_modified = self.get_validators(request, *args, **kwargs)
+        # The query string (search, cursor, ...) changes the body too
+        etag = quote_etag(hashlib.md5(f"{seed}|{request.get_full_path()}".encode()).hexdigest()) if seed is not None else None
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = None
+        if etag or last_modified:
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            if etag:
+                response.headers.setdefault('ETag', etag)
+            if last_modified:
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            max_age = self.cache_max_age if self.cache_max_age is not None else settings.PUBLIC_CACHE_MAX_AGE
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
@@ -0,0 +1,129 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _param_names(params, key):
+    return {name.strip() for name in params.get(key, '').split(',') if name.strip()}
+
+
+def sparse_options(request):
+    """
+    (fields, omit, expand) requested in the query string, or None when the
+    client didn't ask for anything. Only read requests can be shaped.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = request.query_params
+    options = (_param_names(params, 'fields'), _param_names(params, 'omit'), _param_names(params, 'expand'))
+    return options if any(options) else None
+
+
+def wants_field(name, options):
+    fields, omit, expand = options
+    if name in omit:
+        return False
+    return not fields or name in fields or name in expand
+
+
+class SparseFieldsetMixin:
+    """
+    ModelSerializer mixin for ?fields=a,b / ?omit=c / ?expand=d.
+
+    Fields that were not requested are never built, so an unrequested
+    nested serializer costs nothing. Meta.expandable_fields maps a field
+    name to (serializer class or dotted path, kwargs); those fields are
+    only added (or replace the plain field) when named in ?expand=.
+    Only the top-level serializer of a response is shaped.
+    """
+
+    def _sparse_options(self):
+        if not hasattr(self, '_cached_sparse_options'):
+            parent = self.parent
+            is_root = parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+            self._cached_sparse_options = sparse_options(self.context.get('request')) if is_root else None
+        return self._cached_sparse_options
+
+    def get_fields(self):
+        options = self._sparse_options()
+        if options is None:
+            return super().get_fields()
+
+        # Shadow the class-level declared fields so the unrequested ones are
+        # not even deep-copied
+        self._declared_fields = {
+            name: field for name, field in type(self)._declared_fields.items() if wants_field(name, options)
+        }
+        fields = super().get_fields()
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, (serializer_class, kwargs) in expandable.items():
+            if name in options[2] and wants_field(name, options):
+                if isinstance(serializer_class, str):
+                    serializer_class = import_string(serializer_class)
+                fields[name] = serializer_class(**kwargs)
+        return fields
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        options = self._sparse_options()
+        if options is None:
+            return names
+        return [name for name in names if wants_field(name, options)]
+
+
+def selected_columns(serializer, model):
+    """
+    Model columns the serializer's fields need, or None when that can't be
+    worked out (e.g. a method field without Meta.method_field_columns).
+    """
+    method_columns = getattr(getattr(serializer, 'Meta', None), 'method_field_columns', {})
+    columns = {model._meta.pk.name}
+    for name, field in serializer.fields.items():
+        if name in method_columns:
+            columns.update(method_columns[name])
+            continue
+        if field.source == '*':
+            return None
+        attr = field.source.split('.')[0]
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        if model_field.concrete:
+            columns.add(attr)
+    # Ordering and the keyset paginator (created_at) read these
+    for ordering in model._meta.ordering:
+        columns.add(ordering.lstrip('-'))
+    if any(field.name == 'created_at' for field in model._meta.concrete_fields):
+        columns.add('created_at')
+    return columns
+
+
+class SparseFieldsetViewMixin:
+    """
+    Pushes ?fields= / ?omit= down into the queryset with .only() and only
+    prefetches the relations (sparse_prefetch) whose fields are rendered.
+    """
+    sparse_prefetch = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        serializer = self.get_serializer()
+        for name, lookup in self.sparse_prefetch.items():
+            if name in serializer.fields:
+                queryset = queryset.prefetch_related(lookup)
+
+        if sparse_options(self.request) is None:
+            return queryset
+        columns = selected_columns(serializer, queryset.model)
+        # A relation can't be both deferred and joined by select_related();
+        # select_related() with no arguments joins every non-null one
+        joined = queryset.query.select_related
+        if columns and joined is not True:
+            queryset = queryset.only(*columns, *(joined or ()))
+        return queryset
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.http.request import RawPostDataException
+from rest_framework.response import Response
+
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_KEY = 'idempotency:{scope}:{user}:{key}'
+# How long an in-flight marker lives if its request dies without finishing
+IN_FLIGHT_TIMEOUT = 30
+# How long a duplicate waits for the in-flight request before giving up
+DUPLICATE_WAIT = 10
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint(request):
+    try:
+        body = request.body
+    except RawPostDataException:
+        # The stream was already parsed, fall back to the parsed data
+        body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return hashlib.md5(request.method.encode() + b' ' + request.get_full_path().encode() + b'\n' + body).hexdigest()
+
+
+def _serialize(response):
+    if isinstance(response, Response):
+        return {'status': response.status_code, 'data': response.data}
+    return {
+        'status': response.status_code,
+        'content': response.content.decode(response.charset),
+        'content_type': response['Content-Type'],
+    }
+
+
+def _replay(stored):
+    if 'data' in stored:
+        response = Response(stored['data'], status=stored['status'])
+    else:
+        response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_result(client, key):
+    deadline = time.monotonic() + DUPLICATE_WAIT
+    while time.monotonic() < deadline:
+        raw = client.get(key)
+        if raw is None:
+            # The in-flight request failed and released the key
+            return None
+        entry = json.loads(raw)
+        if 'response' in entry:
+            return entry
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def idempotent(scope):
+    """
+    Honour an ``Idempotency-Key`` request header on a view: the first
+    response for a key is stored in Redis and replayed for every retry,
+    and a duplicate that arrives while the first is still running waits
+    for its result instead of doing the work again. Error responses (4xx
+    and 5xx) are not stored, so a corrected or later retry with the same key
+    runs again. Without the header, or without Redis, the view runs as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            idempotency_key = request.META.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return view(request, *args, **kwargs)
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return JsonResponse({'error': 'Idempotency-Key is too long'}, status=400)
+
+            user = request.user.pk if request.user.is_authenticated else 'anon'
+            key = IDEMPOTENCY_KEY.format(scope=scope, user=user, key=idempotency_key)
+            fingerprint = _fingerprint(request)
+            client = get_redis()
+            try:
+                claimed = client.set(key, json.dumps({'fingerprint': fingerprint}), nx=True, ex=IN_FLIGHT_TIMEOUT)
+                entry = None if claimed else _wait_for_result(client, key)
+            except redis.RedisError as e:
+                logger.warning(f"Idempotency store unavailable, handling request without it: {e}")
+                return view(request, *args, **kwargs)
+
+            if not claimed:
+                if entry is None:
+                    return JsonResponse(
+                        {'error': 'A request with this Idempotency-Key is still being processed'}, status=409
+                    )
+                if entry['fingerprint'] != fingerprint:
+                    return JsonResponse(
+                        {'error': 'Idempotency-Key was already used for a different request'}, status=422
+                    )
+                return _replay(entry['response'])
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                client.delete(key)
+                raise
+            try:
+                if response.status_code >= 400:
+                    client.delete(key)
+                else:
+                    entry = {'fingerprint': fingerprint, 'response': _serialize(response)}
+                    client.set(key, json.dumps(entry, cls=DjangoJSONEncoder), ex=settings.IDEMPOTENCY_KEY_TTL)
+            except redis.RedisError as e:
+                logger.warning(f"Could not store idempotent response for {key}: {e}")
+            return response
+        return wrapped
+    return decorator
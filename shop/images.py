@@ -0,0 +1,128 @@
+import logging
+import os
+from io import BytesIO
+
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes; images are only ever scaled down
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1600, 1600),
+}
+
+# Image fields that get variants. The generated paths are stored in a
+# JSONField named "<field>_variants" on the same model.
+VARIANT_SOURCES = {
+    'shop.product': 'image',
+    'shop.seller': 'image',
+    'accounts.customuser': 'profile_picture',
+    'accounts.sitestatus': 'poster',
+}
+
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'AVIF': 'avif', 'JPEG': 'jpg'}
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def output_format():
+    fmt = settings.IMAGE_VARIANT_FORMAT.upper()
+    if fmt in ('WEBP', 'AVIF') and features.check(fmt.lower()):
+        return fmt
+    return 'JPEG'
+
+
+def generate_variants(fieldfile):
+    storage = fieldfile.storage
+    dirname, filename = os.path.split(fieldfile.name)
+    stem = os.path.splitext(filename)[0]
+    fmt = output_format()
+
+    with fieldfile.open('rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha and fmt != 'JPEG' else 'RGB')
+
+    variants = {'source': fieldfile.name, 'format': fmt}
+    for name, size in IMAGE_VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail(size, Image.LANCZOS)
+        buffer = BytesIO()
+        variant.save(buffer, fmt, quality=80)
+        path = f"{dirname}/variants/{stem}_{name}.{FORMAT_EXTENSIONS[fmt]}"
+        if storage.exists(path):
+            storage.delete(path)
+        variants[name] = storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def variant_urls(instance, field_name, request=None):
+    """
+    URLs of every variant of an image field. Variants that haven't been
+    generated yet (or belong to a previous upload) fall back to the original.
+    """
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile:
+        return None
+    variants = getattr(instance, variants_field(field_name)) or {}
+    current = variants.get('source') == fieldfile.name
+    urls = {}
+    for name in IMAGE_VARIANTS:
+        url = fieldfile.storage.url(variants[name]) if current and variants.get(name) else fieldfile.url
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+@shared_task(ignore_result=True)
+def generate_image_variants(model_label, pk, field_name):
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    fieldfile = getattr(instance, field_name)
+    variants = generate_variants(fieldfile) if fieldfile else {}
+
+    # Only store them if the image wasn't replaced in the meantime
+    if fieldfile:
+        unchanged = Q(**{field_name: fieldfile.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    model.objects.filter(unchanged, pk=pk).update(
+        **{variants_field(field_name): variants, 'updated_at': timezone.now()}
+    )
+    if model_label == 'shop.product':
+        from .cache import invalidate_catalog
+        invalidate_catalog()
+
+
+def queue_image_variants(sender, instance, **kwargs):
+    field_name = VARIANT_SOURCES[sender._meta.label_lower]
+    fieldfile = getattr(instance, field_name)
+    variants = getattr(instance, variants_field(field_name)) or {}
+    if (fieldfile.name or None) == variants.get('source'):
+        return
+    if not fieldfile and not variants:
+        return
+
+    def enqueue():
+        try:
+            generate_image_variants.delay(sender._meta.label_lower, instance.pk, field_name)
+        except OperationalError as e:
+            logger.warning(f"Could not queue image variants for {sender._meta.label} {instance.pk}: {e}")
+
+    transaction.on_commit(enqueue)
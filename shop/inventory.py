@@ -0,0 +1,185 @@
+import logging
+from collections import defaultdict
+
+import redis
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .models import Order, OrderDetail, Product
+from .stock_ledger import drop_holds, forget_available, hold_stock, release_holds
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Insufficient stock for product {product_id} (requested {requested})")
+
+
+def line_quantities(lines):
+    """
+    Sum (product, quantity) pairs into {product_id: quantity}.
+    """
+    quantities = defaultdict(int)
+    for product, quantity in lines:
+        quantities[product.pk if isinstance(product, Product) else product] += quantity
+    return dict(quantities)
+
+
+def reserve_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` out of stock, all or nothing.
+
+    Each product is a single conditional UPDATE (stock >= quantity), so two
+    checkouts can never both take the last unit. Must run inside
+    transaction.atomic() so a later shortfall rolls back earlier lines.
+    """
+    now = timezone.now()
+    # Always touch rows in the same order so concurrent checkouts can't deadlock
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+            stock=F('stock') - quantity, updated_at=now
+        )
+        if not updated:
+            raise InsufficientStock(product_id, quantity)
+    # Queryset updates skip post_save, so invalidate the catalog by hand
+    invalidate_catalog()
+    forget_available(list(quantities))
+
+
+def order_quantities(order_ids):
+    """
+    Units per product across the given orders, as {product_id: quantity}.
+    """
+    rows = (
+        OrderDetail.objects.filter(order_id__in=order_ids)
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+    )
+    return {row['product_id']: row['units'] for row in rows if row['units']}
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def restore_stock(quantities):
+    """
+    Put ``{product_id: quantity}`` back into stock with a single UPDATE.
+    """
+    quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') + _per_product(quantities), updated_at=timezone.now()
+    )
+    invalidate_catalog()
+    forget_available(list(quantities))
+
+
+def take_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` of paid orders out of stock with a single
+    UPDATE, never below zero. The units were already held in the stock
+    ledger, so its counters don't change.
+    """
+    quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=Greatest(F('stock') - _per_product(quantities), Value(0)), updated_at=timezone.now()
+    )
+    invalidate_catalog()
+
+
+def adjust_stock(product_id, delta):
+    """
+    Add ``delta`` (negative to take) to a product's stock, never below zero.
+    Used for admin edits of existing lines, which don't fail on shortfall.
+    """
+    if not delta:
+        return
+    Product.objects.filter(pk=product_id).update(
+        stock=Greatest(F('stock') + delta, Value(0)), updated_at=timezone.now()
+    )
+    invalidate_catalog()
+    forget_available([product_id])
+
+
+def reserve_order_stock(order, quantities):
+    """
+    Reserve the stock of a new, saved order: a hold in the Redis stock
+    ledger for orders created as held, otherwise (or when Redis is down)
+    straight from Product.stock. Must run inside transaction.atomic(), last,
+    so nothing after it can roll the order back while its hold stays in Redis.
+    """
+    if order.stock_state == Order.STOCK_HELD:
+        try:
+            hold_stock(order.pk, quantities)
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Stock ledger unavailable, reserving order {order.pk} in the database: {e}")
+            Order.objects.filter(pk=order.pk).update(stock_state=Order.STOCK_COMMITTED)
+            order.stock_state = Order.STOCK_COMMITTED
+    reserve_stock(quantities)
+
+
+def commit_order_stock(order_ids):
+    """
+    Move the stock of paid or fulfilled orders from their ledger holds into
+    Product.stock. Orders that aren't held are left alone. Returns how many
+    were committed.
+    """
+    with transaction.atomic():
+        held = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, stock_state=Order.STOCK_HELD)
+            .values_list('pk', flat=True)
+        )
+        if not held:
+            return 0
+        Order.objects.filter(pk__in=held).update(stock_state=Order.STOCK_COMMITTED)
+        take_stock(order_quantities(held))
+        drop_holds(held)
+    return len(held)
+
+
+def commit_settled_holds():
+    """
+    Commit the holds of orders that should have taken their stock already
+    (see Order.takes_stock), e.g. ones fulfilled before that was handled.
+    """
+    settled = (
+        Order.objects.filter(stock_state=Order.STOCK_HELD)
+        .exclude(status='Cancelled')
+        .filter(Q(payment_status='Paid') | ~Q(status='Pending'))
+    )
+    return commit_order_stock(list(settled.values_list('pk', flat=True)))
+
+
+def release_order_stock(order_ids):
+    """
+    Give back the stock of cancelled orders, whether it was taken from
+    Product.stock or only held in the ledger. Orders already released are
+    skipped, so stock is never given back twice.
+    """
+    with transaction.atomic():
+        states = dict(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, stock_state__in=[Order.STOCK_COMMITTED, Order.STOCK_HELD])
+            .values_list('pk', 'stock_state')
+        )
+        if not states:
+            return
+        Order.objects.filter(pk__in=states).update(stock_state=Order.STOCK_RELEASED)
+        restore_stock(order_quantities([pk for pk, state in states.items() if state == Order.STOCK_COMMITTED]))
+        release_holds([pk for pk, state in states.items() if state == Order.STOCK_HELD])
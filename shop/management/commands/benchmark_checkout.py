@@ -0,0 +1,131 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+
+from shop.models import Order, OrderDetail, Product
+from shop.serializers import OrderSerializer
+
+BENCH_PREFIX = 'bench-checkout-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark order creation: queries per order, sequential and parallel '
+        'throughput, and an oversell check. Creates and then deletes its own '
+        'products and orders in the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--lines', type=int, default=5, help='line items per order')
+        parser.add_argument('--orders', type=int, default=200, help='orders in the sequential run')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--parallel-orders', type=int, default=400)
+        parser.add_argument('--hot-stock', type=int, default=100,
+                            help='stock of the contended products in the parallel run')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        try:
+            self.sequential(options)
+            self.parallel(options)
+        finally:
+            self.cleanup()
+
+    def make_products(self, count, stock):
+        return Product.objects.bulk_create([
+            Product(name=f'{BENCH_PREFIX}{i}', price=self.rng.randint(1, 50), stock=stock)
+            for i in range(count)
+        ])
+
+    def order_payload(self, product_ids, lines):
+        return {
+            'customer_name': 'Bench Customer',
+            'email': 'bench@example.com',
+            'phone_number': '0000000000',
+            'address': 'Bench street 1',
+            'order_details': [
+                {'product': pk, 'quantity': self.rng.randint(1, 3)}
+                for pk in self.rng.sample(product_ids, min(lines, len(product_ids)))
+            ],
+        }
+
+    def place_order(self, payload):
+        serializer = OrderSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def sequential(self, options):
+        products = self.make_products(options['products'], stock=10 ** 6)
+        ids = [p.pk for p in products]
+        payloads = [self.order_payload(ids, options['lines']) for _ in range(options['orders'])]
+
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for payload in payloads:
+                self.place_order(payload)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Sequential checkout'))
+        self.stdout.write(f"  orders:            {len(payloads)} x {options['lines']} lines")
+        self.stdout.write(f"  queries per order: {len(queries) / len(payloads):.1f}")
+        self.stdout.write(f"  throughput:        {len(payloads) / elapsed:.1f} orders/s")
+
+    def parallel(self, options):
+        products = self.make_products(max(2, options['lines']), stock=options['hot_stock'])
+        ids = [p.pk for p in products]
+        initial = {p.pk: p.stock for p in products}
+        payloads = [self.order_payload(ids, options['lines']) for _ in range(options['parallel_orders'])]
+
+        def worker(payload):
+            try:
+                self.place_order(payload)
+                return 'ok'
+            except ValidationError:
+                return 'out_of_stock'
+            except Exception:
+                return 'error'
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(worker, payloads))
+        elapsed = time.perf_counter() - start
+
+        final = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'stock'))
+        lines = OrderDetail.objects.filter(product_id__in=ids)
+        sold = dict(
+            lines.values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        # Orders held in the stock ledger haven't touched Product.stock yet
+        committed = dict(
+            lines.filter(order__stock_state=Order.STOCK_COMMITTED).values('product_id')
+            .annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        oversold = [
+            pk for pk in ids
+            if sold.get(pk, 0) > initial[pk] or initial[pk] - final[pk] != committed.get(pk, 0)
+        ]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Parallel checkout ({options['threads']} threads, hot products)"))
+        self.stdout.write(f"  placed:        {results.count('ok')}")
+        self.stdout.write(f"  out of stock:  {results.count('out_of_stock')}")
+        self.stdout.write(f"  errors:        {results.count('error')}")
+        self.stdout.write(f"  throughput:    {len(results) / elapsed:.1f} requests/s")
+        if oversold:
+            self.stdout.write(self.style.ERROR(f"  stock mismatch on products {oversold}"))
+        else:
+            self.stdout.write(self.style.SUCCESS('  no oversell: stock taken matches units ordered'))
+
+    def cleanup(self):
+        bench = Product.objects.filter(name__startswith=BENCH_PREFIX)
+        Order.objects.filter(pk__in=OrderDetail.objects.filter(product__in=bench).values('order_id')).delete()
+        bench.delete()
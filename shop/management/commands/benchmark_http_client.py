@@ -0,0 +1,138 @@
+import datetime
+import json
+import os
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from project.http_client import build_session
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive needs HTTP/1.1 and an explicit Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this, Nagle plus delayed
+    # ACKs add ~40 ms to every reused connection
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'reply': 'ok'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def self_signed_certificate(directory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'stub.pem')
+    key_path = os.path.join(directory, 'stub.key')
+    with open(cert_path, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare a fresh connection per request (bare requests.post) with the '
+        'pooled sessions of project.http_client against a local stub server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--no-tls', action='store_true', help='plain HTTP instead of a self-signed TLS stub')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            server = ThreadingHTTPServer(('localhost', 0), StubHandler)
+            server.daemon_threads = True
+            verify = True
+            scheme = 'http'
+            if not options['no_tls']:
+                cert_path, key_path = self_signed_certificate(directory)
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+                context.load_cert_chain(cert_path, key_path)
+                server.socket = context.wrap_socket(server.socket, server_side=True)
+                verify = cert_path
+                scheme = 'https'
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f'{scheme}://localhost:{server.server_address[1]}/chat'
+
+            try:
+                session = build_session('ai')
+                runs = {
+                    'fresh connection': lambda: requests.post(url, json={'message': 'hi'}, verify=verify, timeout=10),
+                    # verify is passed per call: REQUESTS_CA_BUNDLE would override session.verify
+                    'pooled session': lambda: session.post(url, json={'message': 'hi'}, verify=verify),
+                }
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"{options['requests']} POSTs to a local {scheme} stub, {options['threads']} threads"
+                ))
+                for label, call in runs.items():
+                    self.report(label, self.run(call, options))
+                session.close()
+            finally:
+                server.shutdown()
+
+    def run(self, call, options):
+        def timed(_):
+            start = time.perf_counter()
+            call().raise_for_status()
+            return (time.perf_counter() - start) * 1000
+
+        # Warm up (and open the pool) before measuring
+        for _ in range(options['threads']):
+            timed(None)
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            start = time.perf_counter()
+            samples = list(pool.map(timed, range(options['requests'])))
+            elapsed = time.perf_counter() - start
+        return samples, elapsed
+
+    def report(self, label, result):
+        samples, elapsed = result
+        self.stdout.write(
+            f"  {label:<17} p50 {percentile(samples, 50):6.2f} ms   p99 {percentile(samples, 99):6.2f} ms   "
+            f"mean {statistics.mean(samples):6.2f} ms   {len(samples) / elapsed:7.1f} req/s"
+        )
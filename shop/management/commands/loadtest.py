@@ -0,0 +1,336 @@
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.perf_testing import FAKE_STRIPE_KEY, FAKE_WEBHOOK_SECRET, signed_webhook, start_fake_server
+
+DEFAULT_MIX = 'browse=55,search=15,checkout=15,webhook=10,chat=5'
+CHAT_MESSAGES = [
+    'Which moisturizer suits oily skin?', 'How much water should I drink today?',
+    'What helps with dry lips?', 'Do you have anything for sensitive skin?',
+]
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in Command.flows:
+            raise CommandError(f"Unknown flow {name!r}, expected one of {', '.join(Command.flows)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight for {name}: {weight!r}')
+    if not any(mix.values()):
+        raise CommandError('--mix needs at least one positive weight')
+    return mix
+
+
+def percentile(ordered, pct):
+    # Nearest rank on an already sorted list
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class Stats:
+    """
+    Latencies and outcomes per endpoint, shared by the worker threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, elapsed, status, error):
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            self.statuses[label][str(status)] += 1
+            if error:
+                self.errors[label] += 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for label in sorted(self.latencies):
+            ordered = sorted(self.latencies[label])
+            endpoints[label] = {
+                'requests': len(ordered),
+                'errors': self.errors[label],
+                'error_rate': round(self.errors[label] / len(ordered), 4),
+                'throughput': round(len(ordered) / duration, 2),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+                **{f'p{pct}_ms': round(percentile(ordered, pct) * 1000, 2) for pct in PERCENTILES},
+                'max_ms': round(ordered[-1] * 1000, 2),
+                'statuses': dict(self.statuses[label]),
+            }
+        requests_total = sum(e['requests'] for e in endpoints.values())
+        errors_total = sum(e['errors'] for e in endpoints.values())
+        everything = sorted(latency for latencies in self.latencies.values() for latency in latencies)
+        total = {
+            'requests': requests_total,
+            'errors': errors_total,
+            'error_rate': round(errors_total / requests_total, 4) if requests_total else 0,
+            'throughput': round(requests_total / duration, 2),
+            **{f'p{pct}_ms': round((percentile(everything, pct) or 0) * 1000, 2) for pct in PERCENTILES},
+        }
+        return total, endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running server (runserver, gunicorn) with a weighted mix of '
+        'catalog browsing, search, checkout, Stripe webhook deliveries and '
+        'chat, then report throughput, p50/p95/p99 latency and error rate per '
+        'endpoint. Stripe and the AI server are replaced by a local stub '
+        'started by this command; start the server with the environment it '
+        'prints. Load the database first, e.g. with generate_load_data.'
+    )
+    flows = ('browse', 'search', 'checkout', 'webhook', 'chat')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+        parser.add_argument('--concurrency', type=int, default=8, help='simulated users making requests back to back')
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help=f'relative weights of the flows (default {DEFAULT_MIX})')
+        parser.add_argument('--catalog-pages', type=int, default=5,
+                            help='pages of 100 products to pick from when browsing and ordering')
+        parser.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+        parser.add_argument('--stub-host', default='127.0.0.1')
+        parser.add_argument('--stub-port', type=int, default=8765)
+        parser.add_argument('--stub-latency', type=float, default=0,
+                            help='milliseconds the Stripe/AI stub waits before answering')
+        parser.add_argument('--no-stub', action='store_true',
+                            help="don't start the stub, the server is already pointed at one")
+        parser.add_argument('--webhook-secret', default=FAKE_WEBHOOK_SECRET,
+                            help="the server's STRIPE_WEBHOOK_SECRET, to sign webhook deliveries")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--report', help='write the results as JSON to this path')
+        parser.add_argument('--compare', help='a previous --report to print the changes against')
+
+    def handle(self, *args, **options):
+        if isinstance(options['mix'], str):
+            options['mix'] = parse_mix(options['mix'])
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive')
+        self.options = options
+        self.api = options['base_url'].rstrip('/') + '/api/'
+        self.stats = Stats()
+        # Orders placed by the checkout flow, waiting for their payment webhook
+        self.unpaid = deque(maxlen=10000)
+        self.thread_ids = itertools.count()
+        self.run_id = uuid.uuid4().hex[:8]
+
+        stub = None
+        if not options['no_stub']:
+            stub = start_fake_server(options['stub_host'], options['stub_port'], options['stub_latency'] / 1000)
+            stub_url = f"http://{options['stub_host']}:{stub.server_address[1]}"
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Stripe/AI stub listening on {stub_url}'))
+            self.stdout.write('  The server under test has to run with:')
+            self.stdout.write(
+                f'  STRIPE_API_BASE={stub_url} STRIPE_SECRET_KEY={FAKE_STRIPE_KEY} '
+                f"STRIPE_WEBHOOK_SECRET={options['webhook_secret']} AI_SERVER_URL={stub_url}/chat"
+            )
+
+        try:
+            self.products = self.load_catalog()
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Running {options['concurrency']} users for {options['duration']:g}s against {self.api}"
+            ))
+            started_at = datetime.now(dt_timezone.utc)
+            start = time.perf_counter()
+            deadline = start + options['duration']
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                for future in [pool.submit(self.user, number, deadline) for number in range(options['concurrency'])]:
+                    future.result()
+            elapsed = time.perf_counter() - start
+        finally:
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+
+        total, endpoints = self.stats.summary(elapsed)
+        report = {
+            'started_at': started_at.isoformat(),
+            'elapsed': round(elapsed, 2),
+            'options': {
+                name: options[name]
+                for name in ('base_url', 'duration', 'concurrency', 'mix', 'seed', 'stub_latency')
+            },
+            'stub_calls': len(stub.calls) if stub is not None else None,
+            'total': total,
+            'endpoints': endpoints,
+        }
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(report, json.load(f))
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['report']}")
+
+    def load_catalog(self):
+        """
+        (id, name) of the active, in-stock products on the first
+        ``--catalog-pages`` pages of the catalog, newest first.
+        """
+        session = requests.Session()
+        url = self.api + 'shop/products/'
+        params = {'cursor': '', 'page_size': 100, 'fields': 'id,name,stock,is_active'}
+        products = []
+        for _ in range(self.options['catalog_pages']):
+            try:
+                response = session.get(url, params=params, timeout=self.options['timeout'])
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise CommandError(f'Could not load the catalog from {url}: {e}')
+            page = response.json()
+            products += [(p['id'], p['name']) for p in page['results'] if p['stock'] > 0 and p['is_active']]
+            if not page['next']:
+                break
+            url, params = page['next'], None
+        if not products:
+            raise CommandError('No orderable products, load some data first (see generate_load_data)')
+        return products
+
+    def user(self, number, deadline):
+        rng = random.Random(self.options['seed'] * 1000 + number)
+        session = requests.Session()
+        names, weights = zip(*self.options['mix'].items())
+        while time.perf_counter() < deadline:
+            flow = rng.choices(names, weights)[0]
+            getattr(self, f'flow_{flow}')(session, rng)
+
+    def request(self, session, label, method, path, expect=(200,), check=None, **kwargs):
+        """
+        Time one request and return its JSON body (or None). Anything but an
+        ``expect``ed status, or a body ``check`` rejects, counts as an error.
+        """
+        start = time.perf_counter()
+        try:
+            response = session.request(method, self.api + path, timeout=self.options['timeout'], **kwargs)
+        except requests.RequestException as e:
+            self.stats.record(label, time.perf_counter() - start, type(e).__name__, error=True)
+            return None
+        elapsed = time.perf_counter() - start
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        error = response.status_code not in expect or (check is not None and not check(body))
+        self.stats.record(label, elapsed, response.status_code, error=error)
+        return None if error else body
+
+    def pick_product(self, rng):
+        # Skewed towards the first products, like real traffic
+        return self.products[min(int(rng.paretovariate(1.2)) - 1, len(self.products) - 1)]
+
+    def flow_browse(self, session, rng):
+        self.request(session, 'GET products/', 'get', 'shop/products/')
+        for _ in range(rng.randint(1, 3)):
+            product_id, _ = self.pick_product(rng)
+            self.request(session, 'GET products/<pk>/', 'get', f'shop/products/{product_id}/')
+        if rng.random() < 0.3:
+            self.request(session, 'GET best-sellers/', 'get', 'shop/best-sellers/')
+        if rng.random() < 0.2:
+            self.request(session, 'GET sellers/', 'get', 'shop/sellers/')
+
+    def flow_search(self, session, rng):
+        word = self.pick_product(rng)[1].split()[0]
+        for size in range(2, min(len(word), 4) + 1):
+            self.request(session, 'GET products/autocomplete/', 'get', 'shop/products/autocomplete/',
+                         params={'q': word[:size]})
+        self.request(session, 'GET products/?search', 'get', 'shop/products/', params={'search': word})
+
+    def flow_checkout(self, session, rng):
+        lines = {self.pick_product(rng)[0] for _ in range(rng.randint(1, 3))}
+        payload = {
+            'customer_name': 'Load Test', 'email': 'loadtest@load.example.com', 'phone_number': '01700000000',
+            'address': 'House 1, Road 1, Dhaka', 'payment_method': 'Card',
+            'order_details': [{'product': pk, 'quantity': 1} for pk in lines],
+        }
+        # Selling out is a normal outcome under load. An order placed without
+        # a checkout session means the server can't reach the Stripe stub.
+        body = self.request(session, 'POST orders/', 'post', 'shop/orders/', expect=(201, 400), json=payload,
+                            headers={'Idempotency-Key': str(uuid.uuid4())}, check=self.checkout_ok)
+        if body is None or 'order_id' not in body:
+            return
+        self.unpaid.append(body['order_id'])
+        if rng.random() < 0.3:
+            # Customer comes back to the payment link
+            self.request(session, 'POST payment/<orderId>/', 'post', f"shop/payment/{body['order_id']}/")
+
+    @staticmethod
+    def checkout_ok(body):
+        if body and 'order_id' in body:
+            return body['payment'].get('success')
+        return 'Not enough stock' in str((body or {}).get('order_details'))
+
+    def flow_webhook(self, session, rng):
+        try:
+            order_id = self.unpaid.popleft()
+        except IndexError:
+            return self.flow_checkout(session, rng)
+        payload, signature = signed_webhook({
+            'id': f'evt_load_{uuid.uuid4().hex}',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': f'cs_load_{order_id}', 'metadata': {'order_id': str(order_id)}}},
+        }, secret=self.options['webhook_secret'])
+        self.request(session, 'POST webhook/', 'post', 'shop/webhook/', data=payload,
+                     headers={'Content-Type': 'application/json', 'Stripe-Signature': signature})
+
+    def flow_chat(self, session, rng):
+        thread_id = f'loadtest-{self.run_id}-{next(self.thread_ids)}'
+        for _ in range(rng.randint(1, 3)):
+            self.request(session, 'POST chat/', 'post', 'chat/',
+                         json={'thread_id': thread_id, 'message': rng.choice(CHAT_MESSAGES)})
+        self.request(session, 'GET chat/history/<thread_id>/', 'get', f'chat/history/{thread_id}/')
+
+    def print_report(self, report):
+        total = report['total']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{total['requests']} requests in {report['elapsed']}s: {total['throughput']} req/s, "
+            f"p50 {total['p50_ms']}ms, p95 {total['p95_ms']}ms, p99 {total['p99_ms']}ms, "
+            f"{total['error_rate']:.2%} errors"
+        ))
+        self.stdout.write(f"  {'endpoint':<32} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+        for label, e in report['endpoints'].items():
+            line = (
+                f"  {label:<32} {e['requests']:>7} {e['throughput']:>8} {e['p50_ms']:>8} {e['p95_ms']:>8} "
+                f"{e['p99_ms']:>8} {e['error_rate']:>7.1%}"
+            )
+            self.stdout.write(self.style.ERROR(line) if e['errors'] else line)
+
+    def print_comparison(self, report, baseline):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with the run of {baseline['started_at']}"))
+        self.stdout.write(f"  {'endpoint':<32} {'req/s':>24} {'p95':>26} {'errors':>16}")
+        rows = [('total', report['total'], baseline['total'])] + [
+            (label, e, baseline['endpoints'][label])
+            for label, e in report['endpoints'].items() if label in baseline['endpoints']
+        ]
+        for label, now, before in rows:
+            self.stdout.write(
+                f"  {label:<32} {self.change(now['throughput'], before['throughput']):>24} "
+                f"{self.change(now['p95_ms'], before['p95_ms']):>26} "
+                f"{before['error_rate']:>7.1%} -> {now['error_rate']:.1%}"
+            )
+
+    def change(self, now, before):
+        if not before:
+            return f'{before} -> {now}'
+        return f'{before} -> {now} ({(now - before) / before:+.0%})'
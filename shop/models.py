@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
@@ -7,10 +8,40 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
+class TrackedFieldsMixin:
+    """
+    Remembers the database values of ``tracked_fields`` (attnames) when a row
+    is loaded, so save() can see what changed without reading the row again.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked()
+        return instance
+
+    def _remember_tracked(self):
+        self._loaded_values = {
+            name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__
+        }
+
+    def loaded_values(self, *names):
+        """
+        Values of ``names`` as last loaded/saved. Falls back to one query when
+        the instance wasn't loaded from the database or they were deferred.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        if all(name in loaded for name in names):
+            return tuple(loaded[name] for name in names)
+        return type(self)._base_manager.filter(pk=self.pk).values_list(*names).get()
+
+
 class Seller(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='sellers/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -22,6 +53,7 @@ class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     stock = models.PositiveIntegerField(default=0)
     uom = models.CharField(max_length=20, choices=Choices_UOM, default='pcs')
@@ -33,15 +65,30 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='shop_product_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
     
     
-class Order(models.Model):
+class Order(TrackedFieldsMixin, models.Model):
     ORDER_STATUS_CHOICES = [('Pending', 'Pending'),('Processing', 'Processing'),('Shipped', 'Shipped'),('Completed', 'Completed'),('Cancelled', 'Cancelled'),]
     PAYMENT_METHOD_CHOICES = [('COD', 'Cash on Delivery'),('Card', 'Card Payment'),('Online', 'Online Payment'),]
     PAYMENT_STATUS_CHOICES = [('Pending', 'Pending'),('Paid', 'Paid'),('Failed', 'Failed'),]
+    # Allowed status changes: forward through fulfilment, or cancel from anywhere
+    STATUS_TRANSITIONS = {
+        'Pending': {'Processing', 'Cancelled'},
+        'Processing': {'Shipped', 'Cancelled'},
+        'Shipped': {'Completed', 'Cancelled'},
+        'Completed': {'Cancelled'},
+        'Cancelled': set(),
+    }
+    # Where the order's stock currently is: taken from Product.stock, held in
+    # the Redis stock ledger until payment, or given back after cancellation
+    STOCK_COMMITTED, STOCK_HELD, STOCK_RELEASED = 'committed', 'held', 'released'
+    STOCK_STATE_CHOICES = [(STOCK_COMMITTED, 'Committed'),(STOCK_HELD, 'Held'),(STOCK_RELEASED, 'Released'),]
     
     customer_name = models.CharField(max_length=200)
     email = models.EmailField()
@@ -54,58 +101,139 @@ class Order(models.Model):
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, default='Card')
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='Pending')
     stripe_payment_intent = models.CharField(max_length=255, blank=True, null=True)
+    # Open Stripe checkout session, reused until it expires or the amount changes
+    stripe_checkout_session_id = models.CharField(max_length=255, blank=True, null=True)
+    stripe_checkout_url = models.URLField(max_length=1000, blank=True, null=True)
+    stripe_checkout_expires_at = models.DateTimeField(blank=True, null=True)
+    stripe_checkout_amount = models.PositiveIntegerField(blank=True, null=True)
+    stock_state = models.CharField(max_length=10, choices=STOCK_STATE_CHOICES, default=STOCK_COMMITTED, editable=False)
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='shop_order_created_id_idx'),
+            # Only the few orders still held in the stock ledger
+            models.Index(fields=['stock_state'], condition=Q(stock_state='held'), name='shop_order_held_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.id} by {self.customer_name}'
+
+    @classmethod
+    def can_transition(cls, old_status, new_status):
+        return old_status == new_status or new_status in cls.STATUS_TRANSITIONS.get(old_status, ())
+
+    @staticmethod
+    def takes_stock(status, payment_status):
+        # Held stock moves into Product.stock once the order is paid or is
+        # being fulfilled (COD orders are only paid on delivery)
+        return payment_status == 'Paid' or status not in ('Pending', 'Cancelled')
     
     
+    tracked_fields = ('status', 'payment_status')
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_instance = Order.objects.get(pk=self.pk)
-            if old_instance.status != "Cancelled" and self.status == "Cancelled":
-                for item in self.order_details.all():
-                    item.product.stock += item.quantity
-                    item.product.save()
-        super().save(*args, **kwargs)
+        from .inventory import commit_order_stock, release_order_stock
+
+        with transaction.atomic():
+            if self.pk:
+                old_status, old_payment_status = self.loaded_values('status', 'payment_status')
+                if old_status != "Cancelled" and self.status == "Cancelled":
+                    release_order_stock([self.pk])
+                    self.stock_state = self.STOCK_RELEASED
+                elif (
+                    # Orders are only ever created held, so one loaded as
+                    # anything else can't have a hold to commit
+                    self.stock_state == self.STOCK_HELD
+                    and (old_status, old_payment_status) != (self.status, self.payment_status)
+                    and self.takes_stock(self.status, self.payment_status)
+                ):
+                    if commit_order_stock([self.pk]):
+                        self.stock_state = self.STOCK_COMMITTED
+            super().save(*args, **kwargs)
+        self._remember_tracked()
     
     
-class OrderDetail(models.Model):
+class OrderDetail(TrackedFieldsMixin, models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_details')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
 
 
+    tracked_fields = ('product_id', 'quantity', 'price')
+
     def __str__(self):
-        return f'{self.quantity} of {self.product.name} in Order {self.order.id}'
+        return f'{self.quantity} of {self.product.name} in Order {self.order_id}'
 
     def save(self, *args, **kwargs):
-        # Check if updating existing instance
+        from .inventory import adjust_stock, commit_order_stock
+
         if self.pk:
-            old_instance = OrderDetail.objects.get(pk=self.pk)
-            diff = self.quantity - old_instance.quantity
-            self.product.stock = max(self.product.stock - diff, 0)
+            old_product_id, old_quantity, old_price = self.loaded_values('product_id', 'quantity', 'price')
         else:
-            # New instance, subtract quantity
-            self.product.stock = max(self.product.stock - self.quantity, 0)
+            old_product_id, old_quantity, old_price = self.product_id, 0, 0
 
-        self.product.save()
-        super().save(*args, **kwargs)
-        self.update_order_total()
+        with transaction.atomic():
+            # Editing a line of an order still held in the stock ledger takes
+            # its stock for good first, so the change below applies to Product.stock
+            commit_order_stock([self.order_id])
+            if old_product_id != self.product_id:
+                adjust_stock(old_product_id, old_quantity)
+                adjust_stock(self.product_id, -self.quantity)
+            else:
+                adjust_stock(self.product_id, old_quantity - self.quantity)
+            super().save(*args, **kwargs)
+            self.update_order_total(self.quantity * self.price - old_quantity * old_price)
+        self._remember_tracked()
 
     def delete(self, *args, **kwargs):
-        # Restore stock when deleting
-        self.product.stock += self.quantity
-        self.product.save()
-        super().delete(*args, **kwargs)
-
-    def update_order_total(self):
-        total = sum(item.quantity * item.price for item in self.order.order_details.all())
-        self.order.total = total
-        self.order.save(update_fields=['total'])
\ No newline at end of file
+        from .inventory import adjust_stock, commit_order_stock
+
+        with transaction.atomic():
+            commit_order_stock([self.order_id])
+            # Restore stock and take the line out of the order total
+            adjust_stock(self.product_id, self.quantity)
+            self.update_order_total(-self.quantity * self.price)
+            return super().delete(*args, **kwargs)
+
+    def update_order_total(self, delta):
+        # Apply the change in this line's amount in the database instead of
+        # re-summing every line of the order
+        if delta:
+            Order.objects.filter(pk=self.order_id).update(total=F('total') + delta)
+
+class DailySales(models.Model):
+    # Totals of the orders placed on each local day, maintained by shop.rollups
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    cancelled_orders = models.PositiveIntegerField(default=0)
+    paid_orders = models.PositiveIntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f'Sales on {self.date}'
+
+
+class DailyProductSales(models.Model):
+    # Units of a product in the non-cancelled orders placed on each local day
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='shop_dailyproductsales_date_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.units} of {self.product_id} on {self.date}'
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .inventory import commit_order_stock, release_order_stock
+from .models import Order, OrderDetail
+from .rollups import mark_orders_dirty
+
+# Lines of a page of orders in one query, with the product their
+# serializer (product_name) and __str__ read joined in
+ORDER_DETAILS_PREFETCH = Prefetch('order_details', queryset=OrderDetail.objects.select_related('product'))
+
+
+class InvalidTransition(Exception):
+    def __init__(self, rejected):
+        # {order_id: current status} of the orders that can't make the move
+        self.rejected = rejected
+        super().__init__(f"Invalid status transition for orders {sorted(rejected)}")
+
+
+def transition_orders(order_ids, status, partial=False):
+    """
+    Move ``order_ids`` to ``status`` with set-based updates, checking
+    Order.STATUS_TRANSITIONS. Unless ``partial``, a single order that can't
+    make the move rejects the whole batch (InvalidTransition); otherwise it
+    is skipped. Cancelling gives all the orders' stock back in bulk; moving
+    on to fulfilment commits the stock of orders still held in the ledger
+    (see Order.takes_stock). Returns the ids that changed status.
+    """
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update().filter(pk__in=order_ids).values_list('pk', 'status')
+        )
+        rejected = {pk: old for pk, old in current.items() if not Order.can_transition(old, status)}
+        if rejected and not partial:
+            raise InvalidTransition(rejected)
+
+        moving = [pk for pk, old in current.items() if old != status and pk not in rejected]
+        if not moving:
+            return []
+        if status == 'Cancelled':
+            release_order_stock(moving)
+        elif Order.takes_stock(status, 'Pending'):
+            commit_order_stock(moving)
+        # Queryset update: Order.save would re-read and release each order on its own
+        Order.objects.filter(pk__in=moving).update(status=status, updated_at=timezone.now())
+        mark_orders_dirty(moving)
+    return moving
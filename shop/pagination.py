@@ -0,0 +1,178 @@
+import base64
+import hashlib
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def approximate_count(queryset):
+    """
+    Cheap row estimate for a listing. On Postgres an unfiltered table uses the
+    planner statistics, everything else is an exact count cached for a while.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        # e.g. pk__in=[] from a search without hits, nothing to count
+        return 0
+    key = 'approx_count:' + hashlib.md5(sql.encode()).hexdigest()
+    try:
+        cached = settings.REDIS_CLIENT.get(key)
+        if cached is not None:
+            return int(cached)
+    except redis.RedisError:
+        pass
+    count = queryset.count()
+    try:
+        settings.REDIS_CLIENT.set(key, count, ex=settings.APPROXIMATE_COUNT_TTL)
+    except redis.RedisError:
+        pass
+    return count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (created_at, id), newest first.
+
+    Only used when the client sends ?cursor= (empty for the first page), so
+    existing clients keep getting the legacy paginator. Every page is a
+    single indexed range scan, no COUNT(*) and no OFFSET.
+
+    Listings the view (or a filter backend such as search relevance) already
+    ordered some other way keep that order and are paged by offset instead.
+    """
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'include_total'
+    ordering = ('-created_at', '-id')
+    legacy_pagination_class = PageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if self.cursor_query_param not in request.query_params:
+            if self.legacy_pagination_class is None:
+                return None
+            self.legacy = self.legacy_pagination_class()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.offset = None
+        if self.is_keyset_ordered(queryset):
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            self.offset = self.decode_offset(request)
+        self.total = None
+        if request.query_params.get(self.total_query_param) in ('1', 'true'):
+            self.total = approximate_count(queryset)
+
+        start = self.offset or 0
+        if self.offset is None:
+            position = self.decode_cursor(request)
+            if position is not None:
+                created_at, pk = position
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        page = list(queryset[start:start + self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def is_keyset_ordered(self, queryset):
+        # No explicit ordering, or one the keyset ordering refines
+        order_by = tuple(queryset.query.order_by)
+        return order_by == self.ordering[:len(order_by)]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(encoded.encode()).decode()
+            created_at, pk = decoded.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+        if created_at is None:
+            raise NotFound('Invalid cursor')
+        return created_at, pk
+
+    def decode_offset(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0
+        try:
+            kind, offset = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            offset = int(offset)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+        if kind != 'offset' or offset < 0:
+            raise NotFound('Invalid cursor')
+        return offset
+
+    def encode_cursor(self, instance):
+        if self.offset is not None:
+            raw = f"offset|{self.offset + self.page_size}"
+        else:
+            raw = f"{instance.created_at.isoformat()}|{instance.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(remove_query_param(url, self.cursor_query_param), self.cursor_query_param, '')
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        content = OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            content['approximate_total'] = self.total
+        return Response(content)
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    # For listings that were never paginated: no cursor, no pagination.
+    legacy_pagination_class = None
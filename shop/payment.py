@@ -1,63 +1,114 @@
-from venv import logger
+import logging
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import permissions
 from .models import Order
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from .idempotency import idempotent
+from .webhooks import claim_event, enqueue_event, forget_event
 import stripe
 import json
 import os
 
+logger = logging.getLogger(__name__)
+
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+# Lets load tests point the API at a stub (see the loadtest command)
+stripe.api_base = os.getenv('STRIPE_API_BASE', stripe.api_base)
 endpoint_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
 
 
+# Don't hand out a session that is about to expire
+CHECKOUT_EXPIRY_MARGIN = timedelta(minutes=2)
+
+
+def expire_checkout(session_id):
+    try:
+        stripe.checkout.Session.expire(session_id)
+    except stripe.error.InvalidRequestError:
+        # Already expired or completed
+        logger.info(f"Checkout session {session_id} was no longer open")
+
+
+def create_checkout(order):
+    """
+    Checkout URL for an unpaid order. The order's open Stripe session is
+    returned without a network call while it is valid and still for the
+    same amount; otherwise it is expired, so the customer can't pay the old
+    amount with it, and a new one is created and stored on the order.
+    """
+    amount_cents = int(order.total * 100)
+    if (
+        order.stripe_checkout_url
+        and order.stripe_checkout_amount == amount_cents
+        and order.stripe_checkout_expires_at
+        and order.stripe_checkout_expires_at > timezone.now() + CHECKOUT_EXPIRY_MARGIN
+    ):
+        return order.stripe_checkout_url
+
+    if (
+        order.stripe_checkout_session_id
+        and order.stripe_checkout_expires_at
+        and order.stripe_checkout_expires_at > timezone.now()
+    ):
+        expire_checkout(order.stripe_checkout_session_id)
+
+    checkout_session = stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{
+            'price_data': {
+                'currency': 'gbp',
+                'product_data': {'name': f'Order {order.id} Payment'},
+                'unit_amount': amount_cents,
+            },
+            'quantity': 1,
+        }],
+        mode='payment',
+        success_url='https://www.orderwithpluto.com/',
+        cancel_url='https://www.orderwithpluto.com/',
+        metadata={'order_id': order.id},
+    )
+
+    # Update order
+    order.payment_status = 'Pending'
+    order.stripe_payment_intent = checkout_session.payment_intent
+    order.stripe_checkout_session_id = checkout_session.id
+    order.stripe_checkout_url = checkout_session.url
+    order.stripe_checkout_expires_at = datetime.fromtimestamp(checkout_session.expires_at, tz=dt_timezone.utc)
+    order.stripe_checkout_amount = amount_cents
+    order.save(update_fields=[
+        'payment_status', 'stripe_payment_intent', 'stripe_checkout_session_id', 'stripe_checkout_url',
+        'stripe_checkout_expires_at', 'stripe_checkout_amount', 'updated_at',
+    ])
+    return checkout_session.url
+
+
+def order_payment_payload(order):
+    """
+    (body, status) of the payment response for ``order``.
+    """
+    # Already paid
+    if order.payment_status == 'Paid':
+        return {"success": False, "error": "Order already paid"}, 400
+    try:
+        return {'success': True, 'checkout_url': create_checkout(order)}, 200
+    except stripe.error.StripeError as e:
+        return {"success": False, "error": str(e)}, 400
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@idempotent('payment')
 def orderPayment(request, orderId):
     try:
         order = Order.objects.get(id=orderId)
-        amount_cents = int(order.total * 100)
-        
-        # Already paid
-        if order.payment_status == 'Paid':
-            return JsonResponse({"success": False, "error": "Order already paid"}, status=400)
-
-        # If payment is not paid 
-        if order.payment_status != 'Paid':
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'gbp',
-                        'product_data': {'name': f'Order {order.id} Payment'},
-                        'unit_amount': amount_cents,
-                    },
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url='https://www.orderwithpluto.com/',
-                cancel_url='https://www.orderwithpluto.com/',
-                metadata={'order_id': order.id},
-            )
-
-            # Update order
-            order.payment_status = 'Pending'
-            order.stripe_payment_intent = checkout_session.payment_intent
-            order.save()
-
-            return JsonResponse({
-                'success': True,
-                'checkout_url': checkout_session.url
-            })
-
-        # Fallback for any other cases
-        return JsonResponse({"success": False, "error": "Unable to create payment"}, status=400)
+        data, status = order_payment_payload(order)
+        return JsonResponse(data, status=status)
 
     except Order.DoesNotExist:
         return JsonResponse({"success": False, "error": "Order not found"}, status=404)
-    except stripe.error.StripeError as e:
-        return JsonResponse({"success": False, "error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
@@ -77,69 +128,16 @@ def paymentWebhook(request):
     except stripe.error.SignatureVerificationError: 
         return HttpResponse(status=400)  
 
-    try:
-        # Handle successful checkout session completion
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            order_id = session['metadata'].get('order_id')
-            
-            if order_id:
-                order = Order.objects.get(id=order_id)
-                order.payment_status = 'Paid'
-                order.save()
-            else:
-                logger.error("No order_id found in session metadata")
-
-        # Handle successful payment intent (backup for direct payment intents)
-        elif event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            
-            # Try to get order_id from payment intent metadata first
-            order_id = payment_intent['metadata'].get('order_id')
-            
-            # If not found, try to get it from the checkout session
-            if not order_id and payment_intent.get('invoice'):
-                try:
-                    # Get the checkout session associated with this payment intent
-                    sessions = stripe.checkout.Session.list(
-                        payment_intent=payment_intent['id'],
-                        limit=1
-                    )
-                    if sessions.data:
-                        order_id = sessions.data[0]['metadata'].get('order_id')
-                except Exception as e:
-                    logger.error(f"Error fetching checkout session: {e}")
-            
-            if order_id:
-                order = Order.objects.get(id=order_id)
-                order.payment_status = 'Paid'
-                order.save()
-            else:
-                logger.error("No order_id found in payment intent metadata")
-
-        # Handle failed payment
-        elif event['type'] == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            order_id = payment_intent['metadata'].get('order_id')
-            
-            if order_id:
-                order = Order.objects.get(id=order_id)
-                order.payment_status = 'Failed'
-                order.save()
-            else:
-                logger.error("No order_id found in failed payment intent metadata")
-
-        else:
-            logger.info(f"Unhandled event type: {event['type']}")
-
+    # Redelivered events are acknowledged without being applied again
+    if not claim_event(event['id']):
         return HttpResponse(status=200)
 
-    except Order.DoesNotExist:
-        logger.error(f"Order not found for order_id: {order_id}")
-        return HttpResponse("Order not found", status=404)
+    # The database work (and any Stripe lookups) happen in the worker
+    try:
+        enqueue_event(json.loads(payload))
     except Exception as e:
+        forget_event(event['id'])
         logger.error(f"Webhook processing error: {str(e)}")
         return HttpResponse(f"Error: {str(e)}", status=500)
 
-
-
+    return HttpResponse(status=200)
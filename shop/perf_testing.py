@@ -0,0 +1,330 @@
+"""
+Offline stand-ins for the services the API talks to (Redis, Stripe, the AI
+server, the Celery broker) and a harness that walks every route of a
+urlconf with query-count and (opt-in) wall-time budgets.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import stripe
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+FAKE_STRIPE_KEY = 'sk_test_fake'
+FAKE_WEBHOOK_SECRET = 'whsec_fake'
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """
+    Answers the Stripe API calls the shop makes and the AI server's chat
+    endpoint with canned, well-formed responses, after the server's
+    ``latency`` seconds.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    ids = itertools.count(1)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = urlsplit(self.path).path
+        if path == '/v1/checkout/sessions':
+            # Session.list(payment_intent=...): the intent's order id is in its metadata
+            return self.reply({'object': 'list', 'data': [], 'has_more': False, 'url': path})
+        self.reply({'error': {'message': f'No fake for GET {path}'}}, status=404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        path = urlsplit(self.path).path
+        self.server.calls.append(('POST', path))
+        if path == '/v1/checkout/sessions':
+            form = parse_qs(body.decode())
+            number = next(self.ids)
+            return self.reply({
+                'id': f'cs_test_{number}',
+                'object': 'checkout.session',
+                'url': f'https://checkout.stripe.test/c/pay/cs_test_{number}',
+                'payment_intent': f'pi_test_{number}',
+                'expires_at': int(time.time()) + 86400,
+                'metadata': {'order_id': form.get('metadata[order_id]', [''])[0]},
+            })
+        match = re.fullmatch(r'/v1/checkout/sessions/(\w+)/expire', path)
+        if match:
+            return self.reply({'id': match.group(1), 'object': 'checkout.session', 'status': 'expired'})
+        match = re.fullmatch(r'/v1/payment_intents/(\w+)/cancel', path)
+        if match:
+            return self.reply({'id': match.group(1), 'object': 'payment_intent', 'status': 'canceled'})
+        if path == '/chat':
+            message = json.loads(body or b'{}').get('message', '')
+            return self.reply({'reply': f'echo: {message}'})
+        self.reply({'error': {'message': f'No fake for POST {path}'}}, status=404)
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(host='127.0.0.1', port=0, latency=0):
+    """
+    Serve FakeServiceHandler from a background thread. The POSTs it
+    answered are recorded in ``server.calls``.
+    """
+    server = ThreadingHTTPServer((host, port), FakeServiceHandler)
+    server.daemon_threads = True
+    server.calls = []
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeServices:
+    """
+    Context manager that points the project at local fakes: an in-memory
+    Redis, an HTTP server standing in for Stripe and the AI server, and
+    Celery tasks run eagerly instead of going through the broker.
+    """
+    CELERY_CONF = {'task_always_eager': True, 'task_eager_propagates': True}
+
+    def __init__(self):
+        # From requirements-dev.txt; the loadtest command only needs the fake HTTP server
+        import fakeredis
+
+        self.redis = fakeredis.FakeStrictRedis(decode_responses=True)
+        self.server = None
+        self._patches = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    @property
+    def stripe_calls(self):
+        return self.server.calls
+
+    def __enter__(self):
+        from project.celery import app
+
+        self.server = start_fake_server()
+
+        self._patches = [
+            override_settings(REDIS_CLIENT=self.redis, AI_SERVER_URL=f'{self.url}/chat'),
+            mock.patch('shop.chat.redis_client', self.redis),
+            mock.patch.object(stripe, 'api_base', self.url),
+            mock.patch.object(stripe, 'api_key', FAKE_STRIPE_KEY),
+            mock.patch('shop.payment.endpoint_secret', FAKE_WEBHOOK_SECRET),
+        ]
+        for patch in self._patches:
+            patch.__enter__()
+        self._celery_conf = {name: getattr(app.conf, name) for name in self.CELERY_CONF}
+        app.conf.update(self.CELERY_CONF)
+        return self
+
+    def __exit__(self, *exc_info):
+        from project.celery import app
+
+        app.conf.update(self._celery_conf)
+        for patch in reversed(self._patches):
+            patch.__exit__(*exc_info)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        self.redis.flushall()
+        self.server.calls.clear()
+
+
+def signed_webhook(event, secret=FAKE_WEBHOOK_SECRET):
+    """
+    (payload, Stripe-Signature header) for delivering ``event`` to the
+    webhook endpoint.
+    """
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+
+class Endpoint:
+    """
+    One request against a route, with its budgets. ``kwargs``, ``data``,
+    ``query`` and ``headers`` may be callables taking the seeded fixtures.
+    ``user`` names a fixture attribute (or None for an anonymous request).
+    A ``content_type`` sends ``data`` as the raw body instead of encoding
+    it with ``format``.
+    """
+
+    def __init__(self, route, method='get', kwargs=None, data=None, query=None, user='admin', status=200,
+                 max_queries=None, max_ms=None, format='json', content_type=None, headers=None):
+        self.route = route
+        self.method = method
+        self.kwargs = kwargs
+        self.data = data
+        self.query = query
+        self.user = user
+        self.status = status
+        self.max_queries = max_queries
+        self.max_ms = max_ms
+        self.format = format
+        self.content_type = content_type
+        self.headers = headers
+
+    @property
+    def label(self):
+        return f'{self.method.upper()} {self.route}'
+
+    def resolve(self, value, fixtures):
+        return value(fixtures) if callable(value) else value
+
+    def path(self, prefix, fixtures):
+        kwargs = self.resolve(self.kwargs, fixtures) or {}
+        return prefix + re.sub(r'<(?:\w+:)?(\w+)>', lambda m: str(kwargs[m.group(1)]), self.route)
+
+
+# Fast hashing, so endpoints that set passwords measure the endpoint and not PBKDF2
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTestCase(TestCase):
+    """
+    Runs every Endpoint of ``endpoints`` against data seeded at each of
+    ``sizes`` and fails when a request runs more than its max_queries.
+
+    The query ceilings are the same at every size, so a per-row query shows
+    up as a failure at the larger sizes. Wall time (the fastest of
+    ``repeats`` runs) depends on the machine, so it is only checked on
+    request: set PERF_ENFORCE_TIME=1 to also fail past max_ms
+    (DEFAULT_MAX_MS by default, scaled by PERF_TIME_FACTOR). Set PERF_REPORT
+    to a path to write the measurements as JSON, and PERF_BASELINE to a
+    previous report from the same machine to also fail on regressions
+    against it (more queries, or PERF_TOLERANCE times slower).
+    """
+    urlconf = None
+    prefix = None
+    endpoints = []
+    sizes = (10, 100)
+    repeats = 3
+    DEFAULT_MAX_MS = 250
+    # Absolute slack on baseline comparisons, for very fast endpoints
+    BASELINE_SLACK_MS = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.services = FakeServices().__enter__()
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.services.__exit__(None, None, None)
+        report_path = os.getenv('PERF_REPORT')
+        if report_path and cls.results:
+            report = {}
+            if os.path.exists(report_path):
+                with open(report_path) as f:
+                    report = json.load(f)
+            report.update(cls.results)
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def seed(self, size):
+        """
+        Create ``size`` rows of each model the endpoints read and return an
+        object holding what the endpoints need (users, ids, ...). Seeds
+        nothing by default, which only suits anonymous endpoints without
+        path arguments.
+        """
+        return SimpleNamespace()
+
+    def test_every_route_has_a_budget(self):
+        routes = {str(pattern.pattern) for pattern in import_module(self.urlconf).urlpatterns}
+        covered = {endpoint.route for endpoint in self.endpoints}
+        self.assertEqual(routes - covered, set(), 'routes without an Endpoint budget')
+        self.assertEqual(covered - routes, set(), 'budgets for routes that no longer exist')
+
+    def test_endpoint_budgets(self):
+        baseline = self.load_baseline()
+        enforce_time = os.getenv('PERF_ENFORCE_TIME', '').lower() in ('1', 'true')
+        time_factor = float(os.getenv('PERF_TIME_FACTOR', '1'))
+        tolerance = float(os.getenv('PERF_TOLERANCE', '1.5'))
+        for size in self.sizes:
+            with transaction.atomic():
+                fixtures = self.seed(size)
+                for endpoint in self.endpoints:
+                    key = f'{self.urlconf} {endpoint.label} @{size}'
+                    with self.subTest(endpoint=endpoint.label, size=size):
+                        queries, elapsed = self.measure(endpoint, fixtures)
+                        self.results[key] = {'queries': queries, 'ms': round(elapsed, 2)}
+                        if endpoint.max_queries is not None:
+                            self.assertLessEqual(queries, endpoint.max_queries, f'{key}: query ceiling')
+                        if enforce_time:
+                            max_ms = (endpoint.max_ms or self.DEFAULT_MAX_MS) * time_factor
+                            self.assertLessEqual(elapsed, max_ms, f'{key}: time budget')
+                        previous = baseline.get(key)
+                        if previous:
+                            self.assertLessEqual(queries, previous['queries'], f'{key}: more queries than baseline')
+                            self.assertLessEqual(
+                                elapsed, previous['ms'] * tolerance + self.BASELINE_SLACK_MS,
+                                f"{key}: slower than baseline ({previous['ms']} ms)",
+                            )
+                transaction.set_rollback(True)
+
+    def measure(self, endpoint, fixtures):
+        timings = []
+        queries = 0
+        for _ in range(self.repeats):
+            # Each run sees the same data and a cold Redis
+            self.services.reset()
+            client = APIClient()
+            if endpoint.user:
+                # A fresh instance: an endpoint may change the user in memory (set_password)
+                user = getattr(fixtures, endpoint.user)
+                client.force_authenticate(type(user).objects.get(pk=user.pk))
+            path = endpoint.path(self.prefix, fixtures)
+            options = dict(endpoint.resolve(endpoint.headers, fixtures) or {})
+            if endpoint.method == 'get':
+                body = endpoint.resolve(endpoint.query, fixtures)
+            else:
+                body = endpoint.resolve(endpoint.data, fixtures)
+                if endpoint.content_type:
+                    options['content_type'] = endpoint.content_type
+                else:
+                    options['format'] = endpoint.format
+            send = getattr(client, endpoint.method)
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = send(path, body, **options)
+                    timings.append((time.perf_counter() - start) * 1000)
+                transaction.set_rollback(True)
+            self.assertEqual(
+                response.status_code, endpoint.status,
+                f'{endpoint.label}: {getattr(response, "data", response.content)!r}',
+            )
+            queries = len(captured)
+        return queries, min(timings)
+
+    def load_baseline(self):
+        path = os.getenv('PERF_BASELINE')
+        if not path:
+            return {}
+        with open(path) as f:
+            return json.load(f)
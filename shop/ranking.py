@@ -0,0 +1,112 @@
+import logging
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+import redis
+from celery import shared_task
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import get_redis, initial_version
+from .models import OrderDetail
+
+logger = logging.getLogger(__name__)
+
+# Units sold per product are kept in one sorted set per local calendar day.
+# A window ranking is the ZUNIONSTORE of its days, so a refresh only has to
+# re-aggregate the days that can still change.
+RANKING_WINDOWS = {'7d': 7, '30d': 30}
+DEFAULT_WINDOW = '30d'
+DAY_KEY = 'ranking:day:{day}'
+WINDOW_KEY = 'ranking:best_sellers:{window}'
+RANKING_VERSION_KEY = 'ranking:version'
+RANKING_MODIFIED_KEY = 'ranking:modified'
+
+# Ranked ids fetched per request, before filtering out inactive products
+RANKING_CANDIDATES = 50
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    return start, start + timedelta(days=1)
+
+
+def units_sold_on(day):
+    start, end = _day_range(day)
+    rows = (
+        OrderDetail.objects
+        .filter(order__created_at__gte=start, order__created_at__lt=end)
+        .exclude(order__status='Cancelled')
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+    )
+    return {row['product_id']: row['units'] for row in rows if row['units']}
+
+
+def refresh_rankings(full=False):
+    """
+    Re-aggregate today and yesterday (or the whole longest window when
+    ``full``) into the day buckets and rebuild every window ranking.
+    """
+    today = timezone.localdate()
+    longest = max(RANKING_WINDOWS.values())
+    client = get_redis()
+    if not full and not client.exists(WINDOW_KEY.format(window=DEFAULT_WINDOW)):
+        # Nothing ranked yet (first run or flushed Redis): backfill
+        full = True
+    days = range(longest) if full else range(2)
+
+    pipe = client.pipeline()
+    for offset in days:
+        day = today - timedelta(days=offset)
+        key = DAY_KEY.format(day=day.isoformat())
+        scores = units_sold_on(day)
+        pipe.delete(key)
+        if scores:
+            pipe.zadd(key, scores)
+            pipe.expire(key, (longest + 2) * 86400)
+
+    for window, length in RANKING_WINDOWS.items():
+        day_keys = [DAY_KEY.format(day=(today - timedelta(days=i)).isoformat()) for i in range(length)]
+        pipe.zunionstore(WINDOW_KEY.format(window=window), day_keys)
+
+    pipe.set(RANKING_VERSION_KEY, initial_version(), nx=True)
+    pipe.incr(RANKING_VERSION_KEY)
+    pipe.set(RANKING_MODIFIED_KEY, int(timezone.now().timestamp()))
+    pipe.execute()
+
+
+def top_product_ids(window=DEFAULT_WINDOW, limit=RANKING_CANDIDATES):
+    try:
+        ids = get_redis().zrevrange(WINDOW_KEY.format(window=window), 0, limit - 1)
+    except redis.RedisError:
+        return []
+    return [int(pk) for pk in ids]
+
+
+def ranked_products(queryset, window=DEFAULT_WINDOW, limit=5):
+    """
+    Top ``limit`` active products of ``queryset`` by units sold in the
+    window, or an empty list when nothing is ranked yet.
+    """
+    ids = top_product_ids(window)
+    if not ids:
+        return []
+    products = queryset.filter(pk__in=ids, is_active=True).in_bulk()
+    return [products[pk] for pk in ids if pk in products][:limit]
+
+
+def ranking_validators():
+    try:
+        version, modified = get_redis().mget(RANKING_VERSION_KEY, RANKING_MODIFIED_KEY)
+    except redis.RedisError:
+        return None, None
+    modified = datetime.fromtimestamp(int(modified), tz=dt_timezone.utc) if modified else None
+    return version, modified
+
+
+@shared_task
+def refresh_best_seller_rankings(full=False):
+    try:
+        refresh_rankings(full=full)
+    except redis.RedisError as e:
+        logger.error(f"Could not refresh best seller rankings: {e}")
@@ -0,0 +1,163 @@
+import logging
+from datetime import date as date_cls, datetime, time as dt_time, timedelta
+from functools import reduce
+from operator import or_
+
+import redis
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import get_redis, invalidate_dashboards
+from .models import DailyProductSales, DailySales, Order, OrderDetail
+
+logger = logging.getLogger(__name__)
+
+# Order writes add the local day of the order to DIRTY_KEY; the next read
+# (or the nightly reconcile) re-aggregates just those days. Days being
+# refreshed are moved to PROCESSING_KEY so marks made meanwhile aren't lost.
+DIRTY_KEY = 'rollups:dirty'
+PROCESSING_KEY = 'rollups:dirty:processing'
+LOCK_KEY = 'rollups:lock'
+LOCK_TIMEOUT = 60
+
+
+def mark_dirty(days):
+    """
+    Queue the rollups of ``days`` (dates or order created_at datetimes) for
+    a refresh once the current transaction commits, and expire the cached
+    dashboards built from them.
+    """
+    days = {day if type(day) is date_cls else timezone.localdate(day) for day in days if day}
+    if not days:
+        return
+
+    def mark():
+        try:
+            get_redis().sadd(DIRTY_KEY, *[day.isoformat() for day in days])
+        except redis.RedisError as e:
+            logger.warning(f"Could not mark sales rollups dirty, the nightly reconcile will catch up: {e}")
+
+    transaction.on_commit(mark)
+    invalidate_dashboards()
+
+
+def mark_orders_dirty(order_ids):
+    mark_dirty(Order.objects.filter(pk__in=order_ids).dates('created_at', 'day'))
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    return start, start + timedelta(days=1)
+
+
+def _aggregate(order_filter=Q(), line_filter=Q()):
+    daily = (
+        Order.objects.filter(order_filter)
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(
+            orders=Count('id'),
+            completed=Count('id', filter=Q(status='Completed')),
+            cancelled=Count('id', filter=Q(status='Cancelled')),
+            paid=Count('id', filter=Q(payment_status='Paid')),
+            revenue=Sum('total', filter=Q(payment_status='Paid')),
+        )
+        .order_by()
+    )
+    sales = [
+        DailySales(
+            date=row['day'], orders=row['orders'], completed_orders=row['completed'],
+            cancelled_orders=row['cancelled'], paid_orders=row['paid'], paid_revenue=row['revenue'] or 0,
+        )
+        for row in daily
+    ]
+    units = (
+        OrderDetail.objects.filter(line_filter)
+        .exclude(order__status='Cancelled')
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    product_sales = [
+        DailyProductSales(date=row['day'], product_id=row['product_id'], units=row['units'])
+        for row in units if row['units']
+    ]
+    return sales, product_sales
+
+
+def refresh_days(days):
+    """
+    Re-aggregate the rollups of ``days`` from their orders only.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    ranges = [_day_range(day) for day in days]
+    order_filter = reduce(or_, [Q(created_at__gte=start, created_at__lt=end) for start, end in ranges])
+    line_filter = reduce(or_, [Q(order__created_at__gte=start, order__created_at__lt=end) for start, end in ranges])
+    sales, product_sales = _aggregate(order_filter, line_filter)
+
+    with transaction.atomic():
+        DailySales.objects.filter(date__in=days).delete()
+        DailyProductSales.objects.filter(date__in=days).delete()
+        # A concurrent refresh of the same day writes identical rows
+        DailySales.objects.bulk_create(sales, ignore_conflicts=True)
+        DailyProductSales.objects.bulk_create(product_sales, ignore_conflicts=True, batch_size=1000)
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup from scratch.
+    """
+    sales, product_sales = _aggregate()
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        DailySales.objects.bulk_create(sales, batch_size=1000)
+        DailyProductSales.objects.bulk_create(product_sales, batch_size=1000)
+
+
+def refresh_dirty_rollups():
+    """
+    Bring the rollups up to date before they are read. Only the days whose
+    orders changed are re-aggregated; a first run backfills everything.
+    """
+    client = get_redis()
+    try:
+        if not client.set(LOCK_KEY, 1, nx=True, ex=LOCK_TIMEOUT):
+            # Someone else is refreshing; serve what is there
+            return
+    except redis.RedisError as e:
+        logger.warning(f"Sales rollup queue unavailable, refreshing today only: {e}")
+        refresh_days([timezone.localdate()])
+        return
+
+    try:
+        if not DailySales.objects.exists():
+            if Order.objects.exists():
+                rebuild_rollups()
+            client.delete(DIRTY_KEY)
+            return
+        pipe = client.pipeline(transaction=True)
+        pipe.sunionstore(PROCESSING_KEY, [PROCESSING_KEY, DIRTY_KEY])
+        pipe.delete(DIRTY_KEY)
+        pipe.execute()
+        days = client.smembers(PROCESSING_KEY)
+        if days:
+            refresh_days([date_cls.fromisoformat(day) for day in days])
+        client.delete(PROCESSING_KEY)
+    finally:
+        client.delete(LOCK_KEY)
+
+
+@shared_task(ignore_result=True)
+def reconcile_sales_rollups():
+    rebuild_rollups()
+    try:
+        get_redis().delete(DIRTY_KEY, PROCESSING_KEY)
+    except redis.RedisError:
+        pass
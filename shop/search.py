@@ -0,0 +1,222 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+FTS_TABLE = 'shop_product_fts'
+
+# SQLite: an external-content FTS5 table over shop_product, kept in sync by
+# triggers so bulk_create and raw updates are indexed too. Stock/price
+# updates don't touch name/description and skip the index entirely.
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='shop_product', content_rowid='id',
+        prefix='2 3 4', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON shop_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, coalesce(new.description, ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON shop_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.description, ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON shop_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.description, ''));
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, coalesce(new.description, ''));
+    END""",
+]
+
+# Postgres: a GIN expression index. The index is maintained by Postgres
+# itself, queries just have to use the exact same expression.
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+PG_NAME_VECTOR = "to_tsvector('simple', coalesce(name, ''))"
+PG_SETUP = [
+    f"CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product USING GIN (({PG_VECTOR}))",
+    f"CREATE INDEX IF NOT EXISTS shop_product_name_search_idx ON shop_product USING GIN (({PG_NAME_VECTOR}))",
+]
+
+_available = {}
+
+
+def ensure_search_index(using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+            created = cursor.fetchone() is None
+            for statement in SQLITE_SETUP:
+                cursor.execute(statement)
+            if created:
+                # Index the rows that existed before the table did
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            for statement in PG_SETUP:
+                cursor.execute(statement)
+    _available.pop(using, None)
+
+
+def search_backend(using='default'):
+    if using not in _available:
+        connection = connections[using]
+        backend = None
+        if connection.vendor == 'postgresql':
+            backend = 'postgresql'
+        elif connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+                if cursor.fetchone():
+                    backend = 'sqlite'
+        _available[using] = backend
+    return _available[using]
+
+
+def _tokens(term):
+    return TOKEN_RE.findall(term.lower())[:8]
+
+
+def _fts5_query(tokens, column=None):
+    # Quote every token so user input can't inject FTS syntax; the last one
+    # is a prefix match so partially typed words still hit.
+    phrases = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    query = ' '.join(phrases)
+    return f'{column} : ({query})' if column else query
+
+
+def _tsquery(tokens):
+    return ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+
+
+def _run(using, sql, params):
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    except DatabaseError as e:
+        logger.warning(f"Product search failed, falling back: {e}")
+        return None
+
+
+def _match_sql(backend, tokens):
+    # (sql, params) selecting the id of every product matching ``tokens``
+    if backend == 'sqlite':
+        return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts5_query(tokens)]
+    return f"SELECT id FROM shop_product WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s)", [_tsquery(tokens)]
+
+
+def search_product_ids(term, limit=None, using='default'):
+    """
+    Ranked product ids matching ``term`` in name or description, best first,
+    at most ``limit`` (PRODUCT_SEARCH_LIMIT) of them. Returns None when no
+    full-text index is available.
+    """
+    backend = search_backend(using)
+    tokens = _tokens(term)
+    if backend is None:
+        return None
+    if not tokens:
+        return []
+    limit = limit or settings.PRODUCT_SEARCH_LIMIT
+
+    sql, params = _match_sql(backend, tokens)
+    if backend == 'sqlite':
+        rows = _run(using, f"{sql} ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s", [*params, limit])
+    else:
+        rows = _run(
+            using,
+            f"{sql} ORDER BY ts_rank(({PG_VECTOR}), to_tsquery('simple', %s)) DESC, id DESC LIMIT %s",
+            [*params, _tsquery(tokens), limit],
+        )
+    if rows is None:
+        return None
+    return [row[0] for row in rows]
+
+
+def search_matches(term, using='default'):
+    """
+    Q for every product matching ``term``, unranked and unlimited. Returns
+    None when no full-text index is available.
+    """
+    backend = search_backend(using)
+    tokens = _tokens(term)
+    if backend is None:
+        return None
+    if not tokens:
+        return Q(pk__in=[])
+    return Q(pk__in=RawSQL(*_match_sql(backend, tokens)))
+
+
+def autocomplete_products(term, limit=10, using='default'):
+    """
+    Prefix suggestions on active product names as (id, name) pairs.
+    """
+    backend = search_backend(using)
+    tokens = _tokens(term)
+    if not tokens:
+        return []
+
+    rows = None
+    if backend == 'sqlite':
+        rows = _run(
+            using,
+            f"SELECT p.id, p.name FROM {FTS_TABLE} JOIN shop_product p ON p.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND p.is_active "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s",
+            [_fts5_query(tokens, column='name'), limit],
+        )
+    elif backend == 'postgresql':
+        rows = _run(
+            using,
+            f"SELECT id, name FROM shop_product WHERE ({PG_NAME_VECTOR}) @@ to_tsquery('simple', %s) AND is_active "
+            f"ORDER BY ts_rank(({PG_NAME_VECTOR}), to_tsquery('simple', %s)) DESC, id DESC LIMIT %s",
+            [_tsquery(tokens), _tsquery(tokens), limit],
+        )
+    if rows is None:
+        from .models import Product
+        rows = Product.objects.filter(is_active=True, name__istartswith=term.strip()).values_list('id', 'name')[:limit]
+    return [{'id': pk, 'name': name} for pk, name in rows]
+
+
+def filter_by_search(queryset, term):
+    ids = search_product_ids(term, using=queryset.db)
+    if ids is None:
+        return queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    matches = Q(pk__in=ids)
+    if len(ids) >= settings.PRODUCT_SEARCH_LIMIT:
+        # Only the best hits are ranked, the other matches follow them in
+        # the listing's usual order instead of being dropped
+        matches = search_matches(term, using=queryset.db)
+    # Keep the relevance order of the index
+    rank = Case(
+        *[When(pk=pk, then=Value(pos)) for pos, pk in enumerate(ids)],
+        default=Value(len(ids)),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(matches).order_by(rank, *queryset.model._meta.ordering, '-pk')
+
+
+class ProductSearchFilter(filters.BaseFilterBackend):
+    """
+    Drop-in replacement for SearchFilter backed by the full-text index.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+        return filter_by_search(queryset, term)
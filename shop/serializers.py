@@ -1,17 +1,28 @@
-from datetime import datetime, timedelta
-from django.db.models.functions import TruncMonth
 from django.contrib.auth import get_user_model
 from django.forms import ValidationError
 from rest_framework import serializers
+from django.db import transaction
 from django.db.models import Count, Sum
 User = get_user_model()
 from .models import *
+from .inventory import InsufficientStock, line_quantities, reserve_order_stock
+from .stock_ledger import ledger_enabled
+from .stock_tasks import schedule_order_cancellation
+from .images import variant_urls
+from .fieldsets import SparseFieldsetMixin
+from .analytics import DEFAULT_GRANULARITY, GRANULARITIES, MAX_BUCKETS, bucket_count, resolve_window, sales_series
 
 # product serializer
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = '__all__'
+        method_field_columns = {'image_variants': ('image', 'image_variants')}
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, 'image', self.context.get('request'))
 
 
 
@@ -25,18 +36,48 @@ class ProductBestSeleSerializer(serializers.ModelSerializer):
         representation['product__id'] = instance.id
         representation['product__name'] = instance.name
         representation['product__image'] = instance.image.url if instance.image else None
+        representation['product__image_variants'] = variant_urls(instance, 'image')
         return representation
         
 
 # order serializer
-class OrderDetailSerializer(serializers.ModelSerializer):
+class LineProductField(serializers.PrimaryKeyRelatedField):
+    # Products already loaded by OrderDetailListSerializer, by pk
+    loaded = None
+
+    def to_internal_value(self, data):
+        try:
+            return self.loaded[int(data)]
+        except (TypeError, ValueError, KeyError):
+            return super().to_internal_value(data)
+
+
+class OrderDetailListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # Look up the products of all lines in one query instead of one per line
+        field = self.child.fields.get('product')
+        if isinstance(field, LineProductField) and isinstance(data, list):
+            ids = set()
+            for line in data:
+                try:
+                    ids.add(int(line['product']))
+                except (TypeError, ValueError, KeyError):
+                    pass
+            field.loaded = Product.objects.in_bulk(ids)
+        return super().to_internal_value(data)
+
+
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    product = LineProductField(queryset=Product.objects.all())
     product_name = serializers.ReadOnlyField(source='product.name')
     
     class Meta:
         model = OrderDetail
+        list_serializer_class = OrderDetailListSerializer
         fields = ['id', 'product', 'product_name', 'quantity', 'price',]
+        expandable_fields = {'product': (ProductSerializer, {'read_only': True})}
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order_details = OrderDetailSerializer(many=True)
     
     class Meta:
@@ -46,26 +87,65 @@ class OrderSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         order_details_data = validated_data.pop('order_details')
-        order = Order.objects.create(**validated_data)
-        total = 0
-        for detail_data in order_details_data:
-            product = detail_data['product']
-            quantity = detail_data['quantity']
-            price = product.price
-            total += quantity * price
-            OrderDetail.objects.create(order=order, product=product, quantity=quantity, price=price)
-        order.total = total + order.delivery_charge
-        order.save()
+        lines = [(detail['product'], detail['quantity']) for detail in order_details_data]
+
+        with transaction.atomic():
+            order = Order(**validated_data)
+            order.total = sum(quantity * product.price for product, quantity in lines) + order.delivery_charge
+            if ledger_enabled():
+                order.stock_state = Order.STOCK_HELD
+            order.save()
+            # bulk_create skips OrderDetail.save, stock is reserved below
+            OrderDetail.objects.bulk_create([
+                OrderDetail(order=order, product=product, quantity=quantity, price=product.price)
+                for product, quantity in lines
+            ])
+            try:
+                reserve_order_stock(order, line_quantities(lines))
+            except InsufficientStock as e:
+                product = next(product for product, _ in lines if product.pk == e.product_id)
+                raise serializers.ValidationError(
+                    {'order_details': [f"Not enough stock for {product.name}."]}
+                )
+            schedule_order_cancellation(order)
         return order
 
     
     
-class SellerSerializer(serializers.ModelSerializer):
+class SellerSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Seller
         fields = '__all__'
+        method_field_columns = {'image_variants': ('image', 'image_variants')}
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, 'image', self.context.get('request'))
         
         
+class AnalyticsWindowSerializer(serializers.Serializer):
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=day|week|month, local dates
+    to = serializers.DateField(required=False)
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default=DEFAULT_GRANULARITY)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # 'from' is a keyword, so it can't be declared as an attribute
+        fields['from'] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        start, end = resolve_window(attrs.get('from'), attrs.get('to'), attrs['granularity'])
+        if start > end:
+            raise serializers.ValidationError({'from': "Must not be after 'to'."})
+        if bucket_count(start, end, attrs['granularity']) > MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f"The window spans more than {MAX_BUCKETS} buckets, use a coarser granularity."
+            )
+        return {'start': start, 'end': end, 'granularity': attrs['granularity']}
+
+
 class DashboardSerializer(serializers.Serializer):
     current_user = serializers.CharField(read_only=True)
     total_products = serializers.IntegerField(read_only=True)
@@ -79,27 +159,16 @@ class DashboardSerializer(serializers.Serializer):
         rep['current_user'] = self.context['request'].user.full_name or "Admin User"
         rep['total_products'] = Product.objects.count()
         rep['total_users'] = User.objects.count()
-        rep['total_completed_orders'] = Order.objects.filter(status='Completed').count()
-        rep['total_Cancelled_orders'] = Order.objects.filter(status='Cancelled').count()
-        
-        today = datetime.now().date()
-        last_six_months = []
-        for i in range(5,-1,-1):
-            month = (today.replace(day=1) - timedelta(days=30 * i)).replace(day=1)
-            last_six_months.append(month)
-            
-               
-        monthly_data = Order.objects.annotate(month =TruncMonth('created_at')).values('month').annotate(count=Count('id')).order_by('month')
-        monthly_dict = {item['month'].date(): item['count'] for item in monthly_data}
-        monthly_orders = {}
-        for month_start in last_six_months:
-            month_name = month_start.strftime('%B %Y')
-            monthly_orders[month_name] = monthly_dict.get(month_start, 0)
-        
-        rep['total_orders'] = monthly_orders
+        totals = DailySales.objects.aggregate(
+            completed=Sum('completed_orders'), cancelled=Sum('cancelled_orders')
+        )
+        rep['total_completed_orders'] = totals['completed'] or 0
+        rep['total_Cancelled_orders'] = totals['cancelled'] or 0
+        # Reads the daily rollups of the requested window instead of every order
+        rep['total_orders'] = sales_series('orders', **self.context['window'])
         return rep
 
-class LowStockProductSerializer(serializers.ModelSerializer):
+class LowStockProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'stock']
@@ -110,28 +179,25 @@ class TotalEarningsSerializer(serializers.Serializer):
     
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        
-        today = datetime.now().date()
-        last_six_months = []
-        for i in range(5,-1,-1):
-            month = (today.replace(day=1) - timedelta(days=30 * i)).replace(day=1)
-            last_six_months.append(month)
-        
-        monthly_data = Order.objects.filter(payment_status='Paid').annotate(month=TruncMonth('created_at')).values('month').annotate(total=Sum('total')).order_by('month')
-        monthly_dict = {item['month'].date(): item['total'] for item in monthly_data}
-        total_earnings = {}
-        for data in last_six_months:
-            month_name = data.strftime('%B %Y')
-            total_earnings[month_name] = monthly_dict.get(data, 0)
-        
-        rep['total_earnings'] = total_earnings
+        rep['total_earnings'] = sales_series('paid_revenue', **self.context['window'])
         return rep
 
 
-class AdminOrderSerializer(serializers.ModelSerializer):
+class AdminOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'customer_name', 'email', 'phone_number', 'address', 'delivery_date', 'total', 'status', 'payment_method', 'payment_status', 'notes', 'created_at', 'updated_at']
+        expandable_fields = {'order_details': (OrderDetailSerializer, {'many': True, 'read_only': True})}
+
+    def validate_status(self, value):
+        if self.instance is not None and not Order.can_transition(self.instance.status, value):
+            raise serializers.ValidationError(f"Cannot change status from {self.instance.status} to {value}.")
+        return value
+
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS_CHOICES)
         
         
     # def update(self, instance, validated_data):
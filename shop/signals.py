@@ -0,0 +1,37 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog
+from .images import VARIANT_SOURCES, queue_image_variants
+from .models import Order, OrderDetail, Product
+from .rollups import mark_dirty
+from .stock_ledger import forget_available
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # Covers admin edits as well as the stock writes done through
+    # OrderDetail.save and the auto-cancel task.
+    invalidate_catalog()
+    # An edited stock level has to be reflected in the checkout ledger
+    forget_available([instance.pk])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    # Set-based status updates (admin bulk actions, the auto-cancel sweep)
+    # skip this and mark their days themselves
+    mark_dirty([instance.created_at])
+
+
+@receiver(post_save, sender=OrderDetail)
+@receiver(post_delete, sender=OrderDetail)
+def order_line_changed(sender, instance, **kwargs):
+    mark_dirty([instance.order.created_at])
+
+
+for label in VARIANT_SOURCES:
+    post_save.connect(queue_image_variants, sender=apps.get_model(label), dispatch_uid=f'image_variants_{label}')
@@ -0,0 +1,227 @@
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .cache import get_redis
+from .models import Order, OrderDetail, Product
+
+logger = logging.getLogger(__name__)
+
+# Units that can still be sold, per product: Product.stock minus the units
+# held by unpaid orders. Rebuilt from the database whenever a counter is
+# missing, so expiring or deleting one is always safe.
+AVAILABLE_KEY = 'stock:avail:{product_id}'
+AVAILABLE_PREFIX = 'stock:avail:'
+# Hash of product_id -> units held by one unpaid order
+HOLD_KEY = 'stock:hold:{order_id}'
+# Holds outlive the payment timeout so the cancellation task can still release them
+HOLD_GRACE = 3600
+# Set of order ids whose hold is reserved but whose order may not be committed
+# yet, so a counter rebuild can't see it in the database
+PENDING_KEY = 'stock:pending'
+
+# KEYS: hold key, pending set, then one available counter per line
+# ARGV: order id, counter ttl, hold ttl, then product id and quantity per line
+# Returns {0} when reserved, {1, line...} for counters that need loading,
+# {2, line} for the first line that is short.
+RESERVE_SCRIPT = """
+local lines = #KEYS - 2
+local missing = {1}
+for i = 1, lines do
+    if redis.call('EXISTS', KEYS[i + 2]) == 0 then
+        table.insert(missing, i)
+    end
+end
+if #missing > 1 then
+    return missing
+end
+for i = 1, lines do
+    if tonumber(redis.call('GET', KEYS[i + 2])) < tonumber(ARGV[2 * i + 3]) then
+        return {2, i}
+    end
+end
+for i = 1, lines do
+    redis.call('DECRBY', KEYS[i + 2], ARGV[2 * i + 3])
+    redis.call('EXPIRE', KEYS[i + 2], ARGV[2])
+    redis.call('HINCRBY', KEYS[1], ARGV[2 * i + 2], ARGV[2 * i + 3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {0}
+"""
+
+# KEYS: hold keys. ARGV[1]: available counter prefix.
+# Gives every held unit back to its counter (if it is still loaded).
+RELEASE_SCRIPT = """
+local released = 0
+for _, hold in ipairs(KEYS) do
+    local lines = redis.call('HGETALL', hold)
+    for i = 1, #lines, 2 do
+        local counter = ARGV[1] .. lines[i]
+        if redis.call('EXISTS', counter) == 1 then
+            redis.call('INCRBY', counter, lines[i + 1])
+        end
+    end
+    if #lines > 0 then
+        redis.call('DEL', hold)
+        released = released + 1
+    end
+end
+return released
+"""
+
+# Load attempts per checkout before giving up on the ledger
+RESERVE_ATTEMPTS = 3
+
+
+def ledger_enabled():
+    return settings.STOCK_LEDGER_ENABLED
+
+
+def load_available(product_ids, exclude_order=None):
+    """
+    (Re)build the available counters of ``product_ids`` that are missing.
+    ``exclude_order`` is the order being reserved, whose lines are already
+    written but not held yet.
+    """
+    client = get_redis()
+    # Pending holds are read before the database: one committed in between
+    # is then counted from Redis instead of being missed by both reads
+    pending_ids, pending = pending_holds(client)
+    stock = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock'))
+    held = dict(
+        OrderDetail.objects.filter(product_id__in=product_ids, order__stock_state=Order.STOCK_HELD)
+        .exclude(order_id=exclude_order)
+        .exclude(order_id__in=pending_ids)
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('product_id', 'units')
+    )
+    pipe = client.pipeline()
+    for product_id in product_ids:
+        units = (held.get(product_id) or 0) + pending.get(product_id, 0)
+        available = max(stock.get(product_id, 0) - units, 0)
+        pipe.set(AVAILABLE_KEY.format(product_id=product_id), available, nx=True, ex=settings.STOCK_LEDGER_TTL)
+    pipe.execute()
+
+
+def pending_holds(client):
+    """
+    (order ids, {product_id: units}) of the holds in the pending set. Entries
+    whose hold was released or expired are dropped from it.
+    """
+    order_ids = sorted(client.smembers(PENDING_KEY))
+    if not order_ids:
+        return [], {}
+    pipe = client.pipeline()
+    for order_id in order_ids:
+        pipe.hgetall(HOLD_KEY.format(order_id=order_id))
+    units = {}
+    gone = []
+    for order_id, hold in zip(order_ids, pipe.execute()):
+        if not hold:
+            gone.append(order_id)
+        for product_id, quantity in hold.items():
+            units[int(product_id)] = units.get(int(product_id), 0) + int(quantity)
+    if gone:
+        client.srem(PENDING_KEY, *gone)
+    return [int(order_id) for order_id in order_ids], units
+
+
+def settle_pending(order_id):
+    """
+    Take a hold off the pending set once its order is committed; counter
+    rebuilds then find it in the database.
+    """
+    def settle():
+        try:
+            get_redis().srem(PENDING_KEY, order_id)
+        except redis.RedisError as e:
+            # Harmless: the hold is counted from Redis instead until it is gone
+            logger.warning(f"Could not settle the stock hold of order {order_id}: {e}")
+
+    transaction.on_commit(settle)
+
+
+def hold_stock(order_id, quantities):
+    """
+    Hold ``{product_id: quantity}`` for an unpaid order with one atomic
+    check-and-reserve, all or nothing. Raises InsufficientStock when a line
+    is short and redis.RedisError when the ledger can't be used.
+    """
+    from .inventory import InsufficientStock
+
+    product_ids = sorted(quantities)
+    client = get_redis()
+    reserve = client.register_script(RESERVE_SCRIPT)
+    keys = [HOLD_KEY.format(order_id=order_id), PENDING_KEY]
+    keys += [AVAILABLE_KEY.format(product_id=product_id) for product_id in product_ids]
+    args = [order_id, settings.STOCK_LEDGER_TTL, settings.ORDER_PAYMENT_TIMEOUT + HOLD_GRACE]
+    for product_id in product_ids:
+        args += [product_id, quantities[product_id]]
+
+    for _ in range(RESERVE_ATTEMPTS):
+        status, *lines = reserve(keys=keys, args=args, client=client)
+        if status == 0:
+            settle_pending(order_id)
+            return
+        if status == 2:
+            product_id = product_ids[lines[0] - 1]
+            raise InsufficientStock(product_id, quantities[product_id])
+        load_available([product_ids[line - 1] for line in lines], exclude_order=order_id)
+    raise redis.RedisError(f"Stock ledger counters for order {order_id} could not be loaded")
+
+
+def release_holds(order_ids):
+    """
+    Give the units held by ``order_ids`` back to the available counters
+    once the release is committed; a rolled back cancellation keeps them held.
+    """
+    def release():
+        try:
+            client = get_redis()
+            client.register_script(RELEASE_SCRIPT)(
+                keys=[HOLD_KEY.format(order_id=order_id) for order_id in order_ids],
+                args=[AVAILABLE_PREFIX],
+                client=client,
+            )
+        except redis.RedisError as e:
+            # The counters stay low until they expire and are rebuilt
+            logger.warning(f"Could not release stock holds of orders {list(order_ids)}: {e}")
+
+    if order_ids:
+        transaction.on_commit(release)
+
+
+def drop_holds(order_ids):
+    """
+    Forget the holds of orders whose stock now lives in Product.stock.
+    Runs after commit; the counters need no change.
+    """
+    def drop():
+        try:
+            get_redis().delete(*[HOLD_KEY.format(order_id=order_id) for order_id in order_ids])
+        except redis.RedisError as e:
+            logger.warning(f"Could not drop stock holds of orders {list(order_ids)}: {e}")
+
+    if order_ids:
+        transaction.on_commit(drop)
+
+
+def forget_available(product_ids):
+    """
+    Drop the counters of products whose stock changed outside the ledger,
+    once the change is committed. They are rebuilt on the next checkout.
+    """
+    def forget():
+        try:
+            get_redis().delete(*[AVAILABLE_KEY.format(product_id=product_id) for product_id in product_ids])
+        except redis.RedisError as e:
+            logger.warning(f"Could not reset stock counters of products {list(product_ids)}: {e}")
+
+    if product_ids:
+        transaction.on_commit(forget)
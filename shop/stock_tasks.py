@@ -1,35 +1,133 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
+from kombu.exceptions import OperationalError
+
+from .inventory import commit_settled_holds, release_order_stock
 from .models import Order
-import stripe
-import os
+from .rollups import mark_orders_dirty
+
+logger = logging.getLogger(__name__)
 
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 
+# Orders are swept in primary key order, this many at a time
+SWEEP_BATCH_SIZE = 500
+STRIPE_CANCEL_WORKERS = 8
+STRIPE_CANCEL_ATTEMPTS = 3
+# Errors worth another try; anything else (e.g. intent already cancelled) is final
+STRIPE_RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+
+def cancel_orders(order_ids):
+    """
+    Cancel those of ``order_ids`` that are still pending and unpaid: their
+    stock is given back in bulk and the statuses flipped with one UPDATE.
+    Returns {order_id: stripe_payment_intent} of the orders cancelled.
+    """
+    with transaction.atomic():
+        # Lock the rows so an order paid in the meantime isn't cancelled
+        cancellable = dict(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, status='Pending', payment_status='Pending')
+            .values_list('pk', 'stripe_payment_intent')
+        )
+        if not cancellable:
+            return {}
+        release_order_stock(list(cancellable))
+        # Queryset update: Order.save would restore the stock a second time
+        Order.objects.filter(pk__in=cancellable).update(status='Cancelled', updated_at=timezone.now())
+        mark_orders_dirty(cancellable)
+    return cancellable
+
+
+def cancel_payment_intent(order_id, payment_intent):
+    for attempt in range(1, STRIPE_CANCEL_ATTEMPTS + 1):
+        try:
+            stripe.PaymentIntent.cancel(payment_intent)
+            return True
+        except STRIPE_RETRYABLE_ERRORS as e:
+            if attempt == STRIPE_CANCEL_ATTEMPTS:
+                logger.error(f"Giving up cancelling Stripe PaymentIntent {payment_intent} for Order {order_id}: {e}")
+                return False
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        except stripe.error.StripeError as e:
+            logger.warning(f"Could not cancel Stripe PaymentIntent {payment_intent} for Order {order_id}: {e}")
+            return False
+
+
+def cancel_payment_intents(payment_intents):
+    """
+    Cancel {order_id: payment_intent} on Stripe from a bounded thread pool.
+    """
+    payment_intents = {order_id: intent for order_id, intent in payment_intents.items() if intent}
+    if not payment_intents:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(STRIPE_CANCEL_WORKERS, len(payment_intents))) as pool:
+        results = pool.map(cancel_payment_intent, payment_intents.keys(), payment_intents.values())
+        return sum(results)
+
+
+@shared_task(ignore_result=True)
+def cancel_unpaid_order(order_id):
+    """
+    Runs ORDER_PAYMENT_TIMEOUT after checkout; does nothing if the order
+    was paid or cancelled in the meantime.
+    """
+    payment_intents = cancel_orders([order_id])
+    cancel_payment_intents(payment_intents)
+    return bool(payment_intents)
+
+
+def schedule_order_cancellation(order):
+    """
+    Queue cancel_unpaid_order for ``order`` once the checkout transaction
+    commits. If the broker is down the safety-net sweep picks it up.
+    """
+    def enqueue():
+        try:
+            cancel_unpaid_order.apply_async((order.pk,), countdown=settings.ORDER_PAYMENT_TIMEOUT)
+        except OperationalError as e:
+            logger.warning(f"Could not schedule cancellation of Order {order.pk}: {e}")
+
+    transaction.on_commit(enqueue)
+
+
 @shared_task
 def auto_cancel_unpaid_orders():
-    # 5 minutes ago
-    time_limit = timezone.now() - timedelta(minutes=5)
-    
-    # Select unpaid orders older than 5 minutes
-    orders_to_cancel = Order.objects.filter(payment_status='Pending', status='Pending', created_at__lte=time_limit)
-    
-    for order in orders_to_cancel:
-        # Restore stock
-        for item in order.order_details.all():
-            item.product.stock += item.quantity
-            item.product.save()
-            
-        if order.stripe_payment_intent:
-            print( f"Attempting to cancel Stripe PaymentIntent {order.stripe_payment_intent} for Order {order.id}" )
-            try:
-                stripe.PaymentIntent.cancel(order.stripe_payment_intent)
-                print(f"Successfully cancelled Stripe PaymentIntent {order.stripe_payment_intent} for Order {order.id}")
-            except Exception as e:
-                # Log the error or handle it as needed
-                print(f"Error cancelling Stripe PaymentIntent {order.stripe_payment_intent}: {e}")
-        
-        # Cancel the order
-        order.status = 'Cancelled'
-        order.save()
+    """
+    Safety net for orders whose cancel_unpaid_order task never ran, and for
+    held stock of orders that were paid or fulfilled without committing it.
+    """
+    time_limit = timezone.now() - timedelta(seconds=settings.ORDER_PAYMENT_TIMEOUT)
+
+    # Unpaid orders past the payment timeout
+    stale = Order.objects.filter(
+        payment_status='Pending', status='Pending', created_at__lte=time_limit
+    ).order_by('pk')
+
+    cancelled = 0
+    last_pk = 0
+    while True:
+        batch = list(stale.filter(pk__gt=last_pk).values_list('pk', flat=True)[:SWEEP_BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1]
+        payment_intents = cancel_orders(batch)
+        cancelled += len(payment_intents)
+        cancel_payment_intents(payment_intents)
+
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} unpaid orders")
+    committed = commit_settled_holds()
+    if committed:
+        logger.info(f"Committed the held stock of {committed} settled orders")
+    return cancelled
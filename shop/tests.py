@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+import fakeredis
+import redis
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from PIL import Image
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from project.instrumentation import TimedRedis
+
+from . import perf_testing, webhooks
+from .analytics import bucket_count, bucket_start, previous_buckets, resolve_window
+from .cache import CATALOG_VERSION_KEY
+from .conditional import ConditionalGetMixin
+from .idempotency import idempotent
+from .images import FORMAT_EXTENSIONS, IMAGE_VARIANTS, generate_image_variants, output_format
+from .inventory import InsufficientStock, commit_settled_holds, release_order_stock
+from .models import DailyProductSales, DailySales, Order, OrderDetail, Product, Seller
+from .orders import transition_orders
+from .payment import CHECKOUT_EXPIRY_MARGIN, order_payment_payload
+from .perf_testing import Endpoint
+from .ranking import refresh_rankings
+from .rollups import rebuild_rollups, refresh_dirty_rollups
+from .serializers import OrderSerializer, SellerSerializer
+from .stock_ledger import AVAILABLE_KEY, HOLD_KEY, PENDING_KEY, hold_stock, load_available
+from .stock_tasks import auto_cancel_unpaid_orders, cancel_unpaid_order
+
+User = get_user_model()
+
+
+def fake_redis():
+    """
+    In-memory Redis (Lua scripts included) behind the project's client class.
+    """
+    pool = redis.ConnectionPool(
+        connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer(), decode_responses=True
+    )
+    return TimedRedis(connection_pool=pool)
+
+
+class FakeRedisMixin:
+    """
+    Points REDIS_CLIENT at a fresh fake_redis() (``self.redis``) per test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fake_redis()
+        override = override_settings(REDIS_CLIENT=self.redis)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class OrderQueryBudgetTests(TestCase):
+    """
+    Order endpoints run a fixed number of queries however many orders and
+    lines they render.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        cls.products = Product.objects.bulk_create(
+            [Product(name=f'Product {i}', price=10, stock=1000) for i in range(20)]
+        )
+        cls.orders = Order.objects.bulk_create([
+            Order(customer_name='Customer', email='customer@example.com', phone_number='1', address='Address')
+            for _ in range(100)
+        ])
+        OrderDetail.objects.bulk_create([
+            OrderDetail(order=order, product=product, quantity=1, price=10)
+            for order in cls.orders for product in cls.products[:10]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_order_list(self):
+        # orders, then all their lines with products joined
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-create'), {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 100)
+        self.assertEqual(response.data[0]['order_details'][0]['product_name'], 'Product 0')
+
+    def test_admin_order_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('admin-order-list'), {'cursor': '', 'page_size': 100})
+        self.assertEqual(len(response.data['data']['results']), 100)
+
+    def test_admin_order_list_with_lines(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('admin-order-list'), {'cursor': '', 'page_size': 100, 'expand': 'order_details'}
+            )
+        self.assertEqual(len(response.data['data']['results'][0]['order_details']), 10)
+
+    def test_admin_order_detail(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('admin-order-detail', args=[self.orders[0].pk]))
+        self.assertEqual(len(response.data['order_details']), 10)
+
+    def test_sparse_line_with_joined_product(self):
+        line = self.orders[0].order_details.first()
+        cases = [('quantity', {'quantity': 1}), ('id,product_name', {'id': line.pk, 'product_name': 'Product 0'})]
+        for fields, expected in cases:
+            with self.subTest(fields=fields), self.assertNumQueries(1):
+                response = self.client.get(reverse('admin-orderdetail-update', args=[line.pk]), {'fields': fields})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, expected)
+
+    def test_order_create_looks_up_products_once(self):
+        def create(lines):
+            payload = {
+                'customer_name': 'Customer', 'email': 'customer@example.com', 'phone_number': '1',
+                'address': 'Address', 'payment_method': 'Card',
+                'order_details': [{'product': product.pk, 'quantity': 1} for product in lines],
+            }
+            with mock.patch('shop.views.order_payment_payload', return_value=({}, 200)):
+                return self.client.post(reverse('order-create'), payload, format='json')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(create(self.products[:10]).status_code, 201)
+        product_reads = [
+            q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "shop_product"' in q['sql']
+        ]
+        self.assertEqual(len(product_reads), 1)
+
+    def test_order_create_unknown_product(self):
+        response = self.client.post(reverse('order-create'), {
+            'customer_name': 'Customer', 'email': 'customer@example.com', 'phone_number': '1',
+            'address': 'Address', 'order_details': [{'product': 0, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_pages(self):
+        self.client.force_login(self.admin)
+        pages = [
+            (reverse('admin:shop_order_change', args=[self.orders[0].pk]), 5),
+            (reverse('admin:shop_orderdetail_changelist'), 5),
+            (reverse('admin:shop_orderdetail_change', args=[self.orders[0].order_details.first().pk]), 7),
+        ]
+        for url, queries in pages:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+def checkout(*lines):
+    """
+    A validated, unsaved checkout of (product, quantity) lines.
+    """
+    serializer = OrderSerializer(data={
+        'customer_name': 'Customer', 'email': 'customer@example.com', 'phone_number': '1', 'address': 'Address',
+        'order_details': [{'product': product.pk, 'quantity': quantity} for product, quantity in lines],
+    })
+    serializer.is_valid(raise_exception=True)
+    return serializer
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+@mock.patch('shop.serializers.schedule_order_cancellation')
+class CheckoutStockTests(FakeRedisMixin, TestCase):
+    """
+    Without the ledger, checkout takes stock straight from Product.stock with
+    conditional updates, all lines or none.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lamp = Product.objects.create(name='Lamp', price=10, stock=1)
+        self.desk = Product.objects.create(name='Desk', price=10, stock=5)
+
+    def stock(self):
+        return dict(Product.objects.values_list('name', 'stock'))
+
+    def test_last_unit_sold_once(self, schedule):
+        # Both checkouts were validated while the lamp was still in stock
+        first, second = checkout((self.lamp, 1)), checkout((self.lamp, 1))
+        first.save()
+        with self.assertRaises(ValidationError) as raised:
+            second.save()
+        self.assertEqual(raised.exception.detail, {'order_details': ['Not enough stock for Lamp.']})
+        self.assertEqual(self.stock(), {'Lamp': 0, 'Desk': 5})
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_shortfall_rolls_back_other_lines(self, schedule):
+        with self.assertRaises(ValidationError):
+            checkout((self.desk, 2), (self.lamp, 2)).save()
+        self.assertEqual(self.stock(), {'Lamp': 1, 'Desk': 5})
+        self.assertFalse(Order.objects.exists())
+        schedule.assert_not_called()
+
+    def test_lines_of_one_product_are_summed(self, schedule):
+        with self.assertRaises(ValidationError):
+            checkout((self.desk, 3), (self.desk, 3)).save()
+        checkout((self.desk, 2), (self.desk, 3)).save()
+        self.assertEqual(self.stock(), {'Lamp': 1, 'Desk': 0})
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+@mock.patch('shop.serializers.schedule_order_cancellation')
+@mock.patch('shop.views.order_payment_payload', return_value=({'url': 'https://pay.example.com'}, 200))
+class IdempotencyTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=1)
+
+    def post(self, quantity=1, key='retry-1'):
+        return APIClient().post(reverse('order-create'), {
+            'customer_name': 'Customer', 'email': 'customer@example.com', 'phone_number': '1', 'address': 'Address',
+            'order_details': [{'product': self.product.pk, 'quantity': quantity}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self, payment, schedule):
+        first = self.post()
+        retry = self.post()
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+        payment.assert_called_once()
+
+    def test_key_reused_for_another_request(self, payment, schedule):
+        self.product.stock = 5
+        self.product.save()
+        self.assertEqual(self.post(1).status_code, 201)
+        response = self.post(2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.post(2, key='retry-2').status_code, 201)
+
+    def test_client_errors_are_not_stored(self, payment, schedule):
+        self.assertEqual(self.post(2).status_code, 400)
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        response = self.post(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+        calls = []
+
+        @idempotent('test')
+        def view(request):
+            calls.append(request)
+            return Response({'error': 'Not found'}, status=404)
+
+        request = RequestFactory().post('/', b'{}', content_type='application/json', HTTP_IDEMPOTENCY_KEY='k')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request).status_code, 404)
+        self.assertEqual(view(request).status_code, 404)
+        self.assertEqual(len(calls), 2)
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class OrderLineEditTests(FakeRedisMixin, TestCase):
+    """
+    Editing an order's lines keeps its total and the products' stock in step.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lamp = Product.objects.create(name='Lamp', price=10, stock=10)
+        self.desk = Product.objects.create(name='Desk', price=25, stock=10)
+        with mock.patch('shop.serializers.schedule_order_cancellation'):
+            self.order = checkout((self.lamp, 2)).save()
+        self.line = self.order.order_details.get()
+
+    def total(self):
+        self.order.refresh_from_db()
+        return self.order.total
+
+    def stock(self):
+        return dict(Product.objects.values_list('name', 'stock'))
+
+    def test_checkout_total(self):
+        # Lines plus the delivery charge
+        self.assertEqual(self.total(), 24)
+        self.assertEqual(self.stock(), {'Lamp': 8, 'Desk': 10})
+
+    def test_line_edits(self):
+        self.line.quantity = 3
+        self.line.save()
+        self.assertEqual(self.total(), 34)
+        self.line.price = 8
+        self.line.save()
+        self.assertEqual(self.total(), 28)
+        self.line.product = self.desk
+        self.line.save()
+        self.assertEqual(self.total(), 28)
+        self.assertEqual(self.stock(), {'Lamp': 10, 'Desk': 7})
+
+    def test_added_and_deleted_lines(self):
+        desk = OrderDetail.objects.create(order=self.order, product=self.desk, quantity=1, price=25)
+        self.assertEqual(self.total(), 49)
+        self.assertEqual(self.stock(), {'Lamp': 8, 'Desk': 9})
+        self.line.delete()
+        desk.delete()
+        self.assertEqual(self.total(), 4)
+        self.assertEqual(self.stock(), {'Lamp': 10, 'Desk': 10})
+
+    def test_edit_through_api(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.patch(reverse('admin-orderdetail-update', args=[self.line.pk]), {'quantity': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.total(), 54)
+        self.assertEqual(self.stock(), {'Lamp': 5, 'Desk': 10})
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+@mock.patch('shop.stock_tasks.stripe.PaymentIntent.cancel')
+class UnpaidOrderCancellationTests(FakeRedisMixin, TestCase):
+    """
+    Orders left unpaid past ORDER_PAYMENT_TIMEOUT are cancelled, their stock
+    goes back and their Stripe payment intents are cancelled.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=10)
+
+    def place_order(self, quantity=1, age=0, **fields):
+        with mock.patch('shop.serializers.schedule_order_cancellation'):
+            order = checkout((self.product, quantity)).save()
+        fields['created_at'] = timezone.now() - timedelta(seconds=age)
+        Order.objects.filter(pk=order.pk).update(**fields)
+        return order
+
+    def statuses(self, orders):
+        return [Order.objects.get(pk=order.pk).status for order in orders]
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_sweep_cancels_stale_unpaid_orders(self, cancel_intent):
+        timeout = settings.ORDER_PAYMENT_TIMEOUT
+        stale = [self.place_order(age=timeout + 60, stripe_payment_intent=f'pi_{i}') for i in range(5)]
+        fresh = self.place_order(age=timeout - 60)
+        paid = self.place_order(age=timeout + 60, payment_status='Paid')
+        shipped = self.place_order(age=timeout + 60, status='Shipped')
+        self.assertEqual(self.stock(), 2)
+
+        with mock.patch('shop.stock_tasks.SWEEP_BATCH_SIZE', 2):
+            self.assertEqual(auto_cancel_unpaid_orders(), 5)
+        self.assertEqual(self.statuses(stale), ['Cancelled'] * 5)
+        self.assertEqual(self.statuses([fresh, paid, shipped]), ['Pending', 'Pending', 'Shipped'])
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(sorted(call.args[0] for call in cancel_intent.call_args_list), [f'pi_{i}' for i in range(5)])
+
+        # A second sweep finds nothing left to cancel or give back
+        self.assertEqual(auto_cancel_unpaid_orders(), 0)
+        self.assertEqual(self.stock(), 7)
+
+    def test_checkout_schedules_its_cancellation(self, cancel_intent):
+        with mock.patch('shop.stock_tasks.cancel_unpaid_order.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = checkout((self.product, 1)).save()
+            apply_async.assert_called_once_with((order.pk,), countdown=settings.ORDER_PAYMENT_TIMEOUT)
+
+            # Nothing is scheduled for a checkout that rolled back
+            apply_async.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValidationError):
+                checkout((self.product, 100)).save()
+            apply_async.assert_not_called()
+
+            # Without a broker the sweep is left to pick the order up
+            apply_async.side_effect = OperationalError('broker down')
+            with self.captureOnCommitCallbacks(execute=True):
+                checkout((self.product, 1)).save()
+
+    def test_scheduled_cancellation(self, cancel_intent):
+        unpaid = self.place_order(2, stripe_payment_intent='pi_1')
+        paid = self.place_order(2, payment_status='Paid')
+        self.assertTrue(cancel_unpaid_order(unpaid.pk))
+        self.assertFalse(cancel_unpaid_order(paid.pk))
+        # Running twice (e.g. a redelivered task) gives the stock back once
+        self.assertFalse(cancel_unpaid_order(unpaid.pk))
+        self.assertEqual(self.statuses([unpaid, paid]), ['Cancelled', 'Pending'])
+        self.assertEqual(self.stock(), 8)
+        cancel_intent.assert_called_once_with('pi_1')
+
+    def test_stripe_cancel_is_retried(self, cancel_intent):
+        cancel_intent.side_effect = [stripe.error.APIConnectionError('reset'), None]
+        self.place_order(age=settings.ORDER_PAYMENT_TIMEOUT + 60, stripe_payment_intent='pi_1')
+        with mock.patch('shop.stock_tasks.time.sleep'):
+            self.assertEqual(auto_cancel_unpaid_orders(), 1)
+        self.assertEqual(cancel_intent.call_count, 2)
+
+    def test_final_stripe_error_is_not_retried(self, cancel_intent):
+        cancel_intent.side_effect = stripe.error.InvalidRequestError('already cancelled', None)
+        order = self.place_order(age=settings.ORDER_PAYMENT_TIMEOUT + 60, stripe_payment_intent='pi_1')
+        self.assertEqual(auto_cancel_unpaid_orders(), 1)
+        self.assertEqual(cancel_intent.call_count, 1)
+        self.assertEqual(self.statuses([order]), ['Cancelled'])
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class OrderStatusTransitionTests(FakeRedisMixin, TestCase):
+    """
+    Order.STATUS_TRANSITIONS is enforced by the single and bulk status
+    endpoints and the admin actions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def orders(self, *statuses):
+        orders = []
+        for status in statuses:
+            with mock.patch('shop.serializers.schedule_order_cancellation'):
+                order = checkout((self.product, 1)).save()
+            Order.objects.filter(pk=order.pk).update(status=status)
+            orders.append(order.pk)
+        return orders
+
+    def statuses(self, ids):
+        return list(Order.objects.filter(pk__in=ids).order_by('pk').values_list('status', flat=True))
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_can_transition(self):
+        allowed = [
+            ('Pending', 'Processing'), ('Processing', 'Shipped'), ('Shipped', 'Completed'),
+            ('Pending', 'Cancelled'), ('Completed', 'Cancelled'), ('Shipped', 'Shipped'),
+        ]
+        refused = [
+            ('Pending', 'Shipped'), ('Shipped', 'Processing'), ('Completed', 'Pending'),
+            ('Cancelled', 'Pending'), ('Cancelled', 'Processing'),
+        ]
+        for old, new in allowed:
+            self.assertTrue(Order.can_transition(old, new), (old, new))
+        for old, new in refused:
+            self.assertFalse(Order.can_transition(old, new), (old, new))
+
+    def test_status_update_checks_transition(self):
+        pk, = self.orders('Shipped')
+        response = self.client.patch(reverse('admin-order-update', args=[pk]), {'status': 'Pending'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(reverse('admin-order-update', args=[pk]), {'status': 'Completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses([pk]), ['Completed'])
+
+    def test_bulk_update_is_all_or_nothing(self):
+        ids = self.orders('Pending', 'Processing', 'Cancelled')
+        response = self.client.post(
+            reverse('admin-order-bulk-status'), {'ids': ids + [0], 'status': 'Processing'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['rejected'], {str(ids[2]): 'Cancelled'})
+        self.assertEqual(self.statuses(ids), ['Pending', 'Processing', 'Cancelled'])
+
+        response = self.client.post(
+            reverse('admin-order-bulk-status'), {'ids': ids[:2] + [0], 'status': 'Processing'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        # The order already Processing is left as it is
+        self.assertEqual(response.data['updated'], [ids[0]])
+        self.assertEqual(response.data['not_found'], [0])
+        self.assertEqual(self.statuses(ids), ['Processing', 'Processing', 'Cancelled'])
+
+    def test_bulk_cancel_gives_stock_back_once(self):
+        ids = self.orders('Pending', 'Shipped', 'Cancelled')
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(sorted(transition_orders(ids, 'Cancelled')), ids[:2])
+        self.assertEqual(transition_orders(ids, 'Cancelled'), [])
+        self.assertEqual(self.stock(), 9)
+
+    def test_admin_action_skips_refused_orders(self):
+        ids = self.orders('Processing', 'Pending', 'Completed')
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            reverse('admin:shop_order_changelist'), {'action': 'mark_shipped', '_selected_action': ids}, follow=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(ids), ['Shipped', 'Pending', 'Completed'])
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['1 order(s) marked as Shipped.', "2 order(s) were already Shipped or can't move to it."],
+        )
+
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class SalesRollupTests(FakeRedisMixin, TestCase):
+    """
+    DailySales/DailyProductSales follow order writes per local day, and the
+    incremental refresh agrees with a full rebuild.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=100)
+
+    def order(self, created_at, quantity=1, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                customer_name='Customer', email='customer@example.com', phone_number='1', address='Address', **fields
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            order.refresh_from_db()
+            OrderDetail.objects.create(order=order, product=self.product, quantity=quantity, price=10)
+        order.refresh_from_db()
+        return order
+
+    def refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_dirty_rollups()
+
+    def sales(self):
+        return {
+            row.date: (row.orders, row.completed_orders, row.cancelled_orders, row.paid_orders, row.paid_revenue)
+            for row in DailySales.objects.all()
+        }
+
+    def units(self):
+        return dict(DailyProductSales.objects.values_list('date', 'units'))
+
+    def test_rollups_follow_order_changes(self):
+        # 00:30 in Dhaka is still the previous day in UTC
+        first = self.order(local(2026, 3, 1, 23, 30))
+        second = self.order(local(2026, 3, 2, 0, 30), quantity=3, payment_status='Paid')
+        self.refresh()
+        self.assertEqual(self.sales(), {date(2026, 3, 1): (1, 0, 0, 0, 0), date(2026, 3, 2): (1, 0, 0, 1, 30)})
+        self.assertEqual(self.units(), {date(2026, 3, 1): 1, date(2026, 3, 2): 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.payment_status = 'Paid'
+            first.status = 'Completed'
+            first.save()
+        self.refresh()
+        self.assertEqual(self.sales()[date(2026, 3, 1)], (1, 1, 0, 1, 10))
+
+        # Bulk transitions skip the signals and mark their days themselves
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([second.pk], 'Cancelled')
+        self.refresh()
+        self.assertEqual(self.sales()[date(2026, 3, 2)], (1, 0, 1, 1, 30))
+        self.assertEqual(self.units(), {date(2026, 3, 1): 1})
+
+        incremental = (self.sales(), self.units())
+        rebuild_rollups()
+        self.assertEqual((self.sales(), self.units()), incremental)
+
+    def test_only_dirty_days_are_refreshed(self):
+        first = self.order(local(2026, 3, 1, 12))
+        self.order(local(2026, 3, 2, 12))
+        self.refresh()
+        DailySales.objects.update(orders=99)
+        self.refresh()
+        self.assertEqual(self.sales()[date(2026, 3, 1)][0], 99)
+
+        self.order(local(2026, 3, 1, 18))
+        self.refresh()
+        self.assertEqual(self.sales()[date(2026, 3, 1)][0], 2)
+        self.assertEqual(self.sales()[date(2026, 3, 2)][0], 99)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.refresh()
+        self.assertEqual(self.sales()[date(2026, 3, 1)][0], 1)
+
+
+class AnalyticsWindowTests(FakeRedisMixin, TestCase):
+    """
+    from/to/granularity windows and the bucketed series read from the rollups.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        DailySales.objects.bulk_create([
+            DailySales(date=date(2026, 2, 28), orders=1, paid_orders=1, paid_revenue=5),
+            DailySales(date=date(2026, 3, 2), orders=3, paid_orders=2, paid_revenue=30),
+            DailySales(date=date(2026, 3, 4), orders=1, paid_orders=1, paid_revenue=10),
+        ])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def earnings(self, **query):
+        return self.client.get(reverse('total-earnings'), query)
+
+    def test_bucket_arithmetic(self):
+        self.assertEqual(bucket_start(date(2026, 3, 4), 'week'), date(2026, 3, 2))
+        self.assertEqual(previous_buckets(date(2026, 2, 15), 'month', 6), date(2025, 9, 1))
+        self.assertEqual(previous_buckets(date(2026, 3, 4), 'week', 2), date(2026, 2, 23))
+        self.assertEqual(bucket_count(date(2025, 11, 30), date(2026, 2, 1), 'month'), 4)
+        self.assertEqual(bucket_count(date(2026, 3, 1), date(2026, 3, 9), 'week'), 3)
+        self.assertEqual(resolve_window(end=date(2026, 3, 4), granularity='day'), (date(2026, 2, 3), date(2026, 3, 4)))
+
+    def test_series_per_granularity(self):
+        window = {'from': '2026-02-28', 'to': '2026-03-04'}
+        cases = {
+            'day': {'2026-02-28': 5, '2026-03-01': 0, '2026-03-02': 30, '2026-03-03': 0, '2026-03-04': 10},
+            'week': {'2026-02-23': 5, '2026-03-02': 40},
+            'month': {'February 2026': 5, 'March 2026': 40},
+        }
+        for granularity, expected in cases.items():
+            with self.subTest(granularity=granularity):
+                response = self.earnings(granularity=granularity, **window)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['total_earnings'], expected)
+
+        response = self.client.get(reverse('admin-dashboard'), {'granularity': 'week', **window})
+        self.assertEqual(response.data['total_orders'], {'2026-02-23': 1, '2026-03-02': 4})
+
+    def test_default_window_ends_today(self):
+        with mock.patch('shop.analytics.timezone.localdate', return_value=date(2026, 3, 4)):
+            response = self.earnings()
+        self.assertEqual(list(response.data['total_earnings']), [
+            'October 2025', 'November 2025', 'December 2025', 'January 2026', 'February 2026', 'March 2026',
+        ])
+
+    def test_invalid_windows(self):
+        for query in [
+            {'from': '2026-03-05', 'to': '2026-03-04'},
+            {'granularity': 'day', 'from': '2020-01-01', 'to': '2026-03-04'},
+            {'granularity': 'year'},
+            {'from': '03/01/2026'},
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(self.earnings(**query).status_code, 400)
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class DashboardCacheTests(FakeRedisMixin, TestCase):
+    """
+    Cached dashboards are shared by admins and recomputed once an order or
+    the catalog changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', full_name='Ada', password='password')
+        cls.other = User.objects.create_superuser(email='other@example.com', full_name='Bo', password='password')
+        cls.product = Product.objects.create(name='Lamp', price=10, stock=5)
+
+    def dashboard(self, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        response = client.get(reverse('admin-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def place_order(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create(
+                customer_name='Customer', email='customer@example.com', phone_number='1', address='Address', **fields
+            )
+
+    def test_order_changes_invalidate(self):
+        first = self.place_order(status='Completed')
+        self.assertEqual(self.dashboard()['total_completed_orders'], 1)
+        # Served from the cache, personalized for whoever asks
+        with self.assertNumQueries(0):
+            cached = self.dashboard(self.other)
+        self.assertEqual((cached['total_completed_orders'], cached['current_user']), (1, 'Bo'))
+
+        self.place_order(status='Completed')
+        self.assertEqual(self.dashboard()['total_completed_orders'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([first.pk], 'Cancelled')
+        data = self.dashboard()
+        self.assertEqual((data['total_completed_orders'], data['total_Cancelled_orders']), (1, 1))
+
+    def test_product_changes_invalidate(self):
+        self.assertEqual(self.dashboard()['total_products'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Desk', price=10, stock=5)
+        self.assertEqual(self.dashboard()['total_products'], 2)
+
+    def test_stale_entry_served_while_another_request_recomputes(self):
+        self.place_order()
+        self.dashboard()
+        self.place_order(status='Completed')
+        # Someone else holds the recompute lock
+        key = next(key for key in self.redis.keys('dashboard:dashboard:*') if not key.endswith(':lock'))
+        self.redis.set(f'{key}:lock', 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.dashboard()['total_completed_orders'], 0)
+        self.redis.delete(f'{key}:lock')
+        self.assertEqual(self.dashboard()['total_completed_orders'], 1)
+
+
+class CheckoutSessionTests(TestCase):
+    """
+    An unpaid order's Stripe checkout session is reused while it is valid
+    and for the same amount; a replaced one is expired on Stripe.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.services = perf_testing.FakeServices().__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.services.__exit__(None, None, None)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.services.reset()
+        self.calls = self.services.stripe_calls
+        self.order = Order.objects.create(
+            customer_name='Customer', email='customer@example.com', phone_number='1', address='Address', total=10
+        )
+
+    def pay(self):
+        data, status = order_payment_payload(self.order)
+        self.assertEqual(status, 200, data)
+        return data['checkout_url']
+
+    def test_valid_session_is_reused(self):
+        url = self.pay()
+        self.assertEqual(self.pay(), url)
+        self.assertEqual(self.calls, [('POST', '/v1/checkout/sessions')])
+
+    def test_session_about_to_expire_is_replaced(self):
+        url = self.pay()
+        session_id = self.order.stripe_checkout_session_id
+        self.order.stripe_checkout_expires_at = timezone.now() + CHECKOUT_EXPIRY_MARGIN / 2
+        self.assertNotEqual(self.pay(), url)
+        self.assertEqual(self.calls, [
+            ('POST', '/v1/checkout/sessions'),
+            ('POST', f'/v1/checkout/sessions/{session_id}/expire'),
+            ('POST', '/v1/checkout/sessions'),
+        ])
+
+    def test_amount_change_replaces_session(self):
+        url = self.pay()
+        session_id = self.order.stripe_checkout_session_id
+        self.order.total = 12
+        self.assertNotEqual(self.pay(), url)
+        self.assertEqual(self.calls[1:], [
+            ('POST', f'/v1/checkout/sessions/{session_id}/expire'),
+            ('POST', '/v1/checkout/sessions'),
+        ])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stripe_checkout_amount, 1200)
+
+    def test_session_closed_on_stripe_is_still_replaced(self):
+        url = self.pay()
+        self.order.total = 12
+        error = stripe.error.InvalidRequestError('Only open sessions can be expired.', None)
+        with mock.patch('shop.payment.stripe.checkout.Session.expire', side_effect=error):
+            self.assertNotEqual(self.pay(), url)
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class WebhookTests(FakeRedisMixin, TestCase):
+    """
+    Stripe events are applied once per event id, move the payment status
+    forward only and survive worker failures.
+    """
+
+    def setUp(self):
+        super().setUp()
+        task = webhooks.process_stripe_event
+        # Run queued events right away the way a worker would: retries
+        # included, failures not raised back into the webhook view
+        for patch in [
+            mock.patch('shop.payment.endpoint_secret', perf_testing.FAKE_WEBHOOK_SECRET),
+            mock.patch.object(task, 'delay', side_effect=lambda event: task.apply(args=[event], throw=False)),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.order = Order.objects.create(
+            customer_name='Customer', email='customer@example.com', phone_number='1', address='Address'
+        )
+
+    def deliver(self, event_id, event_type='checkout.session.completed'):
+        payload, signature = perf_testing.signed_webhook({
+            'id': event_id,
+            'type': event_type,
+            'data': {'object': {'id': 'cs_test_1', 'metadata': {'order_id': str(self.order.pk)}}},
+        })
+        return APIClient().post(
+            reverse('payment-webhook'), payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature
+        )
+
+    def payment_status(self):
+        self.order.refresh_from_db()
+        return self.order.payment_status
+
+    def failing(self, times):
+        """
+        set_payment_status that raises a database error the first ``times`` calls.
+        """
+        calls = []
+        original = webhooks.set_payment_status
+
+        def set_payment_status(order_id, payment_status):
+            calls.append(order_id)
+            if len(calls) <= times:
+                raise DatabaseError('database is locked')
+            original(order_id, payment_status)
+
+        return mock.patch('shop.webhooks.set_payment_status', side_effect=set_payment_status), calls
+
+    def test_redelivered_event_is_applied_once(self):
+        with mock.patch('shop.webhooks.apply_event', wraps=webhooks.apply_event) as apply_event:
+            self.assertEqual(self.deliver('evt_1').status_code, 200)
+            self.assertEqual(self.deliver('evt_1').status_code, 200)
+        apply_event.assert_called_once()
+        self.assertEqual(self.payment_status(), 'Paid')
+
+    def test_payment_status_only_moves_forward(self):
+        self.deliver('evt_1', 'payment_intent.payment_failed')
+        self.assertEqual(self.payment_status(), 'Failed')
+        self.deliver('evt_2', 'checkout.session.completed')
+        self.assertEqual(self.payment_status(), 'Paid')
+        # A late failure or a replayed older event can't undo the payment
+        self.deliver('evt_3', 'payment_intent.payment_failed')
+        self.deliver('evt_1', 'payment_intent.payment_failed')
+        self.assertEqual(self.payment_status(), 'Paid')
+
+    def test_worker_failure_is_retried(self):
+        patch, calls = self.failing(2)
+        with patch:
+            self.assertEqual(self.deliver('evt_1').status_code, 200)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.payment_status(), 'Paid')
+
+    def test_event_given_up_on_can_be_resent(self):
+        patch, calls = self.failing(100)
+        with patch:
+            self.assertEqual(self.deliver('evt_1').status_code, 200)
+        self.assertEqual(len(calls), webhooks.process_stripe_event.max_retries + 1)
+        self.assertEqual(self.payment_status(), 'Pending')
+        # The event id was forgotten, so resending it from Stripe applies it
+        self.assertEqual(self.deliver('evt_1').status_code, 200)
+        self.assertEqual(self.payment_status(), 'Paid')
+
+
+@override_settings(STOCK_LEDGER_ENABLED=True)
+class StockLedgerTests(FakeRedisMixin, TestCase):
+    """
+    Checkout holds stock in the Redis ledger; it reaches Product.stock when
+    the order is paid or fulfilled and goes back when it is cancelled.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Product', price=10, stock=5)
+
+    def place_order(self, quantity=2, product=None):
+        serializer = checkout((product or self.product, quantity))
+        with mock.patch('shop.serializers.schedule_order_cancellation'), \
+                self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def available(self, product=None):
+        value = self.redis.get(AVAILABLE_KEY.format(product_id=(product or self.product).pk))
+        return None if value is None else int(value)
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def save(self, order, **changes):
+        for name, value in changes.items():
+            setattr(order, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def test_checkout_holds_stock(self):
+        order = self.place_order(2)
+        self.assertEqual(order.stock_state, Order.STOCK_HELD)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(self.available(), 3)
+        self.assertEqual(self.redis.hgetall(HOLD_KEY.format(order_id=order.pk)), {str(self.product.pk): '2'})
+
+    def test_insufficient_stock(self):
+        self.place_order(4)
+        with self.assertRaises(ValidationError):
+            self.place_order(2)
+        # All or nothing: the failed checkout left no order and no hold behind
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(len(self.redis.keys(HOLD_KEY.format(order_id='*'))), 1)
+
+    def test_missing_counter_is_rebuilt(self):
+        first = self.place_order(2)
+        self.redis.delete(AVAILABLE_KEY.format(product_id=self.product.pk))
+        second = self.place_order(1)
+        # Rebuilt from Product.stock minus the first order's hold, then the second one's taken
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(self.redis.hgetall(HOLD_KEY.format(order_id=second.pk)), {str(self.product.pk): '1'})
+        self.save(first, status='Cancelled')
+        self.assertEqual(self.available(), 4)
+
+    def test_rebuild_counts_holds_not_committed_yet(self):
+        # A checkout has its hold, but its order isn't committed (nor visible) yet
+        with self.captureOnCommitCallbacks(execute=False):
+            hold_stock(1000, {self.product.pk: 2})
+        self.redis.delete(AVAILABLE_KEY.format(product_id=self.product.pk))
+        load_available([self.product.pk])
+        self.assertEqual(self.available(), 3)
+
+        # Once committed it is read from the database, and counted only once
+        order = self.place_order(1)
+        self.assertEqual(self.redis.smembers(PENDING_KEY), {'1000'})
+        self.redis.delete(AVAILABLE_KEY.format(product_id=self.product.pk))
+        load_available([self.product.pk])
+        self.assertEqual(self.available(), 2)
+        self.save(order, status='Cancelled')
+        self.assertEqual(self.available(), 3)
+
+    def test_concurrent_holds_never_oversell(self):
+        load_available([self.product.pk])
+        held = []
+
+        def checkout(order_id):
+            try:
+                hold_stock(order_id, {self.product.pk: 1})
+                held.append(order_id)
+            except InsufficientStock:
+                pass
+
+        threads = [threading.Thread(target=checkout, args=(order_id,)) for order_id in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(held), 5)
+        self.assertEqual(self.available(), 0)
+
+    def test_fulfilling_unpaid_order_commits_its_hold(self):
+        order = self.place_order(2)
+        self.save(order, status='Processing')
+        self.assertEqual(Order.objects.get(pk=order.pk).stock_state, Order.STOCK_COMMITTED)
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(self.redis.exists(HOLD_KEY.format(order_id=order.pk)))
+        self.save(order, status='Shipped')
+        self.save(order, status='Completed')
+        self.assertEqual(self.stock(), 3)
+
+    def test_payment_commits_hold(self):
+        order = self.place_order(2)
+        self.save(order, payment_status='Paid')
+        self.assertEqual(order.stock_state, Order.STOCK_COMMITTED)
+        self.assertEqual(self.stock(), 3)
+        # Committed units are in Product.stock now, the counter still has 3 to sell
+        self.assertEqual(self.available(), 3)
+
+    def test_cancel_releases_hold(self):
+        order = self.place_order(2)
+        self.save(order, status='Cancelled')
+        self.assertEqual(order.stock_state, Order.STOCK_RELEASED)
+        self.assertEqual(self.available(), 5)
+        self.assertEqual(self.stock(), 5)
+
+    def test_rolled_back_release_keeps_hold(self):
+        order = self.place_order(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                release_order_stock([order.pk])
+                raise RuntimeError
+        self.assertEqual(Order.objects.get(pk=order.pk).stock_state, Order.STOCK_HELD)
+        self.assertEqual(self.available(), 3)
+        self.assertTrue(self.redis.exists(HOLD_KEY.format(order_id=order.pk)))
+
+    def test_bulk_transition_commits_holds(self):
+        orders = [self.place_order(1), self.place_order(2)]
+        ids = [order.pk for order in orders]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sorted(transition_orders(ids, 'Processing')), sorted(ids))
+        self.assertEqual(
+            set(Order.objects.filter(pk__in=ids).values_list('stock_state', flat=True)), {Order.STOCK_COMMITTED}
+        )
+        self.assertEqual(self.stock(), 2)
+        self.assertFalse(self.redis.exists(*[HOLD_KEY.format(order_id=pk) for pk in ids]))
+        # Cancelling afterwards gives back Product.stock, not the holds
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders(ids, 'Cancelled')
+        self.assertEqual(self.stock(), 5)
+
+    def test_commit_settled_holds(self):
+        held = self.place_order(1)
+        pending = self.place_order(1)
+        Order.objects.filter(pk=held.pk).update(status='Completed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(commit_settled_holds(), 1)
+        self.assertEqual(Order.objects.get(pk=pending.pk).stock_state, Order.STOCK_HELD)
+        self.assertEqual(self.stock(), 4)
+
+
+@override_settings(STOCK_LEDGER_ENABLED=False)
+class CatalogCacheTests(FakeRedisMixin, TestCase):
+    """
+    Product list/detail responses are cached under the catalog version,
+    which every product or stock write bumps.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        cls.product = Product.objects.create(name='Lamp', price=10, stock=5)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def catalog(self):
+        return {item['name']: item['stock'] for item in self.client.get(reverse('product-list-create')).data}
+
+    def detail(self):
+        return self.client.get(reverse('product-retrieve-update-destroy', args=[self.product.pk])).data
+
+    def version(self):
+        return int(self.redis.get(CATALOG_VERSION_KEY) or 0)
+
+    def test_responses_are_cached(self):
+        self.assertEqual(self.catalog(), {'Lamp': 5})
+        self.assertEqual(self.detail()['stock'], 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.catalog(), {'Lamp': 5})
+            self.assertEqual(self.detail()['stock'], 5)
+        stats = self.client.get(reverse('product-cache-stats')).data
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+    def test_product_writes_bump_version(self):
+        self.catalog()
+        version = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('product-retrieve-update-destroy', args=[self.product.pk]), {'stock': 7}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(self.catalog(), {'Lamp': 7})
+        self.assertEqual(self.detail()['stock'], 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Desk', price=10, stock=1)
+        self.assertEqual(self.catalog(), {'Lamp': 7, 'Desk': 1})
+
+    def test_stock_writes_bump_version(self):
+        self.catalog()
+        # Checkout takes stock with a queryset update, which sends no signals
+        with mock.patch('shop.serializers.schedule_order_cancellation'), \
+                self.captureOnCommitCallbacks(execute=True):
+            order = checkout((self.product, 2)).save()
+        self.assertEqual(self.catalog(), {'Lamp': 3})
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([order.pk], 'Cancelled')
+        self.assertEqual(self.catalog(), {'Lamp': 5})
+
+
+class ProductSearchTests(FakeRedisMixin, TestCase):
+    """
+    ?search= and autocomplete go through the full-text index, ranked by
+    relevance with name matches first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chair = Product.objects.create(name='Chair', description='Pairs well with a lamp', price=10)
+        Product.objects.create(name='Desk Lamp', description='Bright', price=10)
+        Product.objects.create(name='Lampshade', price=10)
+        Product.objects.create(name='Café table', price=10)
+        Product.objects.create(name='Lamp post', price=10, is_active=False)
+
+    def search(self, term):
+        response = APIClient().get(reverse('product-list-create'), {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def autocomplete(self, term, **query):
+        response = APIClient().get(reverse('product-autocomplete'), {'q': term, **query})
+        return [item['name'] for item in response.data]
+
+    def test_search_ranks_name_matches_first(self):
+        names = self.search('lamp')
+        # Whole words and prefixes of the last word, in names and descriptions
+        self.assertEqual(set(names[:3]), {'Desk Lamp', 'Lampshade', 'Lamp post'})
+        self.assertEqual(names[3:], ['Chair'])
+        self.assertEqual(self.search('desk lam'), ['Desk Lamp'])
+        self.assertEqual(self.search('cafe'), ['Café table'])
+        self.assertEqual(self.search('sofa'), [])
+
+    @override_settings(PRODUCT_SEARCH_LIMIT=2)
+    def test_matches_past_the_limit_are_not_dropped(self):
+        names = self.search('lamp')
+        self.assertLess(set(names[:2]), {'Desk Lamp', 'Lampshade', 'Lamp post'})
+        self.assertEqual(set(names[2:]), {'Desk Lamp', 'Lampshade', 'Lamp post', 'Chair'} - set(names[:2]))
+
+    def test_search_input_is_not_query_syntax(self):
+        for term in ['lamp OR chair', '"lamp', 'name:chair', 'lamp*', 'NEAR(lamp chair)', '-lamp']:
+            with self.subTest(term=term):
+                self.search(term)
+
+    def test_index_follows_product_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chair.name = 'Armchair'
+            self.chair.save()
+        self.assertEqual(self.search('armch'), ['Armchair'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.chair.pk).update(description='Comfortable')
+        self.assertNotIn('Armchair', self.search('lamp'))
+
+    def test_autocomplete(self):
+        # Active products whose name has a word starting with the term
+        self.assertEqual(set(self.autocomplete('la')), {'Desk Lamp', 'Lampshade'})
+        self.assertEqual(len(self.autocomplete('la', limit=1)), 1)
+        self.assertEqual(self.autocomplete('pairs'), [])
+        self.assertEqual(self.autocomplete(''), [])
+
+    def test_fallback_without_index(self):
+        with mock.patch('shop.search.search_backend', return_value=None):
+            self.assertEqual(set(self.search('lamp')), {'Desk Lamp', 'Lampshade', 'Lamp post', 'Chair'})
+            self.assertEqual(self.autocomplete('Desk'), ['Desk Lamp'])
+
+
+class ConditionalGetTests(FakeRedisMixin, TestCase):
+    """
+    Public catalog GETs carry ETag/Last-Modified and answer a revalidation
+    with 304 until the data changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = Seller.objects.create(title='Seller')
+        Product.objects.create(name='Lamp', price=10, stock=5)
+
+    def get(self, name, **headers):
+        return APIClient().get(reverse(name), **headers)
+
+    def test_products_revalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Desk', price=10, stock=5)
+        first = self.get('product-list-create')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn(f'max-age={settings.PUBLIC_CACHE_MAX_AGE}', first['Cache-Control'])
+
+        # Validated from Redis alone, the database isn't touched
+        with self.assertNumQueries(0):
+            response = self.get('product-list-create', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+        response = self.get('product-list-create', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # Another query string is another representation
+        response = APIClient().get(
+            reverse('product-list-create'), {'search': 'lamp'}, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(name='Lamp').get().delete()
+        response = self.get('product-list-create', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual([item['name'] for item in response.data], ['Desk'])
+
+    def test_flushed_redis_does_not_reuse_etags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Desk', price=10, stock=5)
+        first = self.get('product-list-create')
+
+        # The same number of writes after a flush must not land on the same version
+        self.redis.flushall()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Chair', price=10, stock=5)
+        response = self.get('product-list-create', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+    def test_sellers_revalidate(self):
+        first = self.get('seller-list-create')
+        self.assertEqual(self.get('seller-list-create', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        Seller.objects.create(title='Another seller')
+        response = self.get('seller-list-create', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(self.get('seller-list-create', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_view_without_validators(self):
+        class SellerList(ConditionalGetMixin, generics.ListAPIView):
+            queryset = Seller.objects.all()
+            serializer_class = SellerSerializer
+            permission_classes = [permissions.AllowAny]
+            pagination_class = None
+
+        response = SellerList.as_view()(RequestFactory().get('/', HTTP_IF_NONE_MATCH='*'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class BestSellerRankingTests(FakeRedisMixin, TestCase):
+    """
+    Best sellers are ranked by the units of non-cancelled orders in the
+    window; the manual flags are only a fallback.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        names = ['Lamp', 'Desk', 'Chair', 'Hidden', 'Flagged']
+        cls.lamp, cls.desk, cls.chair, cls.hidden, cls.flagged = [
+            Product.objects.create(name=name, price=10, stock=100) for name in names
+        ]
+        Product.objects.filter(pk=cls.hidden.pk).update(is_active=False)
+        Product.objects.filter(pk=cls.flagged.pk).update(is_best_seller=True)
+        Product.objects.filter(pk=cls.lamp.pk).update(is_best_offer=True)
+
+    def sell(self, lines, days_ago=0, **fields):
+        order = Order.objects.create(
+            customer_name='Customer', email='customer@example.com', phone_number='1', address='Address', **fields
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        OrderDetail.objects.bulk_create([
+            OrderDetail(order=order, product=product, quantity=quantity, price=10) for product, quantity in lines
+        ])
+
+    def best(self, name='best-selling-product-list', **query):
+        response = APIClient().get(reverse(name), query)
+        self.assertEqual(response.status_code, 200)
+        return [item['product__name'] for item in response.data]
+
+    def test_ranked_by_units_sold(self):
+        self.assertEqual(self.best(), ['Flagged'])
+
+        self.sell([(self.lamp, 5), (self.desk, 2)])
+        self.sell([(self.chair, 20)], days_ago=10)
+        self.sell([(self.desk, 100)], status='Cancelled')
+        self.sell([(self.hidden, 50)])
+        refresh_rankings()
+        self.assertEqual(self.best(), ['Chair', 'Lamp', 'Desk'])
+        self.assertEqual(self.best(window='7d'), ['Lamp', 'Desk'])
+        # Best offers rank only the products on offer
+        self.assertEqual(self.best('best-offer-list'), ['Lamp'])
+
+        # The hourly refresh picks up today's new orders
+        self.sell([(self.desk, 10)])
+        refresh_rankings()
+        self.assertEqual(self.best(window='7d'), ['Desk', 'Lamp'])
+
+    def test_refresh_changes_etag(self):
+        self.sell([(self.lamp, 1)])
+        refresh_rankings()
+        etag = APIClient().get(reverse('best-selling-product-list'))['ETag']
+        response = APIClient().get(reverse('best-selling-product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.sell([(self.desk, 5)])
+        refresh_rankings()
+        response = APIClient().get(reverse('best-selling-product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product__name'] for item in response.data], ['Desk', 'Lamp'])
+
+    def test_flushed_redis_does_not_reuse_etags(self):
+        self.sell([(self.lamp, 1)])
+        refresh_rankings()
+        etag = APIClient().get(reverse('best-selling-product-list'))['ETag']
+
+        self.redis.flushall()
+        self.sell([(self.desk, 5)])
+        refresh_rankings()
+        response = APIClient().get(reverse('best-selling-product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product__name'] for item in response.data], ['Desk', 'Lamp'])
+
+
+def png(width, height, name='photo.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantTests(FakeRedisMixin, TestCase):
+    """
+    Uploaded images get downscaled variants after commit, and serializers
+    point at them once they match the current upload.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, image):
+        # Run the queued task right away instead of on a worker
+        with mock.patch.object(generate_image_variants, 'delay', side_effect=generate_image_variants), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('product-list-create'), {'name': 'Lamp', 'price': '10.00', 'stock': 1, 'image': image},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        return Product.objects.get(pk=response.data['id'])
+
+    def sizes(self, product):
+        sizes = {}
+        for name in IMAGE_VARIANTS:
+            with product.image.storage.open(product.image_variants[name]) as f:
+                sizes[name] = Image.open(f).size
+        return sizes
+
+    def test_variants_are_generated(self):
+        product = self.upload(png(2000, 1000))
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertEqual(product.image_variants['format'], output_format())
+        self.assertEqual(self.sizes(product), {'thumbnail': (160, 80), 'card': (480, 240), 'full': (1600, 800)})
+
+        urls = self.client.get(reverse('product-retrieve-update-destroy', args=[product.pk])).data['image_variants']
+        extension = FORMAT_EXTENSIONS[output_format()]
+        self.assertEqual(urls['card'], f'http://testserver{settings.MEDIA_URL}products/variants/photo_card.{extension}')
+
+    def test_small_images_are_not_upscaled(self):
+        product = self.upload(png(100, 50))
+        self.assertEqual(set(self.sizes(product).values()), {(100, 50)})
+
+    def test_urls_fall_back_to_original(self):
+        with mock.patch.object(generate_image_variants, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('product-list-create'), {'name': 'Lamp', 'price': '10.00', 'image': png(300, 300)},
+                format='multipart',
+            )
+        delay.assert_called_once_with('shop.product', response.data['id'], 'image')
+        self.assertEqual(set(response.data['image_variants'].values()), {response.data['image']})
+
+    def test_replaced_image_gets_new_variants(self):
+        product = self.upload(png(2000, 1000))
+        product.image = png(600, 1200, 'other.png')
+        with mock.patch.object(generate_image_variants, 'delay', side_effect=generate_image_variants), \
+                self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertEqual(self.sizes(product)['card'], (240, 480))
+
+
+class KeysetPaginationTests(FakeRedisMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        # Oldest first, so newest-first order would reverse the relevance order
+        cls.lamps = [
+            Product.objects.create(name='Bright lamp', price=10, stock=1),
+            Product.objects.create(name='Desk', description='A desk for your lamp', price=10, stock=0),
+            Product.objects.create(name='Chair', description='Sits under a lamp, near a lamp', price=10, stock=1),
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def pages(self, url, **query):
+        query.setdefault('cursor', '')
+        names = []
+        while url:
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            data = response.data.get('data', response.data)
+            names.append([item['name'] for item in data['results']])
+            url, query = data['next'], None
+        return names
+
+    def test_search_without_hits_counts_zero(self):
+        response = self.client.get(
+            reverse('admin-product-list'), {'cursor': '', 'include_total': 1, 'search': 'sofa'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approximate_total'], 0)
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_pages_keep_relevance_order(self):
+        pages = self.pages(reverse('admin-product-list'), search='lamp', page_size=2)
+        self.assertEqual(pages, [['Bright lamp', 'Chair'], ['Desk']])
+
+    def test_view_ordering_is_kept(self):
+        pages = self.pages(reverse('low-stock-products'), page_size=2)
+        self.assertEqual(pages, [['Bright lamp', 'Chair'], ['Desk']])
+
+    def test_default_order_is_newest_first(self):
+        pages = self.pages(reverse('admin-product-list'), page_size=2)
+        self.assertEqual(pages, [['Chair', 'Desk'], ['Bright lamp']])
+        response = self.client.get(reverse('admin-product-list'), {'cursor': 'bm9wZQ=='})
+        self.assertEqual(response.status_code, 404)
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([Product(name=f'Product {i}', price=10, stock=5) for i in range(3)])
+
+    def setUp(self):
+        self.redis = fake_redis()
+
+    def get_products(self):
+        with self.settings(REDIS_CLIENT=self.redis):
+            with self.assertLogs('project.middleware') as logs:
+                response = self.client.get(reverse('product-list-create'))
+        return response, logs.records[0]
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1, SERVER_TIMING_HEADER=True)
+    def test_sampled_request(self):
+        response, record = self.get_products()
+        self.assertEqual(response.status_code, 200)
+        metrics = dict(entry.split(';', 1) for entry in response.headers['Server-Timing'].split(', '))
+        self.assertEqual(set(metrics), {'db', 'redis', 'serialize', 'total'})
+        self.assertIn('desc="1 queries"', metrics['db'])
+        # The list serializer's children are part of its one call
+        self.assertIn('desc="1 calls"', metrics['serialize'])
+        self.assertEqual(record.db_queries, 1)
+        self.assertGreater(record.redis_commands, 0)
+        self.assertEqual(record.http_status, 200)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1, SERVER_TIMING_HEADER=False)
+    def test_log_only(self):
+        response, record = self.get_products()
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(record.http_path, reverse('product-list-create'))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        with self.settings(REDIS_CLIENT=self.redis):
+            response = self.client.get(reverse('product-list-create'))
+        self.assertNotIn('Server-Timing', response.headers)
+
+
+def seed_shop(size):
+    """
+    ``size`` products, sellers and customers' orders (3 lines each), plus
+    the users and ids the endpoint budgets refer to.
+    """
+    admin = User.objects.create_superuser(email='admin@example.com', password='password')
+    customer = User.objects.create_user(
+        email='customer@example.com', full_name='Customer', phone_number='1', password='password', is_active=True
+    )
+    products = Product.objects.bulk_create([
+        Product(name=f'Product {i}', price=10, stock=0 if i % 10 == 0 else 1000, is_best_seller=i % 3 == 0,
+                is_best_offer=i % 4 == 0)
+        for i in range(size)
+    ])
+    sellers = Seller.objects.bulk_create([Seller(title=f'Seller {i}') for i in range(size)])
+    orders = Order.objects.bulk_create([
+        Order(customer_name='Customer', email='customer@example.com', phone_number='1', address='Address',
+              total=34, payment_status='Paid' if i % 2 else 'Pending')
+        for i in range(size)
+    ])
+    lines = OrderDetail.objects.bulk_create([
+        OrderDetail(order=order, product=products[(i + k) % size], quantity=1, price=10)
+        for i, order in enumerate(orders) for k in range(3)
+    ])
+    order = orders[0]
+    payload, signature = perf_testing.signed_webhook({
+        'id': 'evt_test_1',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'id': 'cs_test_1', 'metadata': {'order_id': str(order.pk)}}},
+    })
+    return SimpleNamespace(
+        admin=admin, customer=customer, product=products[1], seller=sellers[0], order=order, line=lines[0],
+        order_ids=[o.pk for o in orders], webhook_payload=payload, webhook_signature=signature,
+    )
+
+
+def order_payload(fixtures):
+    return {
+        'customer_name': 'Customer', 'email': 'customer@example.com', 'phone_number': '1',
+        'address': 'Address', 'payment_method': 'Card',
+        'order_details': [{'product': fixtures.product.pk, 'quantity': 1}],
+    }
+
+
+class ShopEndpointBudgetTests(perf_testing.EndpointBudgetTestCase):
+    urlconf = 'shop.urls'
+    prefix = '/api/shop/'
+    endpoints = [
+        Endpoint('sellers/', user=None, max_queries=2),
+        Endpoint('sellers/', 'post', data={'title': 'New seller'}, status=201, max_queries=1),
+        Endpoint('sellers/<int:pk>/', kwargs=lambda f: {'pk': f.seller.pk}, user=None, max_queries=1),
+        Endpoint('sellers/<int:pk>/', 'patch', kwargs=lambda f: {'pk': f.seller.pk},
+                 data={'title': 'Renamed'}, max_queries=2),
+        Endpoint('sellers/<int:pk>/', 'delete', kwargs=lambda f: {'pk': f.seller.pk}, status=204, max_queries=2),
+        Endpoint('products/', user=None, max_queries=1),
+        Endpoint('products/', query={'search': 'Product'}, user=None, max_queries=2),
+        Endpoint('products/', 'post', data={'name': 'New product', 'price': '5.00', 'stock': 5},
+                 format='multipart', status=201, max_queries=1),
+        Endpoint('products/<int:pk>/', kwargs=lambda f: {'pk': f.product.pk}, user=None, max_queries=1),
+        Endpoint('products/<int:pk>/', 'patch', kwargs=lambda f: {'pk': f.product.pk},
+                 data={'price': '12.00'}, max_queries=2),
+        Endpoint('products/<int:pk>/', 'delete', kwargs=lambda f: {'pk': f.product.pk}, status=204, max_queries=8),
+        Endpoint('products/autocomplete/', query={'q': 'Prod'}, user=None, max_queries=1),
+        Endpoint('products/cache-stats/', max_queries=0),
+        Endpoint('orders/', query={'page_size': 100}, max_queries=2),
+        Endpoint('orders/', 'post', data=order_payload, user=None, status=201, max_queries=12),
+        Endpoint('payment/<int:orderId>/', 'post', kwargs=lambda f: {'orderId': f.order.pk}, user=None, max_queries=4),
+        Endpoint('webhook/', 'post', data=lambda f: f.webhook_payload, content_type='application/json',
+                 headers=lambda f: {'HTTP_STRIPE_SIGNATURE': f.webhook_signature}, user=None,
+                 max_queries=9),
+        Endpoint('best-seles/', user=None, max_queries=2),
+        Endpoint('best-sellers/', user=None, max_queries=2),
+        Endpoint('dashboard/', max_queries=14),
+        Endpoint('dashboard/', query={'granularity': 'day', 'from': '2026-01-01'}, max_queries=14),
+        Endpoint('low-stock-products/', max_queries=2),
+        Endpoint('total-earnings/', query={'granularity': 'week'}, max_queries=11),
+        Endpoint('admin/orders/', query={'cursor': '', 'page_size': 100, 'expand': 'order_details'}, max_queries=2),
+        Endpoint('admin/orderdetails/<int:pk>/', kwargs=lambda f: {'pk': f.order.pk}, max_queries=2),
+        Endpoint('admin/orders/update/<int:pk>/', 'patch', kwargs=lambda f: {'pk': f.order.pk},
+                 data={'status': 'Processing'}, max_queries=4),
+        Endpoint('admin/orders/bulk-status/', 'post',
+                 data=lambda f: {'ids': f.order_ids, 'status': 'Processing'}, max_queries=9),
+        Endpoint('admin/orderdetails/update/<int:pk>/', 'patch', kwargs=lambda f: {'pk': f.line.pk},
+                 data={'quantity': 2}, max_queries=10),
+        Endpoint('admin/products/list/', query={'cursor': '', 'page_size': 100}, max_queries=1),
+    ]
+
+    def seed(self, size):
+        return seed_shop(size)
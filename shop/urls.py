@@ -9,6 +9,8 @@ urlpatterns = [
     # product urls
     path('products/', ProductListCreateView.as_view(), name='product-list-create'),
     path('products/<int:pk>/', ProductRetrieveUpdateDestroyView.as_view(), name='product-retrieve-update-destroy'),
+    path('products/autocomplete/', ProductAutocompleteView.as_view(), name='product-autocomplete'),
+    path('products/cache-stats/', CatalogCacheStatsView.as_view(), name='product-cache-stats'),
     # order urls
     path('orders/', OrderCreateView.as_view(), name='order-create'),
     # payment and webhook urls 
@@ -28,6 +30,7 @@ urlpatterns = [
     path('admin/orders/', AdminOrderListView.as_view(), name='admin-order-list'),
     path('admin/orderdetails/<int:pk>/', AdminOrderDetailsView.as_view(), name='admin-order-detail'),
     path('admin/orders/update/<int:pk>/', AdminOrderStatusUpdateView.as_view(), name='admin-order-update'),
+    path('admin/orders/bulk-status/', AdminOrderBulkStatusView.as_view(), name='admin-order-bulk-status'),
     path('admin/orderdetails/update/<int:pk>/', AdminOrderDetailsUpdateView.as_view(), name='admin-orderdetail-update'),
     
     # Admin Product Management
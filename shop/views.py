@@ -1,28 +1,36 @@
 from django.shortcuts import render
 # generic views
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework import generics, permissions, filters
+from rest_framework import generics, permissions
 from rest_framework.response import Response
-from django.test import RequestFactory
 from django.http import JsonResponse
 from django.db.models import Sum
 from django.urls import reverse
 from .serializers import *
 from .models import *
 import random
-from .payment import orderPayment
+from .payment import order_payment_payload
+from .cache import CatalogCacheMixin, catalog_cache_stats, dashboard_cache
+from .pagination import KeysetPagination, OptionalKeysetPagination
+from .search import ProductSearchFilter, autocomplete_products
+from .conditional import ConditionalGetMixin, catalog_validators, queryset_validators
+from .ranking import DEFAULT_WINDOW, RANKING_WINDOWS, ranked_products, ranking_validators
+from .fieldsets import SparseFieldsetViewMixin
+from .idempotency import idempotent
+from .orders import ORDER_DETAILS_PREFETCH, InvalidTransition, transition_orders
+from .rollups import refresh_dirty_rollups
+from django.utils.decorators import method_decorator
 from rest_framework import status
-import json
 
 
 # Product Views
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(ConditionalGetMixin, CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    pagination_class = None
+    pagination_class = OptionalKeysetPagination
     parser_classes = (MultiPartParser, FormParser)
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    catalog_cache_name = 'products'
+    filter_backends = [ProductSearchFilter]
     
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -31,13 +39,16 @@ class ProductListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         serializer.save(is_active=True)
+
+    def get_validators(self, request, *args, **kwargs):
+        return catalog_validators()
         
         
-class ProductListAdminView(generics.ListAPIView):
+class ProductListAdminView(SparseFieldsetViewMixin, generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    pagination_class = KeysetPagination
+    filter_backends = [ProductSearchFilter]
     
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -48,10 +59,11 @@ class ProductListAdminView(generics.ListAPIView):
         serializer.save(is_active=True)
     
 
-class ProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class ProductRetrieveUpdateDestroyView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    catalog_cache_name = 'product'
     
     # patch method for return messages: product updated successfully
     def patch(self, request, *args, **kwargs):
@@ -67,31 +79,47 @@ class ProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
     
+class ProductAutocompleteView(generics.GenericAPIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 25)
+        except ValueError:
+            limit = 10
+        return Response(autocomplete_products(request.query_params.get('q', ''), limit=limit))
+
+
+class CatalogCacheStatsView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(catalog_cache_stats())
+
+
 # Order Views
-class OrderCreateView(generics.ListCreateAPIView):
+class OrderCreateView(SparseFieldsetViewMixin, generics.ListCreateAPIView):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]
-    pagination_class = None
+    pagination_class = OptionalKeysetPagination
+    sparse_prefetch = {'order_details': ORDER_DETAILS_PREFETCH}
 
     def get_permissions(self):
         if self.request.method == 'POST':
             return [permissions.AllowAny()]
         return [permissions.IsAdminUser()]
     
+    @method_decorator(idempotent('orders'))
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
 
-        # ---- Call your existing function ----
-        # it needs a DRF request object, so use RequestFactory
-        factory = RequestFactory()
-        fake_request = factory.post("/", {})  # dummy request
-        response = orderPayment(fake_request, order.id)
-
-        # convert JsonResponse → Python dict
-        data = json.loads(response.content)
+        try:
+            data, _ = order_payment_payload(order)
+        except Exception as e:
+            data = {"success": False, "error": str(e)}
 
         return Response({
             "order_id": order.id,
@@ -99,7 +127,7 @@ class OrderCreateView(generics.ListCreateAPIView):
         }, status=status.HTTP_201_CREATED)
         
         
-class SellerView(generics.ListCreateAPIView):
+class SellerView(ConditionalGetMixin, SparseFieldsetViewMixin, generics.ListCreateAPIView):
     queryset = Seller.objects.all()
     serializer_class = SellerSerializer
     permission_classes = [permissions.AllowAny]
@@ -109,8 +137,11 @@ class SellerView(generics.ListCreateAPIView):
         if self.request.method == 'POST':
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
+
+    def get_validators(self, request, *args, **kwargs):
+        return queryset_validators(Seller.objects.all())
     
-class SellerDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SellerDetailView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Seller.objects.all()
     serializer_class = SellerSerializer
     permission_classes = [permissions.AllowAny]
@@ -125,68 +156,115 @@ class SellerDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Response({'message': 'Seller deleted successfully'}, status=response.status_code)
     
 
-class BestOfferView(generics.ListAPIView):
+class RankedProductsMixin:
+    # Rankings come from real order volume (see shop.ranking); the manual
+    # flag is only the fallback while nothing has been ranked yet.
+    flag_field = None
+
+    def get_window(self):
+        window = self.request.query_params.get('window', DEFAULT_WINDOW)
+        return window if window in RANKING_WINDOWS else DEFAULT_WINDOW
+
+    def get_queryset(self):
+        flagged = Product.objects.filter(**{self.flag_field: True})
+        ranked = ranked_products(self.get_ranking_queryset(), window=self.get_window())
+        return ranked or flagged.order_by('-id')[:5]
+
+    def get_ranking_queryset(self):
+        return Product.objects.all()
+
+    def get_validators(self, request, *args, **kwargs):
+        seed, last_modified = catalog_validators()
+        version, ranked_at = ranking_validators()
+        if ranked_at and (last_modified is None or ranked_at > last_modified):
+            last_modified = ranked_at
+        return f"{seed}|ranking:{version}", last_modified
+
+
+class BestOfferView(RankedProductsMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProductBestSeleSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
+    flag_field = 'is_best_offer'
 
-    def get_queryset(self):
-        return Product.objects.filter(is_best_offer=True).order_by('-id')[:5]
+    def get_ranking_queryset(self):
+        # best selling among the products that are on offer
+        return Product.objects.filter(is_best_offer=True)
 
 
-class BestSellerView(generics.ListAPIView):
+class BestSellerView(RankedProductsMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProductBestSeleSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
-
-    def get_queryset(self):
-        return Product.objects.filter(is_best_seller=True).order_by('-id')[:5]
+    flag_field = 'is_best_seller'
     
     
 
-class DashboardView(generics.GenericAPIView):
+class AnalyticsWindowMixin:
+    # Validated from/to/granularity query parameters, for the serializer
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        window = AnalyticsWindowSerializer(data=self.request.query_params)
+        window.is_valid(raise_exception=True)
+        context['window'] = window.validated_data
+        return context
+
+
+def current_admin_name(data, request):
+    # The cached dashboard is shared by every admin
+    data['current_user'] = request.user.full_name or "Admin User"
+
+
+class DashboardView(AnalyticsWindowMixin, generics.GenericAPIView):
     serializer_class = DashboardSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    @method_decorator(dashboard_cache('dashboard', personalize=current_admin_name))
     def get(self, request, *args, **kwargs):
+        refresh_dirty_rollups()
         serializer = self.get_serializer(instance={})
         return Response(serializer.data)
 
 
-class LowStockProductView(generics.ListAPIView):
+class LowStockProductView(SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = LowStockProductSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    queryset = Product.objects.filter(stock__lte=1).order_by('name')
     
-    def get_queryset(self):
-        return Product.objects.filter(stock__lte=1).order_by('name')
-    
+    @method_decorator(dashboard_cache('low-stock'))
     def list(self, request, *args, **kwargs):
         # Use ListAPIView's built-in pagination/serialization then wrap the response
         response = super().list(request, *args, **kwargs)
         return Response({'message': 'Low stock products List successfully', 'data': response.data})
     
-class TotalEarningsView(generics.GenericAPIView):
+class TotalEarningsView(AnalyticsWindowMixin, generics.GenericAPIView):
     serializer_class = TotalEarningsSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    @method_decorator(dashboard_cache('earnings'))
     def get(self, request, *args, **kwargs):
+        refresh_dirty_rollups()
         serializer = self.get_serializer(instance={})
         return Response(serializer.data)
     
     
-class AdminOrderListView(generics.ListAPIView):
+class AdminOrderListView(SparseFieldsetViewMixin, generics.ListAPIView):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = AdminOrderSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    sparse_prefetch = {'order_details': ORDER_DETAILS_PREFETCH}
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         return Response({'message': 'Order List successfully', 'data': response.data})
     
-class AdminOrderDetailsView(generics.RetrieveAPIView):
+class AdminOrderDetailsView(SparseFieldsetViewMixin, generics.RetrieveAPIView):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAdminUser]
+    sparse_prefetch = {'order_details': ORDER_DETAILS_PREFETCH}
     
     
 class AdminOrderStatusUpdateView(generics.UpdateAPIView):
@@ -200,8 +278,30 @@ class AdminOrderStatusUpdateView(generics.UpdateAPIView):
         serializer.save()
         return Response({'message': 'Order status updated successfully', 'data': serializer.data})
 
-class AdminOrderDetailsUpdateView(generics.RetrieveUpdateAPIView):
-    queryset = OrderDetail.objects.all()
+class AdminOrderBulkStatusView(generics.GenericAPIView):
+    serializer_class = BulkOrderStatusSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        new_status = serializer.validated_data['status']
+        try:
+            updated = transition_orders(ids, new_status)
+        except InvalidTransition as e:
+            return Response({
+                'message': f'Some orders cannot be changed to {new_status}',
+                'rejected': {str(pk): old for pk, old in sorted(e.rejected.items())},
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': 'Order status updated successfully',
+            'updated': sorted(updated),
+            'not_found': sorted(ids - set(Order.objects.filter(pk__in=ids).values_list('pk', flat=True))),
+        })
+
+class AdminOrderDetailsUpdateView(SparseFieldsetViewMixin, generics.RetrieveUpdateAPIView):
+    queryset = OrderDetail.objects.select_related('product')
     serializer_class = OrderDetailSerializer
     permission_classes = [permissions.IsAdminUser]
     
@@ -0,0 +1,114 @@
+import logging
+
+import redis
+import stripe
+from celery import shared_task
+from django.db import transaction
+from kombu.exceptions import OperationalError
+
+from .cache import get_redis
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+# Stripe retries an undelivered event for up to three days
+STRIPE_EVENT_KEY = 'stripe:event:{event_id}'
+STRIPE_EVENT_TTL = 3 * 86400
+
+# Payment statuses only move forward, so events can be applied in any
+# order and more than once
+PAYMENT_STATUS_RANK = {'Pending': 0, 'Failed': 1, 'Paid': 2}
+
+
+def claim_event(event_id):
+    """
+    True the first time an event id is seen. Without Redis every delivery
+    is processed, which is safe because processing is idempotent.
+    """
+    try:
+        return bool(get_redis().set(STRIPE_EVENT_KEY.format(event_id=event_id), 1, nx=True, ex=STRIPE_EVENT_TTL))
+    except redis.RedisError as e:
+        logger.warning(f"Could not deduplicate Stripe event {event_id}: {e}")
+        return True
+
+
+def forget_event(event_id):
+    try:
+        get_redis().delete(STRIPE_EVENT_KEY.format(event_id=event_id))
+    except redis.RedisError:
+        pass
+
+
+def enqueue_event(event):
+    """
+    Hand a verified event to the worker, or apply it right away when the
+    broker is unreachable.
+    """
+    try:
+        process_stripe_event.delay(event)
+    except (OperationalError, redis.RedisError) as e:
+        logger.warning(f"Could not queue Stripe event {event['id']}, applying it inline: {e}")
+        apply_event(event)
+
+
+def event_order_id(event):
+    obj = event['data']['object']
+    order_id = (obj.get('metadata') or {}).get('order_id')
+    if order_id or event['type'] != 'payment_intent.succeeded':
+        return order_id
+
+    # Checkout sessions put the order id on the session, not on its intent
+    sessions = stripe.checkout.Session.list(payment_intent=obj['id'], limit=1)
+    if sessions.data:
+        return sessions.data[0]['metadata'].get('order_id')
+    return None
+
+
+def set_payment_status(order_id, payment_status):
+    # The row lock serializes concurrent events for the same order
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id).first()
+        if order is None:
+            logger.error(f"Order not found for order_id: {order_id}")
+            return
+        if PAYMENT_STATUS_RANK[payment_status] <= PAYMENT_STATUS_RANK[order.payment_status]:
+            return
+        if payment_status == 'Paid' and order.status == 'Cancelled':
+            logger.warning(f"Order {order_id} was paid after it had been cancelled")
+        order.payment_status = payment_status
+        order.save()
+
+
+def apply_event(event):
+    event_type = event['type']
+    if event_type == 'checkout.session.completed':
+        payment_status = 'Paid'
+    elif event_type == 'payment_intent.succeeded':
+        payment_status = 'Paid'
+    elif event_type == 'payment_intent.payment_failed':
+        payment_status = 'Failed'
+    else:
+        logger.info(f"Unhandled event type: {event_type}")
+        return
+
+    order_id = event_order_id(event)
+    if not order_id:
+        logger.error(f"No order_id found in {event_type} event {event['id']}")
+        return
+    set_payment_status(order_id, payment_status)
+
+
+# The event is only acked once applied, so a worker that dies mid-task
+# hands it to another one instead of dropping it
+@shared_task(bind=True, ignore_result=True, max_retries=5, acks_late=True, reject_on_worker_lost=True)
+def process_stripe_event(self, event):
+    try:
+        apply_event(event)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        # Stripe already got its 200 and won't redeliver; forgetting the id
+        # lets a resend from the dashboard be applied
+        forget_event(event['id'])
+        logger.error(f"Giving up on Stripe event {event['id']}: {e}")
+        raise